@@ -0,0 +1,282 @@
+########
+# Copyright (c) 2014-2022 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""asyncio counterparts of the dorkl command layer.
+
+Commands run as asyncio subprocesses with the docker CLI. When a command
+goes through a layer that blocks, like the Docker Engine API transport or an
+exec session, it runs in a worker thread of the event loop instead. Files
+that the container already has are not copied again, like with
+copy_file_to_docker.
+
+Usage example, upload two plugins concurrently:
+
+    from ecosystem_tests.dorkl import async_commands
+    async_commands.run_concurrently(
+        async_commands.cloudify_exec('cfy plugins upload a.wgn -y a.yaml',
+                                     get_json=False),
+        async_commands.cloudify_exec('cfy plugins upload b.wgn -y b.yaml',
+                                     get_json=False))
+"""
+
+import os
+import sys
+import json
+import asyncio
+from shlex import split
+from functools import partial
+from tempfile import SpooledTemporaryFile
+
+from ecosystem_tests.dorkl import commands
+from ecosystem_tests.dorkl.constansts import logger, TIMEOUT, RED, RESET
+from ecosystem_tests.dorkl.exceptions import (EcosystemTimeout,
+                                              EcosystemCommandError)
+from ecosystem_tests.dorkl.parallel import with_test_id
+from ecosystem_tests.dorkl.commands import (DEFAULT_COLOR,
+                                            OUTPUT_SPOOL_SIZE,
+                                            log_error_line,
+                                            log_output_line,
+                                            skip_pushed_files,
+                                            get_manager_container_name)
+from ecosystem_tests.dorkl.exec_session import exec_session_enabled
+from ecosystem_tests.dorkl.docker_api import API_TRANSPORT, docker_transport
+
+
+async def handle_process(command,
+                         timeout=TIMEOUT,
+                         log=True,
+                         detach=False,
+                         stdout_color=DEFAULT_COLOR):
+    """
+    Execute a command and stream its output to the logger.
+    :param command: The command.
+    :param timeout: How long to permit the process to run.
+    :param log: Whether to log stdout or not.
+    :param detach: Return the process instead of waiting for it.
+    :param stdout_color: Defines the default stdout output color.
+    :return: The command output, or the process if detach is True.
+    """
+
+    log_stdout = partial(log_output_line, stdout_color=stdout_color)
+    log_stderr = log_error_line
+
+    if log:
+        logger.info('Executing command {0}...'.format(command))
+    p = await asyncio.create_subprocess_exec(
+        *split(command),
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE)
+
+    if detach:
+        # Keep draining the pipes so that the process never blocks on them.
+        asyncio.ensure_future(
+            stream_output(p.stdout, log_line=log_stdout if log else None))
+        asyncio.ensure_future(
+            stream_output(p.stderr, log_line=log_stderr if log else None))
+        return p
+
+    stdout_buffer = SpooledTemporaryFile(max_size=OUTPUT_SPOOL_SIZE)
+    stderr_buffer = SpooledTemporaryFile(max_size=OUTPUT_SPOOL_SIZE)
+    with stdout_buffer, stderr_buffer:
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(
+                    stream_output(p.stdout,
+                                  stdout_buffer,
+                                  log_stdout if log else None),
+                    stream_output(p.stderr,
+                                  stderr_buffer,
+                                  log_stderr if log else None),
+                    p.wait()),
+                timeout)
+        except asyncio.TimeoutError:
+            # Don't leave the process running after the loop is closed.
+            p.kill()
+            await p.wait()
+            raise EcosystemTimeout('The timeout was reached.')
+
+        if log:
+            logger.info('Command finished {0}...'.format(command))
+
+        if p.returncode:
+            raise EcosystemCommandError(
+                'Command failed.',
+                p.returncode,
+                commands.read_output(stdout_buffer, stderr_buffer))
+
+        if log:
+            logger.info('Command succeeded {0}...'.format(command))
+
+        stdout_buffer.seek(0)
+        return stdout_buffer.read().decode('utf-8', 'replace')
+
+
+async def stream_output(stream, output_buffer=None, log_line=None):
+    """
+    Read a process stream line by line.
+    :param stream: The process stdout or stderr stream reader.
+    :param output_buffer: A file object to collect the output in.
+    :param log_line: A function to call with every decoded line.
+    :return:
+    """
+
+    while True:
+        line = await stream.readline()
+        if not line:
+            break
+        if output_buffer is not None:
+            output_buffer.write(line)
+        if log_line:
+            log_line(line.decode('utf-8', 'replace'))
+
+
+async def docker_exec(cmd,
+                      timeout=TIMEOUT,
+                      log=True,
+                      detach=False,
+                      stdout_color=DEFAULT_COLOR):
+    """
+    Execute command on the docker container.
+    :param cmd: The command.
+    :param timeout: How long to permit the process to run.
+    :param log: Whether to log stdout or not.
+    :param detach: Return the process instead of waiting for it.
+    :param stdout_color: Defines the default stdout output color.
+    :return: The command output.
+    """
+
+    if not detach and (docker_transport() == API_TRANSPORT or
+                       exec_session_enabled()):
+        return await run_blocking(
+            commands.docker_exec, cmd, timeout, log, False, stdout_color)
+    return await handle_process(
+        'docker exec {container_name} {cmd}'.format(
+            container_name=get_manager_container_name(), cmd=cmd),
+        timeout,
+        log,
+        detach,
+        stdout_color)
+
+
+async def cloudify_exec(cmd,
+                        get_json=True,
+                        timeout=TIMEOUT,
+                        log=True,
+                        detach=False,
+                        stdout_color=DEFAULT_COLOR):
+    """
+    Execute a Cloudify CLI command inside the container.
+    :param cmd: The command.
+    :param get_json: Whether to return a JSON response or not.
+    :param timeout: How long to allow the command to run.
+    :param log: Whether to log stdout or not.
+    :param detach: To detach after executing
+    :param stdout_color: Defines the default stdout output color.
+    :return:
+    """
+
+    if get_json:
+        json_output = await docker_exec(
+            '{0} --json'.format(cmd), timeout, log, detach, stdout_color)
+        try:
+            return json.loads(json_output)
+        except (TypeError, ValueError):
+            if log:
+                logger.error(RED +
+                             'JSON failed here: {0}'.format(json_output) +
+                             RESET)
+            return
+    return await docker_exec(cmd, timeout, log, detach, stdout_color)
+
+
+async def copy_file_to_docker(local_file_path):
+    """
+    Copy a file from the container host to the container.
+    :param local_file_path:  The local file path.
+    :return: The remote path inside the container.
+    """
+
+    if docker_transport() == API_TRANSPORT:
+        return await run_blocking(commands.copy_file_to_docker,
+                                  local_file_path)
+    docker_path = os.path.join('/tmp/', os.path.basename(local_file_path))
+    pushed_files = skip_pushed_files({local_file_path: docker_path})
+    # Checking the manifest may run a command in the container.
+    pending = await run_blocking(pushed_files.__enter__)
+    try:
+        if pending:
+            await handle_process(
+                'docker cp {0} {1}:{2}'.format(local_file_path,
+                                               get_manager_container_name(),
+                                               docker_path))
+    except BaseException:
+        pushed_files.__exit__(*sys.exc_info())
+        raise
+    pushed_files.__exit__(None, None, None)
+    return docker_path
+
+
+async def run_blocking(fn, *args):
+    """
+    Call a blocking function in a worker thread of the event loop, with the
+    test ID of this thread.
+    :return: What the function returned.
+    """
+
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(None, with_test_id(partial(fn, *args)))
+
+
+async def gather_limited(coroutines, limit=None):
+    """
+    Await coroutines concurrently, at most `limit` at a time.
+    :param coroutines: A list of coroutines.
+    :param limit: Maximum number of coroutines to run at once.
+    :return: The results, in the same order as the coroutines.
+    """
+
+    if limit:
+        semaphore = asyncio.Semaphore(limit)
+
+        async def limited(coroutine):
+            async with semaphore:
+                return await coroutine
+
+        coroutines = [limited(c) for c in coroutines]
+    # Let every coroutine finish before raising, so that none of them is
+    # cancelled in the middle of a command.
+    results = await asyncio.gather(*coroutines, return_exceptions=True)
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+    return results
+
+
+def run_concurrently(*coroutines, limit=None):
+    """
+    Run coroutines concurrently from blocking code.
+    :param coroutines: The coroutines to run.
+    :param limit: Maximum number of coroutines to run at once.
+    :return: The results, in the same order as the coroutines.
+    """
+
+    loop = asyncio.new_event_loop()
+    # Setting the loop also attaches the child watcher for subprocesses.
+    asyncio.set_event_loop(loop)
+    try:
+        return loop.run_until_complete(gather_limited(coroutines, limit))
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
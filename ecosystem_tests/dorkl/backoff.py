@@ -0,0 +1,46 @@
+########
+# Copyright (c) 2014-2022 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import random
+from datetime import datetime
+
+
+def backoff_delays(initial=1,
+                   factor=1.5,
+                   maximum=15,
+                   deadline=None,
+                   jitter=0):
+    """
+    Delays between polls: short at first, growing for long waits.
+    :param initial: The first delay in seconds.
+    :param factor: How much every delay grows.
+    :param maximum: The longest delay in seconds.
+    :param deadline: A datetime that no delay should pass.
+    :param jitter: Spread every delay randomly by this fraction, so that
+        pollers that started together don't stay in step.
+    :return: A generator of delays in seconds, that stops at the deadline.
+    """
+
+    delay = initial
+    while True:
+        jittered = delay * (1 + random.uniform(-jitter, jitter))
+        if deadline:
+            remaining = (deadline - datetime.now()).total_seconds()
+            if remaining <= 0:
+                return
+            yield min(jittered, remaining)
+        else:
+            yield jittered
+        delay = min(delay * factor, maximum)
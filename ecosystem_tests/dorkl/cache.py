@@ -0,0 +1,256 @@
+########
+# Copyright (c) 2014-2022 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import json
+import copy
+import hashlib
+import threading
+from time import time
+
+from ecosystem_tests.dorkl.exceptions import EcosystemTestException
+from ecosystem_tests.dorkl.constansts import (logger,
+                                              CACHE_DIR_ENVAR_NAME,
+                                              PUSH_CACHE_ENVAR_NAME,
+                                              LIST_CACHE_TTL_ENVAR_NAME)
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def get_cache_dir(*parts):
+    """
+    Get a directory under the local ecosystem tests cache.
+    The cache lives in ~/.cache/ecosystem-tests unless
+    ECOSYSTEM_TEST_CACHE_DIR is set.
+    :param parts: Sub directories.
+    :return: The directory path, created if needed.
+    """
+    cache_dir = os.path.join(
+        os.environ.get(CACHE_DIR_ENVAR_NAME) or os.path.join(
+            os.path.expanduser('~'), '.cache', 'ecosystem-tests'),
+        *parts)
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+    return cache_dir
+
+
+def write_json_file(path, content):
+    """
+    Write a JSON file so that readers never see a partial file.
+    """
+    temp_path = '{0}.{1}.tmp'.format(path, os.getpid())
+    with open(temp_path, 'w') as outfile:
+        json.dump(content, outfile, indent=2, sort_keys=True)
+    os.rename(temp_path, path)
+
+
+def read_json_file(path, default=None):
+    try:
+        with open(path) as infile:
+            return json.load(infile)
+    except (IOError, OSError, ValueError):
+        return default
+
+
+def file_digest(path):
+    """
+    The SHA-256 of a file content.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as infile:
+        for chunk in iter(lambda: infile.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def content_digest(path):
+    """
+    The SHA-256 of a file, or of the relative paths and contents of all
+    files in a directory.
+    """
+    if not os.path.isdir(path):
+        return file_digest(path)
+    digest = hashlib.sha256()
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for name in sorted(files):
+            file_path = os.path.join(root, name)
+            digest.update(os.path.relpath(file_path, path).encode('utf-8'))
+            digest.update(file_digest(file_path).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def push_cache_enabled():
+    """
+    Whether to skip copying files that the container already has.
+    Set ECOSYSTEM_TEST_PUSH_CACHE=false to always copy.
+    :return: Bool.
+    """
+    return os.environ.get(PUSH_CACHE_ENVAR_NAME, 'true').lower() not in \
+        ['false', 'no', 'off', '0']
+
+
+class PushedFilesManifest(object):
+    """The content hash of every file that was pushed to a container.
+
+    The manifest belongs to one container ID, a new container with the same
+    name starts with an empty manifest.
+    """
+
+    def __init__(self, path, container_id):
+        self.path = path
+        self.container_id = container_id
+        self._lock = threading.Lock()
+        content = read_json_file(path, {})
+        if content.get('container_id') == container_id:
+            self.files = content.get('files', {})
+        else:
+            self.files = {}
+
+    def unchanged(self, digests):
+        """
+        :param digests: A dict of remote path to the content hash.
+        :return: The remote paths that already have this content.
+        """
+        with self._lock:
+            return set(remote_path for remote_path, digest in digests.items()
+                       if self.files.get(remote_path) == digest)
+
+    def record(self, digests):
+        with self._lock:
+            self.files.update(digests)
+            self._save()
+
+    def forget(self, remote_path):
+        """
+        Forget a remote path and everything below it.
+        """
+        prefix = remote_path.rstrip('/') + '/'
+        with self._lock:
+            forgotten = [path for path in self.files
+                         if path == remote_path or path.startswith(prefix)]
+            for path in forgotten:
+                del self.files[path]
+            if forgotten:
+                self._save()
+
+    def _save(self):
+        try:
+            write_json_file(self.path, {'container_id': self.container_id,
+                                        'files': self.files})
+        except (IOError, OSError) as e:
+            logger.debug('Failed to save pushed files manifest: {0}'.format(
+                str(e)))
+
+
+_manifests = {}
+_manifests_lock = threading.Lock()
+
+
+def get_pushed_files_manifest(container_name, get_container_id):
+    """
+    Get the pushed files manifest of a container.
+    :param container_name: The container name.
+    :param get_container_id: A function that returns the container ID.
+    :return: The manifest, or None if it is disabled or unavailable.
+    """
+    if not push_cache_enabled():
+        return
+    with _manifests_lock:
+        if container_name not in _manifests:
+            try:
+                container_id = get_container_id()
+            except Exception as e:
+                logger.debug('Unable to get container ID of {0}: {1}'.format(
+                    container_name, str(e)))
+                return
+            if not container_id:
+                return
+            _manifests[container_name] = PushedFilesManifest(
+                os.path.join(get_cache_dir('manifests'),
+                             '{0}.json'.format(container_name)),
+                container_id)
+        return _manifests[container_name]
+
+
+def list_cache_ttl():
+    """
+    How many seconds to keep list results, from ECOSYSTEM_TEST_LIST_CACHE_TTL.
+    :return: None to keep them until they are invalidated, 0 to disable.
+    """
+    ttl = os.environ.get(LIST_CACHE_TTL_ENVAR_NAME)
+    if not ttl:
+        return
+    try:
+        return float(ttl)
+    except ValueError:
+        raise EcosystemTestException(
+            '{0} should be a number of seconds.'.format(
+                LIST_CACHE_TTL_ENVAR_NAME))
+
+
+class ListCache(object):
+    """Memoized list results per resource type.
+
+    A resource is invalidated by every call that changes it. A list that
+    was loaded while the resource changed is not kept.
+    """
+
+    def __init__(self, ttl=None):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._epoch = 0
+        self._entries = {}
+        self._generations = {}
+        self._lock = threading.Lock()
+
+    def get(self, resource, load):
+        """
+        :param resource: The resource type, like blueprints.
+        :param load: A function that lists the resource.
+        :return: A copy of the list.
+        """
+        with self._lock:
+            entry = self._entries.get(resource)
+            if entry and self._fresh(entry[0]):
+                self.hits += 1
+                return copy.deepcopy(entry[1])
+            self.misses += 1
+            generation = self._generation(resource)
+        value = load()
+        with self._lock:
+            if self.ttl != 0 and generation == self._generation(resource):
+                self._entries[resource] = (time(), value)
+        return copy.deepcopy(value)
+
+    def invalidate(self, *resources):
+        """
+        :param resources: The resource types, all of them if none is given.
+        """
+        with self._lock:
+            if not resources:
+                self._epoch += 1
+                self._entries.clear()
+            for resource in resources:
+                self._generations[resource] = \
+                    self._generations.get(resource, 0) + 1
+                self._entries.pop(resource, None)
+
+    def _generation(self, resource):
+        return self._epoch, self._generations.get(resource, 0)
+
+    def _fresh(self, created):
+        return self.ttl is None or time() - created < self.ttl
@@ -0,0 +1,235 @@
+########
+# Copyright (c) 2014-2022 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Remember how far a blueprint test got, per test ID.
+
+The state of a test is kept in the local cache, and belongs to one manager
+container, blueprint and inputs. When any of them changes the state is
+stale, and the test falls back to looking at the manager.
+"""
+
+import os
+import json
+import hashlib
+import threading
+from contextlib import contextmanager
+
+from nose.tools import nottest
+
+from ecosystem_tests.dorkl.constansts import logger
+from ecosystem_tests.dorkl.cache import (content_digest,
+                                         get_cache_dir,
+                                         read_json_file,
+                                         write_json_file)
+
+STATE_VERSION = 1
+
+BLUEPRINT_UPLOAD = 'blueprint_upload'
+DEPLOYMENT_CREATE = 'deployment_create'
+INSTALL = 'install'
+USER_DEFINED_CHECK = 'user_defined_check'
+UNINSTALL = 'uninstall'
+DELETE = 'delete'
+PHASES = [BLUEPRINT_UPLOAD,
+          DEPLOYMENT_CREATE,
+          INSTALL,
+          USER_DEFINED_CHECK,
+          UNINSTALL,
+          DELETE]
+# If one of these phases started and didn't complete, its outcome is only
+# known to the manager.
+UNCERTAIN_PHASES = [BLUEPRINT_UPLOAD, DEPLOYMENT_CREATE, DELETE]
+
+_local = threading.local()
+
+
+def inputs_digest(inputs):
+    """
+    :param inputs: A dict, a path to an inputs file, or an inputs string.
+    """
+    if not inputs:
+        return
+    if isinstance(inputs, dict):
+        inputs = json.dumps(inputs, sort_keys=True)
+    elif os.path.isfile(inputs):
+        return content_digest(inputs)
+    return hashlib.sha256(inputs.encode('utf-8')).hexdigest()
+
+
+@nottest
+def test_fingerprint(container_id, blueprint_file_name, inputs):
+    return {
+        'container_id': container_id,
+        'blueprint': content_digest(blueprint_file_name)
+        if blueprint_file_name and os.path.isfile(blueprint_file_name)
+        else None,
+        'inputs': inputs_digest(inputs)
+    }
+
+
+@nottest
+class TestState(object):
+    """The phases of a test that started, and their details."""
+
+    def __init__(self, path, fingerprint):
+        self.path = path
+        self.fingerprint = fingerprint
+        self._lock = threading.Lock()
+        content = read_json_file(path, {})
+        self.fresh = bool(content) and \
+            content.get('version') == STATE_VERSION and \
+            content.get('fingerprint') == fingerprint
+        self.phases = content.get('phases', {}) if self.fresh else {}
+
+    @property
+    def usable(self):
+        """
+        Whether the state can be trusted instead of the manager.
+        """
+        return self.fresh and not any(
+            phase in self.phases and not self.completed(phase)
+            for phase in UNCERTAIN_PHASES)
+
+    def completed(self, phase):
+        return self.phases.get(phase, {}).get('completed', False)
+
+    def get(self, phase, key):
+        return self.phases.get(phase, {}).get(key)
+
+    @property
+    def deployment_exists(self):
+        return self.completed(DEPLOYMENT_CREATE) and \
+            not self.completed(DELETE)
+
+    def record(self, phase, completed=True, **details):
+        """
+        Record that a phase started or completed. Starting a phase again
+        forgets the phases after it.
+        """
+        with self._lock:
+            if not completed and phase in PHASES:
+                for later in PHASES[PHASES.index(phase) + 1:]:
+                    self.phases.pop(later, None)
+            self.phases.setdefault(phase, {}).update(
+                completed=completed, **details)
+            self._save()
+
+    def reset(self, deployment_exists):
+        """
+        Start over from what the manager knows about the test.
+        """
+        with self._lock:
+            self.phases = {}
+            if deployment_exists:
+                for phase in [BLUEPRINT_UPLOAD, DEPLOYMENT_CREATE]:
+                    self.phases[phase] = {'completed': True}
+            self.fresh = True
+            self._save()
+
+    def clear(self):
+        """
+        Forget the test, the next invocation is a first invocation.
+        """
+        with self._lock:
+            self.phases = {}
+            self.fresh = False
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+
+    def _save(self):
+        try:
+            write_json_file(self.path, {'version': STATE_VERSION,
+                                        'fingerprint': self.fingerprint,
+                                        'phases': self.phases})
+        except (IOError, OSError) as e:
+            logger.debug('Failed to save test state: {0}'.format(str(e)))
+
+
+@nottest
+def test_state_path(test_id):
+    return os.path.join(get_cache_dir('state'), '{0}.json'.format(test_id))
+
+
+@nottest
+def load_test_state(test_id, blueprint_file_name, inputs, get_container_id):
+    """
+    :param get_container_id: A function that returns the manager
+        container ID.
+    :return: The test state, or None if the manager container is unknown.
+    """
+    try:
+        container_id = get_container_id()
+    except Exception as e:
+        logger.debug('Unable to get the manager container ID: {0}'.format(
+            str(e)))
+        return
+    if not container_id:
+        return
+    return TestState(
+        test_state_path(test_id),
+        test_fingerprint(container_id, blueprint_file_name, inputs))
+
+
+@nottest
+@contextmanager
+def test_state_context(state):
+    previous = getattr(_local, 'state', None)
+    _local.state = state
+    try:
+        yield state
+    finally:
+        _local.state = previous
+
+
+@nottest
+def current_test_state():
+    return getattr(_local, 'state', None)
+
+
+def phase_completed(phase):
+    """
+    Whether the test that runs in this thread already completed a phase.
+    """
+    state = current_test_state()
+    return bool(state and state.usable and state.completed(phase))
+
+
+def checkpoint(phase, completed=True, **details):
+    """
+    Record a phase of the test that runs in this thread.
+    """
+    state = current_test_state()
+    if state:
+        state.record(phase, completed, **details)
+
+
+@nottest
+def forget_test():
+    state = current_test_state()
+    if state:
+        state.clear()
+
+
+@nottest
+def discard_test_state(test_id):
+    """
+    Forget a test that doesn't run in this thread.
+    """
+    try:
+        os.remove(test_state_path(test_id))
+    except OSError:
+        pass
@@ -0,0 +1,160 @@
+########
+# Copyright (c) 2014-2022 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Run the teardown of blueprint tests in the background.
+
+Inside background_cleanup, uninstalls and failure handling are queued and
+run by a few worker threads, so that the next test starts right away. The
+queue is drained when the block ends. Outside of it they run in place.
+"""
+
+import threading
+from time import time
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+from ecosystem_tests.dorkl.constansts import logger, RED, GREEN, RESET
+from ecosystem_tests.dorkl.exceptions import EcosystemTestException
+from ecosystem_tests.dorkl.timing import span, current_report, resume_report
+from ecosystem_tests.dorkl.parallel import current_test_id, test_id_context
+from ecosystem_tests.dorkl.checkpoints import (current_test_state,
+                                               test_state_context)
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+class CleanupJob(object):
+
+    def __init__(self, name, test_id):
+        self.name = name
+        self.test_id = test_id
+        self.duration = None
+        self.error = None
+
+    def run(self, fn, *args, **kwargs):
+        logger.info('Cleanup {0} started.'.format(self.name))
+        start = time()
+        try:
+            with span('cleanup', job=self.name):
+                fn(*args, **kwargs)
+        except Exception as e:
+            self.error = str(e) or repr(e)
+            logger.error(RED + 'Cleanup {0} failed: {1}'.format(
+                self.name, self.error) + RESET)
+        else:
+            logger.info('Cleanup {0} finished.'.format(self.name))
+        finally:
+            self.duration = time() - start
+
+
+class CleanupQueue(object):
+    """Teardown jobs, run by a pool of worker threads."""
+
+    def __init__(self, workers):
+        self.jobs = []
+        self._pool = ThreadPoolExecutor(max_workers=workers)
+
+    def submit(self, name, fn, *args, **kwargs):
+        """
+        Queue a teardown job. It runs in the context of the test that
+        queued it, with its test ID and test state, and its spans are added
+        to the report of the test.
+        """
+        job = CleanupJob(name, current_test_id())
+        state = current_test_state()
+        report = current_report()
+
+        def run():
+            with test_id_context(job.test_id), test_state_context(state), \
+                    resume_report(report):
+                job.run(fn, *args, **kwargs)
+
+        self.jobs.append(job)
+        self._pool.submit(run)
+        logger.info('Cleanup {0} queued.'.format(name))
+        return job
+
+    def drain(self):
+        """
+        Wait for all the queued jobs.
+        :return: The jobs that failed.
+        """
+        self._pool.shutdown(wait=True)
+        return [job for job in self.jobs if job.error is not None]
+
+
+def schedule_cleanup(name, fn, *args, **kwargs):
+    """
+    Run a teardown job in the background, or in place when there is no
+    cleanup queue.
+    :param name: A description of the job for the cleanup report.
+    """
+    queue = _queue
+    if queue is None:
+        return fn(*args, **kwargs)
+    queue.submit(name, fn, *args, **kwargs)
+
+
+@contextmanager
+def background_cleanup(workers):
+    """
+    Queue the teardown jobs that are scheduled in the block, and wait for
+    them at its end.
+    :param workers: How many jobs to run at a time. With 0, jobs run in
+        place.
+    :raises EcosystemTestException: If a job failed, and the block didn't.
+    """
+    global _queue
+    if not workers:
+        yield
+        return
+    with _queue_lock:
+        if _queue is not None:
+            raise EcosystemTestException(
+                'A background cleanup queue is already active.')
+        _queue = queue = CleanupQueue(workers)
+    try:
+        yield queue
+    finally:
+        with _queue_lock:
+            _queue = None
+        if queue.jobs:
+            logger.info('Waiting for {0} cleanup jobs...'.format(
+                len(queue.jobs)))
+        failed = queue.drain()
+        log_cleanup_report(queue.jobs)
+    if failed:
+        raise EcosystemTestException(
+            'Failed cleanups: {0}. Please clean resources on the manager '
+            'manually.'.format(', '.join(job.name for job in failed)))
+
+
+def log_cleanup_report(jobs):
+    if not jobs:
+        return
+    lines = ['Cleanup report: {0} jobs, {1} failed.'.format(
+        len(jobs), len([job for job in jobs if job.error is not None]))]
+    for job in jobs:
+        line = '{0}{1}{2} {3} in {4:.1f}s'.format(
+            RED if job.error is not None else GREEN,
+            'FAILED' if job.error is not None else 'DONE',
+            RESET,
+            job.name,
+            job.duration or 0)
+        if job.error is not None:
+            line += ': {0}'.format(job.error)
+        lines.append(line)
+    logger.info('\n'.join(lines))
@@ -14,27 +14,33 @@
 # limitations under the License.
 
 import os
+import re
 import json
 import yaml
 import base64
-from time import sleep
+import atexit
+import threading
+from time import sleep, time
+from functools import wraps
 from contextlib import contextmanager
 from tempfile import NamedTemporaryFile
 from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+from cloudify_rest_client.exceptions import CloudifyClientError
 
 try:
     from urllib.request import urlopen  # Python 3
 except ImportError:
     from urllib2 import urlopen  # Python 2
 
-from wagon import show
-
 
 from ecosystem_cicd_tools.packaging import (
     get_workspace_files,
     find_wagon_local_path,
     get_bundle_from_workspace)
 from ecosystem_tests.dorkl.constansts import (logger,
+                                              UPLOAD_WORKERS_ENVAR_NAME,
                                               LICENSE_ENVAR_NAME,
                                               RED,
                                               GREEN,
@@ -46,36 +52,79 @@ from ecosystem_tests.dorkl.constansts import (logger,
                                               BOLD,
                                               UNDERLINE)
 from ecosystem_tests.dorkl.exceptions import (EcosystemTimeout,
+                                              EcosystemCommandError,
                                               EcosystemTestException)
 from ecosystem_tests.dorkl.commands import (cloudify_exec,
                                             copy_file_to_docker,
+                                            copy_files_to_docker,
                                             delete_file_from_docker,
+                                            delete_files_from_docker,
                                             copy_directory_to_docker)
+from ecosystem_tests.dorkl import async_commands
+from ecosystem_tests.dorkl.backoff import backoff_delays
+from ecosystem_tests.dorkl.readiness import wait_for_manager
+from ecosystem_tests.dorkl.cache import ListCache, list_cache_ttl
+from ecosystem_tests.dorkl.plugin_inventory import wagon_key, PluginInventory
+from ecosystem_tests.dorkl.rest_client import (call_rest,
+                                               call_manager,
+                                               manager_tenant,
+                                               rest_backend_enabled,
+                                               deployment_outputs_from_rest)
 
 DEFAULT_COLOR = os.environ.get('DEFAULT_WORKFLOW_COLOR', BOLD)
+EVENTS_PAGE_SIZE = 100
+DEFAULT_UPLOAD_WORKERS = 4
+# How long to keep retrying an upload that conflicts with another one.
+UPLOAD_CONFLICT_TIMEOUT = 300
+# How the cfy CLI reports a 409, like "409: Conflict".
+CONFLICT_OUTPUT = re.compile(r'\b409\b\W*(client error\W*)?conflict\b')
+DEPLOYMENT_READY_TIMEOUT = 300
+EXECUTION_END_STATUSES = ['completed', 'failed', 'cancelled']
+
+list_cache = ListCache(list_cache_ttl())
+# Blueprint directories are copied to the same path for every test that uses
+# them, and deleted after use.
+shared_files_lock = threading.RLock()
+
+
+def invalidates(*resources):
+    """
+    Invalidate the cached lists of resources that a function changes.
+    The lists are invalidated even if the function fails, since the change
+    may have partially happened.
+    """
+
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            try:
+                return func(*args, **kwargs)
+            finally:
+                list_cache.invalidate(*resources)
+        return wrapper
+    return decorator
+
+
+@atexit.register
+def log_list_cache_stats():
+    if list_cache.hits or list_cache.misses:
+        logger.debug('List cache: {0} hits, {1} misses.'.format(
+            list_cache.hits, list_cache.misses))
 
 
 def use_cfy(timeout=60):
     """
-    Initialize the Cloudify CLI profile inside the container.
-    :param timeout:
-    :return: Command output.
+    Wait until the manager in the container is ready.
+    :param timeout: How many seconds to wait.
+    :return:
     """
 
     logger.info('Checking manager status.')
-    start = datetime.now()
-    # Give 10 sec of mercy for the container to boot
-    sleep(10)
-    while True:
-        if datetime.now() - start > timedelta(seconds=timeout):
-            raise EcosystemTestException('Fn use_cfy timed out.')
-        try:
-            output = cloudify_exec('cfy status', get_json=False)
-            logger.info(output)
-        except EcosystemTestException:
-            sleep(10)
-        logger.info('Manager is ready.')
-        break
+    try:
+        wait_for_manager(timeout)
+    except EcosystemTimeout as e:
+        raise EcosystemTestException('Fn use_cfy timed out: {0}'.format(
+            str(e)))
 
 
 def license_upload():
@@ -96,54 +145,211 @@ def license_upload():
         copy_file_to_docker(file_temp.name)), get_json=False)
 
 
-def plugin_already_uploaded(wagon_path):
+def plugin_already_uploaded(wagon_path, inventory=None):
     """
     Check if a plugin is already loaded on the manager.
     :param wagon_path: Path to a wagon.
+    :param inventory: The plugins on the manager, to check many wagons
+        against one plugins list.
     :return: Bool.
     """
 
+    inventory = inventory or get_plugin_inventory()
+    key = get_wagon_key(wagon_path)
+    logger.info('CHECKING if {0} {1} {2} is on the manager.'.format(*key))
+    return key in inventory
+
+
+def get_wagon_key(wagon_path):
     # It`s url
     if '://' in wagon_path:
-        wagon_metadata = show(wagon_path)
-    else:
-        wagon_metadata = show(find_wagon_local_path(wagon_path))
-    plugin_name = wagon_metadata["package_name"]
-    plugin_version = wagon_metadata["package_version"]
-    plugin_distribution = \
-        wagon_metadata["build_server_os_properties"]["distribution"]
-    for plugin in cloudify_exec('cfy plugins list'):
-        logger.info('CHECKING if {0} {1} {2} in {3}'.format(
-            plugin_name,
-            plugin_version,
-            plugin_distribution,
-            plugin))
-        compare_name = plugin['package_name']
-        compare_version = plugin['package_version']
-        compare_distro = plugin.get('distribution', '').lower() or plugin.get(
-            'yaml_url_path', '')
-
-        if plugin_name.replace('_', '-') in compare_name and \
-                plugin_version == compare_version and \
-                plugin_distribution.lower() in compare_distro:
-            return True
-
-
-def plugins_upload(wagon_path, yaml_path):
+        return wagon_key(wagon_path)
+    return wagon_key(find_wagon_local_path(wagon_path))
+
+
+def get_plugin_inventory():
+    return PluginInventory(plugins_list())
+
+
+def manager_version():
+    """
+    :return: The manager version details, like version, edition and build.
+    """
+    return call_manager(
+        lambda client: dict(client.manager.get_version()),
+        lambda: cloudify_exec('cfy --version', get_json=False, log=False))
+
+
+def plugins_list():
+    return list_cache.get('plugins', lambda: call_manager(
+        lambda client: [dict(p) for p in client.plugins.list()],
+        lambda: cloudify_exec('cfy plugins list')))
+
+
+@invalidates('plugins')
+def plugins_upload(wagon_path, yaml_path, remote_paths=None, inventory=None):
     """
     Upload a wagon and plugin YAML to the manager.
     :param wagon_path: Path to the wagon on the manager.
     :param yaml_path: Path to the YAML on the manager container.
+    :param remote_paths: Local files that were already copied to the
+        manager container, mapped to their remote path.
+    :param inventory: The plugins on the manager, for a batch of uploads.
     :return: Command output.
     """
     logger.info('Uploading plugin: {0} {1}'.format(wagon_path, yaml_path))
-    if not plugin_already_uploaded(wagon_path):
-        if os.path.exists(wagon_path):
-            wagon_path = copy_file_to_docker(wagon_path)
-        if os.path.exists(yaml_path):
-            yaml_path = copy_file_to_docker(yaml_path)
-        return cloudify_exec('cfy plugins upload {0} -y {1}'.format(
-            wagon_path, yaml_path), get_json=False)
+    if not plugin_already_uploaded(wagon_path, inventory):
+        remote_paths = remote_paths or copy_files_to_docker(
+            [p for p in [wagon_path, yaml_path] if os.path.exists(p)])
+        output = cloudify_exec('cfy plugins upload {0} -y {1}'.format(
+            remote_paths.get(wagon_path, wagon_path),
+            remote_paths.get(yaml_path, yaml_path)), get_json=False)
+        if inventory:
+            inventory.add(get_wagon_key(wagon_path))
+        return output
+
+
+def stage_plugin_files(plugins):
+    """
+    Copy the local wagons and plugin YAMLs of plugins in a single transfer.
+    :param plugins: A list of (wagon path, plugin YAML path) tuples.
+    :return: A dict of local path to the remote path inside the container.
+    """
+
+    return copy_files_to_docker(
+        [path for plugin in plugins for path in plugin
+         if os.path.exists(path)])
+
+
+def upload_workers():
+    """
+    How many plugins to upload at once, from ECOSYSTEM_TEST_UPLOAD_WORKERS.
+    :return: The number of workers.
+    """
+    workers = os.environ.get(UPLOAD_WORKERS_ENVAR_NAME)
+    if not workers:
+        return DEFAULT_UPLOAD_WORKERS
+    try:
+        workers = int(workers)
+    except ValueError:
+        workers = 0
+    if workers < 1:
+        raise EcosystemTestException(
+            '{0} should be a positive number.'.format(
+                UPLOAD_WORKERS_ENVAR_NAME))
+    return workers
+
+
+def upload_plugins(plugins, workers=None):
+    """
+    Upload the plugins that are not on the manager yet, several at a time.
+    The wagons are checked against the manager in parallel, the files of the
+    missing plugins are copied in one transfer, and then they are uploaded
+    in parallel.
+    :param plugins: A list of (wagon path, plugin YAML path) tuples.
+    :param workers: How many plugins to upload at once.
+    :return:
+    """
+
+    inventory = get_plugin_inventory()
+    summary = []
+    with ThreadPoolExecutor(max_workers=workers or upload_workers()) as pool:
+        uploaded = list(pool.map(
+            lambda plugin: plugin_already_uploaded(plugin[0], inventory),
+            plugins))
+        pending = [plugin for plugin, is_uploaded in zip(plugins, uploaded)
+                   if not is_uploaded]
+        summary.extend(
+            (plugin[0], 'skipped', 0) for plugin in plugins
+            if plugin not in pending)
+        remote_paths = stage_plugin_files(pending)
+        summary.extend(pool.map(
+            lambda plugin: timed_plugin_upload(
+                plugin[0], plugin[1], remote_paths, inventory),
+            pending))
+    log_upload_summary(summary)
+    failed = [wagon_path for wagon_path, status, _ in summary
+              if status == 'failed']
+    if failed:
+        raise EcosystemTestException(
+            'Failed to upload plugins: {0}'.format(', '.join(failed)))
+
+
+def timed_plugin_upload(wagon_path, yaml_path, remote_paths, inventory):
+    """
+    Upload a plugin, and time it.
+    :return: A tuple of the wagon path, the status and the duration.
+    """
+
+    start = time()
+    try:
+        output = upload_plugin_with_backoff(
+            wagon_path, yaml_path, remote_paths, inventory)
+    except (EcosystemTestException, EcosystemTimeout) as e:
+        logger.error('Failed to upload plugin {0}: {1}'.format(
+            wagon_path, str(e)))
+        return wagon_path, 'failed', time() - start
+    logger.info('Uploaded plugin: {0}'.format(output))
+    return wagon_path, 'uploaded', time() - start
+
+
+def upload_plugin_with_backoff(wagon_path,
+                               yaml_path,
+                               remote_paths=None,
+                               inventory=None,
+                               timeout=UPLOAD_CONFLICT_TIMEOUT):
+    """
+    Upload a plugin, and retry with backoff while the manager reports a
+    conflict, like another plugin that is being installed.
+    """
+
+    delays = backoff_delays(
+        initial=3,
+        maximum=30,
+        deadline=datetime.now() + timedelta(seconds=timeout))
+    while True:
+        try:
+            return plugins_upload(
+                wagon_path, yaml_path, remote_paths, inventory)
+        except (EcosystemCommandError, CloudifyClientError) as e:
+            if 'already exists' in error_output(e):
+                logger.info('Plugin {0} is already on the manager.'.format(
+                    wagon_path))
+                return
+            if not upload_conflict(e):
+                raise
+            delay = next(delays, None)
+            if delay is None:
+                raise
+            logger.warning('Conflict while uploading plugin {0}, '
+                           'retrying in {1:.1f} seconds.'.format(
+                               wagon_path, delay))
+            sleep(delay)
+
+
+def error_output(error):
+    """
+    :return: The lowercase output of a failed cfy command, or the message of
+        a failed REST call.
+    """
+    return (getattr(error, 'output', None) or str(error)).lower()
+
+
+def upload_conflict(error):
+    """
+    Whether an upload failed with a 409 conflict, which may pass.
+    :param error: An EcosystemCommandError or a CloudifyClientError.
+    """
+    if isinstance(error, CloudifyClientError):
+        return error.status_code == 409
+    return bool(CONFLICT_OUTPUT.search(error_output(error)))
+
+
+def log_upload_summary(summary):
+    logger.info('Plugin upload summary:')
+    for wagon_path, status, duration in summary:
+        logger.info('{0:>8} {1:6.1f}s {2}'.format(
+            status, duration, wagon_path))
 
 
 def get_test_plugins(workspace_path=None):
@@ -154,10 +360,10 @@ def get_test_plugins(workspace_path=None):
     :return: list of tuples
     """
 
-    plugin_yaml = copy_file_to_docker('plugin.yaml')
-    return [(copy_file_to_docker(f), plugin_yaml) for f in
-            get_workspace_files(workspace_path=workspace_path)
-            if f.endswith('.wgn')]
+    wagons = [f for f in get_workspace_files(workspace_path=workspace_path)
+              if f.endswith('.wgn')]
+    remote_paths = copy_files_to_docker(['plugin.yaml'] + wagons)
+    return [(remote_paths[f], remote_paths['plugin.yaml']) for f in wagons]
 
 
 def upload_test_plugins(plugins,
@@ -187,13 +393,10 @@ def upload_test_plugins(plugins,
         else:
             cloudify_exec(
                 'cfy plugins bundle-upload', get_json=False)
+        list_cache.invalidate('plugins')
 
-    for plugin in plugins:
-        sleep(3)
-        output = plugins_upload(plugin[0], plugin[1])
-        logger.info('Uploaded plugin: {0}'.format(output))
-    logger.info('Plugins list: {0}'.format(
-        cloudify_exec('cfy plugins list')))
+    upload_plugins(plugins)
+    logger.info('Plugins list: {0}'.format(plugins_list()))
 
 
 def create_test_secrets(secrets=None):
@@ -204,42 +407,150 @@ def create_test_secrets(secrets=None):
     """
 
     secrets = secrets or {}
-    for secret, f in secrets.items():
-        secrets_create(secret, f)
-    logger.info('Secrets list: {0}'.format(
-        cloudify_exec('cfy secrets list')))
+    if secrets:
+        secrets_import(secrets)
+    logger.info('Secrets list: {0}'.format(secrets_list()))
 
 
-def secrets_create(name, is_file=False):
+def secrets_list():
+    return list_cache.get('secrets', lambda: call_manager(
+        lambda client: [dict(s) for s in client.secrets.list()],
+        lambda: cloudify_exec('cfy secrets list')))
+
+
+def get_secret_value(name):
     """
-    Create a secret on the manager.
+    Get a secret value from its base64 encoded env var.
     :param name: The secret key.
-    :param is_file: Whether to create the secret from a file.
-    :return:
+    :return: The secret value.
     """
-    logger.info('Creating secret: {0}.'.format(name))
     try:
         value = base64.b64decode(os.environ[name].
                                  encode('utf-8')).decode('ascii')
-        value = value.rstrip('\n')
+        return value.rstrip('\n')
     except KeyError:
         raise EcosystemTestException(
             'Secret env var not set {0}.'.format(name))
+
+
+@invalidates('secrets')
+def secrets_import(secrets):
+    """
+    Create many secrets on the manager with a single call.
+    Existing secrets are updated, like secrets_create does. If the manager
+    can't import them, they are created one by one.
+    :param secrets: A dict of secret key to whether it is a file secret.
+        A file secret gets the same value, the file only carries it.
+    :return:
+    """
+    logger.info('Creating secrets: {0}.'.format(', '.join(secrets)))
+    tenant = manager_tenant()
+    import_list = [{'key': name,
+                    'value': get_secret_value(name),
+                    'tenant_name': tenant,
+                    'visibility': 'tenant',
+                    'is_hidden_value': False,
+                    'encrypted': False} for name in secrets]
+    try:
+        call_manager(
+            lambda client: rest_secrets_import(client, import_list),
+            lambda: cli_secrets_import(import_list))
+    except EcosystemTestException as e:
+        logger.warning('Failed to import secrets, creating them one by one: '
+                       '{0}'.format(str(e)))
+        file_secrets = [name for name in secrets if secrets[name]]
+        with secret_files_on_docker(file_secrets) as docker_paths:
+            async_commands.run_concurrently(
+                *[async_commands.cloudify_exec(
+                    secret_create_command(name, docker_paths.get(name)),
+                    get_json=False,
+                    log=False) for name in secrets],
+                limit=upload_workers())
+
+
+@contextmanager
+def secret_files_on_docker(names):
+    """
+    Copy the files of many file secrets to the container at once, and
+    delete them when the block ends.
+    :param names: The secret keys.
+    :return: A dict of secret key to its file inside the container.
+    """
+    local_paths = {}
+    try:
+        for name in names:
+            with NamedTemporaryFile(mode='w', delete=False) as outfile:
+                local_paths[name] = outfile.name
+                outfile.write(get_secret_value(name))
+        remote_paths = copy_files_to_docker(list(local_paths.values())) \
+            if local_paths else {}
+        try:
+            yield {name: remote_paths[local_path]
+                   for name, local_path in local_paths.items()}
+        finally:
+            delete_files_from_docker(sorted(remote_paths.values()))
+    finally:
+        for local_path in local_paths.values():
+            os.remove(local_path)
+
+
+def rest_secrets_import(client, import_list):
+    response = client.secrets.import_secrets(import_list,
+                                             override_collisions=True)
+    if response.get('secrets_errors'):
+        raise EcosystemTestException(
+            'Some secrets were not imported: {0}'.format(
+                response['secrets_errors']))
+
+
+def cli_secrets_import(import_list):
+    with NamedTemporaryFile(mode='w+', suffix='.json') as outfile:
+        json.dump(import_list, outfile)
+        outfile.flush()
+        docker_path = copy_file_to_docker(outfile.name)
+    try:
+        cloudify_exec('cfy secrets import -i {0} --override-collisions'.format(
+            docker_path), get_json=False, log=False)
+    finally:
+        delete_file_from_docker(docker_path)
+
+
+@invalidates('secrets')
+def secrets_create(name, is_file=False):
+    """
+    Create a secret on the manager.
+    :param name: The secret key.
+    :param is_file: Whether to create the secret from a file.
+    :return:
+    """
+    logger.info('Creating secret: {0}.'.format(name))
     if is_file:
         with NamedTemporaryFile(mode='w+', delete=True) as outfile:
-            outfile.write(value)
+            outfile.write(get_secret_value(name))
             outfile.flush()
-            cmd = 'cfy secrets create -u {0} -f {1}'.format(
-                name,
-                copy_file_to_docker(outfile.name))
-            return cloudify_exec(cmd,
-                                 get_json=False,
-                                 log=False)
+            return cloudify_exec(
+                secret_create_command(name, copy_file_to_docker(outfile.name)),
+                get_json=False,
+                log=False)
 
-    return cloudify_exec('cfy secrets create -u {0} -s {1}'.format(
-        name, value), get_json=False, log=False)
+    return cloudify_exec(secret_create_command(name),
+                         get_json=False,
+                         log=False)
 
 
+def secret_create_command(name, docker_path=None):
+    """
+    :param name: The secret key.
+    :param docker_path: The file of a file secret inside the container.
+    :return: The cfy command that creates the secret.
+    """
+    if docker_path:
+        return 'cfy secrets create -u {0} -f {1}'.format(name, docker_path)
+    return 'cfy secrets create -u {0} -s {1}'.format(
+        name, get_secret_value(name))
+
+
+@invalidates('blueprints')
 def blueprints_upload(blueprint_file_name, blueprint_id):
     """
     Upload a blueprint to the manager.
@@ -251,22 +562,32 @@ def blueprints_upload(blueprint_file_name, blueprint_id):
         raise EcosystemTestException(
             'Cant upload blueprint {path} because the file doesn`t '
             'exists.'.format(path=blueprint_file_name))
-    remote_dir = copy_directory_to_docker(blueprint_file_name)
-    blueprint_file = os.path.basename(blueprint_file_name)
+    with shared_files_lock:
+        remote_dir = copy_directory_to_docker(blueprint_file_name)
+        blueprint_file = os.path.basename(blueprint_file_name)
+
+        try:
+            output = cloudify_exec('cfy blueprints upload {0} -b {1}'.format(
+                os.path.join(remote_dir, blueprint_file),
+                blueprint_id), get_json=False)
+            delete_file_from_docker(remote_dir)
+        except Exception as e:
+            logger.info('Failed to upload blueprint, {0}'
+                        'Maybe You need to clean up the /tmp directory'
+                        .format(str(e)))
 
-    try:
-        output = cloudify_exec('cfy blueprints upload {0} -b {1}'.format(
-            os.path.join(remote_dir, blueprint_file),
-            blueprint_id), get_json=False)
-        delete_file_from_docker(remote_dir)
-    except Exception as e:
-        logger.info('Failed to upload blueprint, {0}'
-                    'Maybe You need to clean up the /tmp directory'
-                    .format(str(e)))
+
+def blueprints_list():
+    return list_cache.get('blueprints', lambda: call_manager(
+        lambda client: [dict(b) for b in client.blueprints.list(
+            sort='created_at')],
+        lambda: cloudify_exec('cfy blueprints list')))
 
 
 def blueprints_get(blueprint_id):
-    return cloudify_exec('cfy blueprints get {0}'.format(blueprint_id))
+    return call_manager(
+        lambda client: dict(client.blueprints.get(blueprint_id)),
+        lambda: cloudify_exec('cfy blueprints get {0}'.format(blueprint_id)))
 
 
 def blueprint_exists(blueprint_id):
@@ -277,36 +598,186 @@ def blueprint_exists(blueprint_id):
         return False
 
 
+@invalidates('blueprints')
 def blueprints_delete(blueprint_id):
     return cloudify_exec(
         'cfy blueprints delete {0}'.format(
             blueprint_id), get_json=False)
 
 
-def deployments_create(blueprint_id, inputs):
+@invalidates('deployments')
+def deployments_create(blueprint_id,
+                       inputs,
+                       wait=False,
+                       timeout=DEPLOYMENT_READY_TIMEOUT):
     """
     Create a deployment on the manager.
-    :param blueprint_id:
+    :param blueprint_id: The blueprint ID, also used as the deployment ID.
     :param inputs:
+    :param wait: Whether to return only when the deployment is ready.
+    :param timeout: How many seconds to wait for the deployment.
     :return:
     """
     if not inputs:
-        return cloudify_exec('cfy deployments create -b {0}'.format(
+        output = cloudify_exec('cfy deployments create -b {0}'.format(
             blueprint_id), get_json=False)
-    with prepare_inputs(inputs) as handled_inputs:
-        return cloudify_exec('cfy deployments create -i {0} -b {1}'.format(
-            handled_inputs, blueprint_id), get_json=False)
+    else:
+        with prepare_inputs(inputs) as handled_inputs:
+            output = cloudify_exec(
+                'cfy deployments create -i {0} -b {1}'.format(
+                    handled_inputs, blueprint_id), get_json=False)
+    if wait:
+        wait_for_deployment_environment(blueprint_id, timeout)
+    return output
+
+
+def wait_for_deployment_environment(deployment_id, timeout):
+    """
+    Wait for the create_deployment_environment workflow of a deployment,
+    after which install can start.
+    """
+    return wait_for_execution(deployment_id,
+                              'create_deployment_environment',
+                              timeout,
+                              tail_events=False)
 
 
+def deployments_list():
+    return list_cache.get('deployments', lambda: call_manager(
+        lambda client: [dict(d) for d in client.deployments.list(
+            sort='created_at')],
+        lambda: cloudify_exec('cfy deployments list')))
+
+
+@invalidates('deployments')
 def deployment_delete(blueprint_id):
     return cloudify_exec('cfy deployments delete {0}'.format(
         blueprint_id), get_json=False)
 
 
+@invalidates('deployments')
+def deployment_group_create(group_id,
+                            blueprint_id,
+                            members,
+                            default_inputs=None):
+    """
+    Create a deployment group with a new deployment for every member.
+    :param group_id: The group ID.
+    :param blueprint_id: The blueprint of all the members.
+    :param members: A dict of deployment ID to its inputs.
+    :param default_inputs: Inputs of all the members.
+    :return: The deployment group.
+    """
+    logger.info('Creating deployment group {0} of {1} deployments.'.format(
+        group_id, len(members)))
+    return call_rest(lambda client: dict(client.deployment_groups.put(
+        group_id,
+        blueprint_id=blueprint_id,
+        default_inputs=default_inputs or {},
+        new_deployments=[{'id': deployment_id, 'inputs': inputs or {}}
+                         for deployment_id, inputs in members.items()])))
+
+
+@invalidates('deployments')
+def deployment_group_delete(group_id, deployment_ids, timeout):
+    """
+    Delete a deployment group and its deployments, and wait until the
+    deployments are gone.
+    """
+    call_rest(lambda client: client.deployment_groups.delete(
+        group_id, delete_deployments=True))
+    delays = backoff_delays(
+        deadline=datetime.now() + timedelta(seconds=timeout))
+    while True:
+        remaining = call_rest(lambda client: [
+            deployment.id for deployment in client.deployments.list(
+                id=deployment_ids, _include=['id'])])
+        if not remaining:
+            return
+        try:
+            sleep(next(delays))
+        except StopIteration:
+            raise EcosystemTimeout(
+                'Deployments were not deleted: {0}'.format(
+                    ', '.join(remaining)))
+
+
+def execution_group_start(group_id, workflow_id, params=None):
+    """
+    Start a workflow on all the deployments of a group.
+    :return: The execution group, with the IDs of its executions.
+    """
+    logger.info('Starting {0} on deployment group {1}.'.format(
+        workflow_id, group_id))
+    return call_rest(lambda client: dict(client.execution_groups.start(
+        group_id, workflow_id, default_parameters=params or {})))
+
+
+def group_executions(deployment_ids, workflow_id):
+    """
+    List the executions of a workflow on many deployments in one call.
+    """
+    return call_rest(lambda client: [dict(e) for e in client.executions.list(
+        deployment_id=deployment_ids,
+        workflow_id=workflow_id,
+        include_system_workflows=True,
+        sort='created_at',
+        _include=['id', 'deployment_id', 'workflow_id', 'status', 'error'])])
+
+
+def wait_for_group_workflow(deployment_ids,
+                            workflow_id,
+                            timeout,
+                            execution_ids=None):
+    """
+    Wait for a workflow on many deployments, with one poll for all of them.
+    :param deployment_ids: The deployments to wait for.
+    :param workflow_id: The workflow.
+    :param timeout: How many seconds to wait.
+    :param execution_ids: Only wait for these executions, like those of an
+        execution group. By default the latest execution of every
+        deployment.
+    :return: A dict of deployment ID to its execution, with how many
+        seconds it was waited for. Deployments whose execution didn't end
+        in time have their last execution, or None.
+    """
+    logger.info('Waiting for {0} on {1} deployments.'.format(
+        workflow_id, len(deployment_ids)))
+    start = time()
+    executions = dict((deployment_id, None)
+                      for deployment_id in deployment_ids)
+    delays = backoff_delays(
+        deadline=datetime.now() + timedelta(seconds=timeout))
+    while True:
+        for ex in group_executions(
+                [d for d, ex in executions.items()
+                 if not ex or ex['status'] not in EXECUTION_END_STATUSES],
+                workflow_id):
+            if execution_ids is None or ex['id'] in execution_ids:
+                ex['waited'] = time() - start
+                executions[ex['deployment_id']] = ex
+        pending = sorted(d for d, ex in executions.items()
+                         if not ex or ex['status'] not in
+                         EXECUTION_END_STATUSES)
+        if not pending:
+            return executions
+        logger.info('{0} is pending/started on: {1}'.format(
+            workflow_id, ', '.join(pending)))
+        try:
+            sleep(next(delays))
+        except StopIteration:
+            logger.error('Timed out waiting for {0} on: {1}'.format(
+                workflow_id, ', '.join(pending)))
+            return executions
+
+
 def get_deployment_outputs(deployment_id):
     logger.info('Getting deployment outputs {0}'.format(deployment_id))
-    return cloudify_exec(
-        'cfy deployments outputs --json {0}'.format(deployment_id))
+    return call_manager(
+        lambda client: deployment_outputs_from_rest(
+            client.deployments.outputs.get(deployment_id)),
+        lambda: cloudify_exec(
+            'cfy deployments outputs --json {0}'.format(deployment_id)))
 
 
 def get_deployment_output_by_name(deployment_id, output_id):
@@ -317,8 +788,7 @@ def get_deployment_output_by_name(deployment_id, output_id):
 
 
 def get_blueprint_id_of_deployment(deployment_id):
-    deployments_list = cloudify_exec('cfy deployments list')
-    for deployment in deployments_list:
+    for deployment in deployments_list():
         if deployment['id'] == deployment_id:
             return deployment["blueprint_id"]
 
@@ -390,8 +860,22 @@ def executions_list(deployment_id):
     :param deployment_id:
     :return:
     """
-    return cloudify_exec('cfy executions list -d {0} '
-                         '--include-system-workflows'.format(deployment_id))
+    return call_manager(
+        lambda client: rest_executions_list(client, deployment_id),
+        lambda: cloudify_exec('cfy executions list -d {0} '
+                              '--include-system-workflows'.format(
+                                  deployment_id)))
+
+
+def rest_executions_list(client, deployment_id):
+    executions = [dict(e) for e in client.executions.list(
+        deployment_id=deployment_id,
+        include_system_workflows=True,
+        sort='created_at')]
+    if not executions:
+        # Like the CLI, fail for a deployment that doesn't exist.
+        client.deployments.get(deployment_id, _include=['id'])
+    return executions
 
 
 def events_list(execution_id):
@@ -400,10 +884,75 @@ def events_list(execution_id):
     :param execution_id:
     :return:
     """
-    events = cloudify_exec('cfy events list {0}'.format(execution_id))
-    if not events:
-        return []
-    return [json.loads(line) for line in events.split('\n') if line]
+    return list(EventTailer(execution_id).new_events())
+
+
+def events_page(execution_id, offset, size):
+    """
+    Get a page of events of an execution, oldest first.
+    :param execution_id:
+    :param offset: How many events to skip.
+    :param size: How many events to get.
+    :return: A list of events.
+    """
+
+    def cli():
+        events = cloudify_exec(
+            'cfy events list {0} --pagination-offset {1} '
+            '--pagination-size {2} --json'.format(execution_id, offset, size),
+            get_json=False,
+            log=False)
+        return [json.loads(line) for line in events.splitlines()
+                if line.strip()]
+
+    # cfy events list includes logs, so a page has the same events with
+    # either backend, and the offset holds when the CLI takes over.
+    return call_manager(
+        lambda client: [dict(event) for event in client.events.list(
+            execution_id=execution_id,
+            include_logs=True,
+            _offset=offset,
+            _size=size,
+            sort='reported_timestamp')],
+        cli)
+
+
+class EventTailer(object):
+    """Follow the events of an execution.
+
+    Only the number of events seen so far is kept, every call fetches the
+    events that were added since, page by page.
+    """
+
+    def __init__(self, execution_id, page_size=EVENTS_PAGE_SIZE):
+        self.execution_id = execution_id
+        self.page_size = page_size
+        self.offset = 0
+
+    def new_events(self):
+        """
+        :return: A generator of the events since the previous call.
+        """
+        while True:
+            page = events_page(self.execution_id, self.offset, self.page_size)
+            for event in page:
+                self.offset += 1
+                yield event
+            if len(page) < self.page_size:
+                return
+
+
+def task_error_causes(event):
+    # The CLI shows events in the legacy format, with a context.
+    return event.get('error_causes') or \
+        (event.get('context') or {}).get('task_error_causes')
+
+
+def log_task_errors(events):
+    for event in events:
+        causes = task_error_causes(event)
+        if causes:
+            logger.info(causes)
 
 
 def log_events(execution_id):
@@ -412,47 +961,82 @@ def log_events(execution_id):
     :param execution_id:
     :return:
     """
-    for event in events_list(execution_id):
-        if event['context']['task_error_causes']:
-            logger.info(event['context']['task_error_causes'])
+    log_task_errors(EventTailer(execution_id).new_events())
 
 
-def wait_for_execution(deployment_id, workflow_id, timeout):
+def executions_get(execution_id):
+    """
+    Get an execution from the manager.
+    :param execution_id:
+    :return:
+    """
+    return call_manager(
+        lambda client: dict(client.executions.get(execution_id)),
+        lambda: cloudify_exec('cfy executions get {0}'.format(execution_id),
+                              log=False))
+
+
+def get_latest_execution(deployment_id, workflow_id):
+    executions = executions_list(deployment_id)
+    try:
+        return [e for e in executions
+                if workflow_id == e['workflow_id']][-1]
+    except (IndexError, KeyError, TypeError):
+        raise EcosystemTestException(
+            'Workflow {0} for deployment {1} was not found.'.format(
+                workflow_id, deployment_id))
+
+
+def wait_for_execution(deployment_id,
+                       workflow_id,
+                       timeout,
+                       tail_events=None,
+                       execution=None):
     """
     Wait for execution to end.
+    The latest execution of the workflow is looked up once, and then only
+    this execution is polled, often at first and less often as it runs.
     :param deployment_id:
     :param workflow_id:
     :param timeout:
-    :return:
+    :param tail_events: Whether to log task errors while waiting.
+        By default only with the rest backend, where it's cheap.
+    :param execution: The execution to wait for, if it was looked up.
+    :return: The execution, once it completed.
     """
     logger.info('Waiting for execution deployment ID '
                 '{0} workflow ID {1}'.format(deployment_id, workflow_id))
-    start = datetime.now()
+    deadline = datetime.now() + timedelta(seconds=timeout)
+    ex = execution or get_latest_execution(deployment_id, workflow_id)
+    if tail_events is None:
+        tail_events = rest_backend_enabled()
+    tailer = EventTailer(ex['id']) if tail_events else None
+    delays = backoff_delays(deadline=deadline)
     while True:
-        if datetime.now() - start > timedelta(seconds=timeout):
-            raise EcosystemTimeout('Test timed out.')
-        executions = executions_list(deployment_id)
-        try:
-            ex = [e for e in executions
-                  if workflow_id == e['workflow_id']][-1]
-        except (IndexError, KeyError):
-            raise EcosystemTestException(
-                'Workflow {0} for deployment {1} was not found.'.format(
-                    workflow_id, deployment_id))
-
-        if ex['status'].lower() == 'completed':
+        if tailer:
+            log_task_errors(tailer.new_events())
+        status = ex['status'].lower()
+        if status == 'completed':
             logger.info('{0}:{1} finished!'.format(deployment_id, workflow_id))
-            break
-        elif ex['status'].lower() == 'pending' or ex['status'] == 'started':
+            return ex
+        elif status in ['pending', 'started']:
             logger.info('{0}:{1} is pending/started.'.format(
                 deployment_id, workflow_id))
-        elif ex['status'].lower() == 'failed':
+        elif status == 'failed':
             raise EcosystemTestException('Execution failed {0}:{1}'.format(
                 deployment_id, workflow_id))
+        elif status == 'cancelled':
+            raise EcosystemTestException(
+                'Execution cancelled {0}:{1}'.format(
+                    deployment_id, workflow_id))
         else:
             logger.info(
                 'Execution still running. Status: {0}'.format(ex['status']))
-        sleep(5)
+        try:
+            sleep(next(delays))
+        except StopIteration:
+            raise EcosystemTimeout('Test timed out.')
+        ex = executions_get(ex['id'])
 
 
 def verify_endpoint(endpoint, endpoint_value):
@@ -466,6 +1050,7 @@ def verify_endpoint(endpoint, endpoint_value):
             e=endpoint, result=endpoint_value))
 
 
+@invalidates()
 def cleanup_on_failure(deployment_id):
     """
     Execute uninstall if a deployment failed.
@@ -482,6 +1067,7 @@ def cleanup_on_failure(deployment_id):
                 deployment_id))
 
 
+@invalidates('deployments')
 def deployment_update(deployment_id,
                       blueprint_id,
                       inputs,
@@ -515,9 +1101,17 @@ def prepare_inputs(inputs):
     logger.info("Preparing inputs...")
     if not inputs:
         yield
-    elif type(inputs) is dict:
+    elif type(inputs) is dict or os.path.isfile(inputs):
+        # The inputs are copied to the container under a name of their own,
+        # so that tests that share an inputs file don't delete it from under
+        # each other.
         with NamedTemporaryFile(mode='w+', delete=True) as outfile:
-            yaml.dump(inputs, outfile, allow_unicode=False)
+            if type(inputs) is dict:
+                yaml.dump(inputs, outfile, allow_unicode=False)
+            else:
+                with open(inputs) as infile:
+                    outfile.write(infile.read())
+            outfile.flush()
             logger.debug(
                 "temporary inputs file path {p}".format(p=outfile.name))
             inputs_on_docker = copy_file_to_docker(outfile.name)
@@ -525,12 +1119,6 @@ def prepare_inputs(inputs):
                 yield inputs_on_docker
             finally:
                 delete_file_from_docker(inputs_on_docker)
-    elif os.path.isfile(inputs):
-        inputs_on_docker = copy_file_to_docker(inputs)
-        try:
-            yield inputs_on_docker
-        finally:
-            delete_file_from_docker(inputs_on_docker)
     else:
         # It's input string or None so yield it as is.
         yield inputs
@@ -561,13 +1149,10 @@ def upload_test_plugins_dev(plugins,
         else:
             cloudify_exec(
                 'cfy plugins bundle-upload', get_json=False)
+        list_cache.invalidate('plugins')
 
-    for plugin in plugins:
-        sleep(3)
-        output = plugins_upload(plugin[0], plugin[1])
-        logger.info('Uploaded plugin: {0}'.format(output))
-    logger.info('Plugins list: {0}'.format(
-        cloudify_exec('cfy plugins list')))
+    upload_plugins(plugins)
+    logger.info('Plugins list: {0}'.format(plugins_list()))
 
 
 def cancel_multiple_executions(executions_lst, timeout, force):
@@ -16,11 +16,12 @@
 import os
 import json
 import base64
+import threading
 import subprocess
-from time import sleep
 from shlex import split
-from tempfile import NamedTemporaryFile
-from datetime import datetime, timedelta
+from functools import partial
+from contextlib import contextmanager
+from tempfile import SpooledTemporaryFile
 
 from ecosystem_tests.dorkl.constansts import (logger,
                                               TIMEOUT,
@@ -35,76 +36,160 @@ from ecosystem_tests.dorkl.constansts import (logger,
                                               BOLD,
                                               UNDERLINE)
 from ecosystem_tests.dorkl.exceptions import (EcosystemTimeout,
-                                              EcosystemTestException)
+                                              EcosystemCommandError,
+                                              EcosystemTestException,
+                                              EcosystemExecSessionError)
+from ecosystem_tests.dorkl.cache import (content_digest,
+                                         get_pushed_files_manifest)
+from ecosystem_tests.dorkl.parallel import with_test_id
+from ecosystem_tests.dorkl.timing import span, redact_command
+from ecosystem_tests.dorkl.exec_session import (exec_in_session,
+                                                exec_session_enabled)
+from ecosystem_tests.dorkl.docker_api import (API_TRANSPORT,
+                                              write_archive,
+                                              create_archive,
+                                              docker_transport,
+                                              get_docker_client)
 from ecosystem_cicd_tools.validations import validate_plugin_version
 
 DEFAULT_COLOR = os.environ.get('DEFAULT_WORKFLOW_COLOR', BOLD)
+# Command output is kept in memory up to this size, then spilled to disk.
+OUTPUT_SPOOL_SIZE = 1024 * 1024
 
 
 def handle_process(command,
                    timeout=TIMEOUT,
                    log=True,
                    detach=False,
-                   stdout_color=DEFAULT_COLOR):
-    file_obj_stdout = NamedTemporaryFile(delete=False)
-    file_obj_stderr = NamedTemporaryFile(delete=False)
-    stdout_file = open(file_obj_stdout.name, 'w')
-    stdout_file_read = open(file_obj_stdout.name, 'r')
-    stderr_file = open(file_obj_stderr.name, 'w')
-    stderr_file_read = open(file_obj_stderr.name, 'r')
-
-    popen_args = {
-        'args': split(command),
-        'stdout': stdout_file,
-        'stderr': stderr_file,
-    }
-
-    def dump_command_output():
-        if log:
-            stdout_file.flush()
-            for stdout_line in stdout_file_read.readlines():
-                logger.info(stdout_color +
-                            'Execution output: {0}'.format(stdout_line) +
-                            RESET)
-            stderr_file.flush()
-            for stderr_line in stderr_file_read.readlines():
-                logger.error(RED +
-                             'Execution error: {0}'.format(stderr_line) +
-                             RESET)
+                   stdout_color=DEFAULT_COLOR,
+                   stdin_writer=None):
+    """
+    Execute a command and stream its output to the logger.
+    :param command: The command.
+    :param timeout: How long to permit the process to run.
+    :param log: Whether to log stdout or not.
+    :param detach: Return the process instead of waiting for it.
+    :param stdout_color: Defines the default stdout output color.
+    :param stdin_writer: A function that writes the process input to
+        the file object it receives.
+    :return: The command output, or the process if detach is True.
+    """
 
-    def return_parsable_output():
-        stdout_file.flush()
-        with open(file_obj_stdout.name, 'r') as fout:
-            return '\n'.join(fout.readlines())
+    log_stdout = partial(log_output_line, stdout_color=stdout_color)
+    log_stderr = log_error_line
 
     if log:
         logger.info('Executing command {0}...'.format(command))
-    time_started = datetime.now()
-    p = subprocess.Popen(**popen_args)
+    p = subprocess.Popen(split(command),
+                         stdin=subprocess.PIPE if stdin_writer else None,
+                         stdout=subprocess.PIPE,
+                         stderr=subprocess.PIPE)
+    if stdin_writer:
+        feed_input(p.stdin, stdin_writer)
 
     if detach:
+        # Keep draining the pipes so that the process never blocks on them.
+        stream_output(p.stdout, log_line=log_stdout if log else None)
+        stream_output(p.stderr, log_line=log_stderr if log else None)
         return p
 
-    while p.poll() is None:
-        if log:
-            logger.info('Command {0} still executing...'.format(command))
-            dump_command_output()
-        if datetime.now() - time_started > timedelta(seconds=timeout):
+    stdout_buffer = SpooledTemporaryFile(max_size=OUTPUT_SPOOL_SIZE)
+    stderr_buffer = SpooledTemporaryFile(max_size=OUTPUT_SPOOL_SIZE)
+    readers = [
+        stream_output(p.stdout, stdout_buffer, log_stdout if log else None),
+        stream_output(p.stderr, stderr_buffer, log_stderr if log else None)
+    ]
+    with stdout_buffer, stderr_buffer:
+        try:
+            p.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            # Stop the process, so that its pipes close and the readers end.
+            p.kill()
+            p.wait()
             raise EcosystemTimeout('The timeout was reached.')
-        sleep(2)
-    dump_command_output()
+        finally:
+            for reader in readers:
+                reader.join()
 
-    if log:
-        logger.info('Command finished {0}...'.format(command))
+        if log:
+            logger.info('Command finished {0}...'.format(command))
 
-    if p.returncode:
-        dump_command_output()
-        raise EcosystemTestException('Command failed.'.format(p.returncode))
+        if p.returncode:
+            raise EcosystemCommandError(
+                'Command failed.',
+                p.returncode,
+                read_output(stdout_buffer, stderr_buffer))
+
+        if log:
+            logger.info('Command succeeded {0}...'.format(command))
+
+        stdout_buffer.seek(0)
+        return stdout_buffer.read().decode('utf-8', 'replace')
 
-    if log:
-        logger.info('Command succeeded {0}...'.format(command))
 
-    return return_parsable_output()
+def read_output(*buffers):
+    output = b''
+    for output_buffer in buffers:
+        output_buffer.seek(0)
+        output += output_buffer.read()
+    return output.decode('utf-8', 'replace')
+
+
+def log_output_line(line, stdout_color=DEFAULT_COLOR):
+    logger.info(stdout_color + 'Execution output: {0}'.format(line) + RESET)
+
+
+def log_error_line(line):
+    logger.error(RED + 'Execution error: {0}'.format(line) + RESET)
+
+
+def feed_input(stream, stdin_writer):
+    """
+    Write a process input in a background thread.
+    :param stream: The process stdin pipe.
+    :param stdin_writer: A function that writes to the pipe.
+    :return: The writer thread.
+    """
+
+    def write():
+        try:
+            stdin_writer(stream)
+        except (IOError, OSError) as e:
+            # The process exited early, its return code tells why.
+            logger.debug('Failed to write process input: {0}'.format(str(e)))
+        finally:
+            try:
+                stream.close()
+            except (IOError, OSError):
+                pass
+
+    writer = threading.Thread(target=with_test_id(write))
+    writer.daemon = True
+    writer.start()
+    return writer
+
+
+def stream_output(stream, output_buffer=None, log_line=None):
+    """
+    Read a process stream line by line in a background thread.
+    :param stream: The process stdout or stderr pipe.
+    :param output_buffer: A file object to collect the output in.
+    :param log_line: A function to call with every decoded line.
+    :return: The reader thread.
+    """
+
+    def read_lines():
+        for line in iter(stream.readline, b''):
+            if output_buffer is not None:
+                output_buffer.write(line)
+            if log_line:
+                log_line(line.decode('utf-8', 'replace'))
+        stream.close()
+
+    reader = threading.Thread(target=with_test_id(read_lines))
+    reader.daemon = True
+    reader.start()
+    return reader
 
 
 def docker_exec(cmd,
@@ -122,14 +207,89 @@ def docker_exec(cmd,
     :return: The command output.
     """
 
+    with span('docker_exec', command=redact_command(cmd)) as timing:
+        output = _docker_exec(cmd, timeout, log, detach, stdout_color)
+        if timing and isinstance(output, str):
+            timing.attributes['output_bytes'] = len(output.encode('utf-8'))
+        return output
+
+
+def _docker_exec(cmd, timeout, log, detach, stdout_color):
     container_name = get_manager_container_name()
-    return handle_process(
-        'docker exec {container_name} {cmd}'.format(
-            container_name=container_name, cmd=cmd),
-        timeout,
-        log,
-        detach,
-        stdout_color)
+    command = 'docker exec {container_name} {cmd}'.format(
+        container_name=container_name, cmd=cmd)
+    if docker_transport() == API_TRANSPORT and not detach:
+        return handle_container_command(
+            lambda on_stdout, on_stderr: api_exec(
+                container_name, cmd, timeout, on_stdout, on_stderr),
+            command,
+            log,
+            stdout_color)
+    if exec_session_enabled() and not detach:
+        try:
+            return handle_container_command(
+                lambda on_stdout, on_stderr: exec_in_session(
+                    container_name, cmd, timeout, on_stdout, on_stderr),
+                command,
+                log,
+                stdout_color)
+        except EcosystemExecSessionError as e:
+            logger.debug('Falling back to docker exec: {0}'.format(str(e)))
+    return handle_process(command, timeout, log, detach, stdout_color)
+
+
+def api_exec(container_name,
+             cmd,
+             timeout=TIMEOUT,
+             on_stdout=None,
+             on_stderr=None):
+    """
+    Execute command on the docker container with the Docker Engine API.
+    :param container_name: The container name.
+    :param cmd: The command.
+    :param timeout: How long to permit the command to run.
+    :param on_stdout: A function to call with every stdout line.
+    :param on_stderr: A function to call with every stderr line.
+    :return: A tuple of return code, stdout and stderr.
+    """
+
+    returncode, stdout, stderr = get_docker_client().exec_run(
+        container_name, split(cmd), timeout, on_stdout, on_stderr)
+    return (returncode,
+            stdout.decode('utf-8', 'replace'),
+            stderr.decode('utf-8', 'replace'))
+
+
+def handle_container_command(run,
+                             command,
+                             log=True,
+                             stdout_color=DEFAULT_COLOR):
+    """
+    Execute command on the docker container without a docker CLI process.
+    :param run: A function that executes the command and returns
+        the return code, stdout and stderr. It receives functions to call
+        with every stdout and stderr line, as they arrive, or None.
+    :param command: The equivalent docker exec command, for logging.
+    :param log: Whether to log stdout or not.
+    :param stdout_color: Defines the default stdout output color.
+    :return: The command output.
+    """
+
+    if log:
+        logger.info('Executing command {0}...'.format(command))
+        returncode, stdout, stderr = run(
+            partial(log_output_line, stdout_color=stdout_color),
+            log_error_line)
+        logger.info('Command finished {0}...'.format(command))
+    else:
+        returncode, stdout, stderr = run(None, None)
+    if returncode:
+        raise EcosystemCommandError('Command failed.',
+                                    returncode,
+                                    stdout + stderr)
+    if log:
+        logger.info('Command succeeded {0}...'.format(command))
+    return stdout
 
 
 def replace_file_on_manager(local_file_path, manager_file_path):
@@ -146,6 +306,7 @@ def replace_file_on_manager(local_file_path, manager_file_path):
     docker_exec('mv {file} {destination}'.format(
         file=docker_path,
         destination=manager_file_path))
+    forget_pushed_file(docker_path)
 
 
 def replace_plugin_package_on_manager(package_name,
@@ -205,15 +366,107 @@ def copy_file_to_docker(local_file_path):
     """
 
     docker_path = os.path.join('/tmp/', os.path.basename(local_file_path))
+    with skip_pushed_files({local_file_path: docker_path}) as pending:
+        if pending:
+            copy_path_to_docker(local_file_path, docker_path)
+    return docker_path
+
+
+def copy_path_to_docker(local_path, docker_path):
+    if docker_transport() == API_TRANSPORT:
+        put_archive_to_docker(
+            {local_path: os.path.basename(docker_path)},
+            os.path.dirname(docker_path))
+        return
     handle_process(
-        'docker cp {0} {1}:{2}'.format(local_file_path,
+        'docker cp {0} {1}:{2}'.format(local_path,
                                        get_manager_container_name(),
                                        docker_path))
-    return docker_path
+
+
+def copy_files_to_docker(local_paths, remote_dir='/tmp'):
+    """
+    Copy many files from the container host to the container at once.
+    The files are packed into a single tar stream, which is unpacked
+    in the container.
+    :param local_paths: A list of local file paths.
+    :param remote_dir: The directory inside the container.
+    :return: A dict of local path to the remote path inside the container.
+    """
+
+    archive_names = get_archive_names(local_paths)
+    remote_paths = {local_path: os.path.join(remote_dir, name)
+                    for local_path, name in archive_names.items()}
+    with skip_pushed_files(remote_paths) as pending:
+        pending_names = {local_path: archive_names[local_path]
+                         for local_path in pending}
+        if len(pending_names) == 1 and remote_dir == '/tmp':
+            local_path, = pending_names
+            copy_path_to_docker(local_path, remote_paths[local_path])
+        elif not pending_names:
+            pass
+        elif docker_transport() == API_TRANSPORT:
+            put_archive_to_docker(pending_names, remote_dir)
+        else:
+            handle_process(
+                'docker cp - {0}:{1}'.format(get_manager_container_name(),
+                                             remote_dir),
+                stdin_writer=partial(write_archive, pending_names))
+    return remote_paths
+
+
+def get_archive_names(local_paths):
+    """
+    Name every file by its base name, like docker cp does. Files that share
+    a base name are put in numbered directories, so they don't overwrite
+    each other.
+    :param local_paths: A list of local file paths.
+    :return: A dict of local path to the path in the archive.
+    """
+
+    archive_names = {}
+    for local_path in local_paths:
+        if local_path in archive_names:
+            continue
+        name = os.path.basename(local_path.rstrip('/'))
+        if name in archive_names.values():
+            name = os.path.join(
+                'dorkl-{0}'.format(len(archive_names)), name)
+        archive_names[local_path] = name
+    return archive_names
+
+
+def put_archive_to_docker(paths, remote_dir):
+    """
+    Copy files to the container with the Docker Engine API.
+    :param paths: A dict of local path to the path relative to remote_dir.
+    :param remote_dir: The directory inside the container.
+    :return:
+    """
+
+    logger.info('Copying {0} to {1}:{2}'.format(
+        ', '.join(paths), get_manager_container_name(), remote_dir))
+    with create_archive(paths) as archive:
+        get_docker_client().put_archive(
+            get_manager_container_name(), remote_dir, archive)
 
 
 def delete_file_from_docker(docker_path):
     docker_exec('rm -rf {destination}'.format(destination=docker_path))
+    forget_pushed_file(docker_path)
+
+
+def delete_files_from_docker(docker_paths):
+    """
+    Delete many paths in the container with a single command.
+    :param docker_paths: A list of paths inside the container.
+    """
+
+    if not docker_paths:
+        return
+    docker_exec('rm -rf {0}'.format(' '.join(docker_paths)))
+    for docker_path in docker_paths:
+        forget_pushed_file(docker_path)
 
 
 def copy_directory_to_docker(local_file_path):
@@ -226,15 +479,74 @@ def copy_directory_to_docker(local_file_path):
     local_dir = os.path.dirname(local_file_path)
     dir_name = os.path.basename(local_dir)
     remote_dir = os.path.join('/tmp', dir_name)
-    try:
-        handle_process(
-            'docker cp {0} {1}:/tmp'.format(local_dir,
-                                            get_manager_container_name()))
-    except EcosystemTestException:
-        pass
+    with skip_pushed_files({local_dir: remote_dir}) as pending:
+        if pending and docker_transport() == API_TRANSPORT:
+            put_archive_to_docker({local_dir: dir_name}, '/tmp')
+        elif pending:
+            handle_process(
+                'docker cp {0} {1}:/tmp'.format(
+                    local_dir, get_manager_container_name()))
     return remote_dir
 
 
+def get_manager_container_id():
+    container_name = get_manager_container_name()
+    if docker_transport() == API_TRANSPORT:
+        return get_docker_client().inspect_container(container_name)['Id']
+    return handle_process(
+        'docker inspect --format {{{{.Id}}}} {0}'.format(container_name),
+        log=False).strip()
+
+
+def get_manager_files_manifest():
+    return get_pushed_files_manifest(get_manager_container_name(),
+                                     get_manager_container_id)
+
+
+@contextmanager
+def skip_pushed_files(paths):
+    """
+    Skip files that were already pushed to the container with the same
+    content.
+    :param paths: A dict of local path to the remote path.
+    :return: A dict of the local paths that still need to be copied,
+        to their remote path. They are recorded once the block succeeds.
+    """
+
+    manifest = get_manager_files_manifest()
+    if not manifest:
+        yield paths
+        return
+    digests = {local_path: content_digest(local_path)
+               for local_path in paths}
+    unchanged = manifest.unchanged(
+        {paths[local_path]: digest for local_path, digest in digests.items()})
+    if unchanged:
+        # The manifest only knows what we did, check that nobody else
+        # removed the files since.
+        try:
+            docker_exec('ls -d {0}'.format(' '.join(sorted(unchanged))),
+                        log=False)
+        except EcosystemTestException:
+            unchanged = set()
+    pending = {}
+    for local_path, remote_path in paths.items():
+        if remote_path in unchanged:
+            logger.info('Skipping copy of {0}, {1} is up to date.'.format(
+                local_path, remote_path))
+        else:
+            pending[local_path] = remote_path
+    yield pending
+    manifest.record({remote_path: digests[local_path]
+                     for local_path, remote_path in pending.items()})
+
+
+def forget_pushed_file(docker_path):
+    manifest = get_manager_files_manifest()
+    if manifest:
+        manifest.forget(docker_path)
+
+
 def cloudify_exec(cmd,
                   get_json=True,
                   timeout=TIMEOUT,
@@ -19,7 +19,28 @@ logger = logging.getLogger('logger')
 logger.setLevel(logging.DEBUG)
 
 MANAGER_CONTAINER_ENVAR_NAME = 'MANAGER_CONTAINER'
+EXEC_SESSION_ENVAR_NAME = 'ECOSYSTEM_TEST_EXEC_SESSION'
+DOCKER_TRANSPORT_ENVAR_NAME = 'ECOSYSTEM_TEST_DOCKER_TRANSPORT'
+DOCKER_SOCKET_ENVAR_NAME = 'ECOSYSTEM_TEST_DOCKER_SOCKET'
+CACHE_DIR_ENVAR_NAME = 'ECOSYSTEM_TEST_CACHE_DIR'
+PUSH_CACHE_ENVAR_NAME = 'ECOSYSTEM_TEST_PUSH_CACHE'
+LIST_CACHE_TTL_ENVAR_NAME = 'ECOSYSTEM_TEST_LIST_CACHE_TTL'
+DIAGNOSTICS_ENVAR_NAME = 'ECOSYSTEM_TEST_DIAGNOSTICS'
+UPLOAD_WORKERS_ENVAR_NAME = 'ECOSYSTEM_TEST_UPLOAD_WORKERS'
+MANAGER_BACKEND_ENVAR_NAME = 'ECOSYSTEM_TEST_MANAGER_BACKEND'
+MANAGER_HOST_ENVAR_NAME = 'ECOSYSTEM_TEST_MANAGER_HOST'
+MANAGER_USERNAME_ENVAR_NAME = 'ECOSYSTEM_TEST_MANAGER_USERNAME'
+MANAGER_PASSWORD_ENVAR_NAME = 'ECOSYSTEM_TEST_MANAGER_PASSWORD'
+MANAGER_TENANT_ENVAR_NAME = 'ECOSYSTEM_TEST_MANAGER_TENANT'
+TEST_ID_ENVAR_NAME = '__ECOSYSTEM_TEST_ID'
+REPORT_DIR_ENVAR_NAME = 'ECOSYSTEM_TEST_REPORT_DIR'
+IMAGE_CACHE_ENVAR_NAME = 'ECOSYSTEM_TEST_IMAGE_CACHE'
+MANAGER_REST_PORT = 80
 TIMEOUT = 2000
+# How many seconds to keep a deployment in the deployment pool.
+DEFAULT_POOL_MAX_AGE = 3600
+# How many teardown jobs to run at a time in the background.
+DEFAULT_CLEANUP_WORKERS = 4
 VPN_CONFIG_PATH = '/tmp/vpn.conf'
 LICENSE_ENVAR_NAME = 'TEST_LICENSE'
 
@@ -33,6 +54,10 @@ UNINSTALL_FORCE = 'uninstall-force'
 ROLLBACK_FULL = 'rollback-full'
 ROLLBACK_PARTIAL = 'rollback-partial'
 
+DIAGNOSTICS_ALWAYS = 'always'
+DIAGNOSTICS_DEBUG = 'debug'
+DIAGNOSTICS_ON_FAILURE = 'on-failure'
+
 RED = '\033[91m'
 GREEN = '\033[92m'
 YELLOW = '\033[93m'
@@ -0,0 +1,150 @@
+########
+# Copyright (c) 2014-2022 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Keep installed deployments, to run the checks of later tests on them.
+
+A deployment that passed its test is kept warm in the pool instead of being
+uninstalled, and is leased to the next test with the same blueprint
+fingerprint, which only runs its user defined check. The pool belongs to
+one manager container, and lives in the local cache.
+"""
+
+import os
+import threading
+from time import time
+
+from ecosystem_tests.dorkl.constansts import logger, DEFAULT_POOL_MAX_AGE
+from ecosystem_tests.dorkl.cache import (get_cache_dir,
+                                         read_json_file,
+                                         write_json_file)
+
+
+class DeploymentPool(object):
+    """
+    Warm deployments by ID, with the fingerprint of the blueprint and
+    inputs that installed them, when they were added, and the test that
+    leases them, if any.
+    """
+
+    def __init__(self, path, size=1, max_age=DEFAULT_POOL_MAX_AGE):
+        """
+        :param path: The pool file.
+        :param size: How many deployments to keep for each fingerprint.
+        :param max_age: How many seconds to keep a deployment.
+        """
+        self.path = path
+        self.size = size
+        self.max_age = max_age
+        self._lock = threading.Lock()
+
+    def _read(self):
+        return read_json_file(self.path, {})
+
+    def _write(self, deployments):
+        try:
+            write_json_file(self.path, deployments)
+        except (IOError, OSError) as e:
+            logger.warning('Failed to save the deployment pool: {0}'.format(
+                str(e)))
+
+    def deployments(self, fingerprint=None):
+        return sorted(
+            [deployment_id for deployment_id, entry in self._read().items()
+             if fingerprint in [None, entry['fingerprint']]])
+
+    def take_expired(self):
+        """
+        Remove the deployments that are older than the max age, and aren't
+        leased.
+        :return: Their IDs, to uninstall.
+        """
+        with self._lock:
+            deployments = self._read()
+            expired = [deployment_id
+                       for deployment_id, entry in deployments.items()
+                       if not entry.get('leased_by') and
+                       time() - entry['added_at'] > self.max_age]
+            for deployment_id in expired:
+                del deployments[deployment_id]
+            if expired:
+                self._write(deployments)
+        return sorted(expired)
+
+    def lease(self, fingerprint, test_id):
+        """
+        :return: The ID of the oldest free deployment with the fingerprint,
+            now leased to the test, or None.
+        """
+        with self._lock:
+            deployments = self._read()
+            free = sorted(
+                [(entry['added_at'], deployment_id)
+                 for deployment_id, entry in deployments.items()
+                 if entry['fingerprint'] == fingerprint and
+                 not entry.get('leased_by')])
+            if not free:
+                return
+            deployment_id = free[0][1]
+            deployments[deployment_id].update(leased_by=test_id,
+                                              leased_at=time())
+            self._write(deployments)
+        return deployment_id
+
+    def release(self, deployment_id):
+        with self._lock:
+            deployments = self._read()
+            if deployment_id in deployments:
+                deployments[deployment_id].update(leased_by=None,
+                                                  leased_at=None)
+                self._write(deployments)
+
+    def add(self, fingerprint, deployment_id):
+        """
+        Keep a deployment, unless the pool has enough of its fingerprint.
+        :return: Whether the deployment was kept.
+        """
+        with self._lock:
+            deployments = self._read()
+            if deployment_id not in deployments and len(
+                    [entry for entry in deployments.values()
+                     if entry['fingerprint'] == fingerprint]) >= self.size:
+                return False
+            deployments[deployment_id] = {'fingerprint': fingerprint,
+                                          'added_at': time(),
+                                          'leased_by': None,
+                                          'leased_at': None}
+            self._write(deployments)
+        return True
+
+    def remove(self, deployment_id):
+        with self._lock:
+            deployments = self._read()
+            if deployments.pop(deployment_id, None):
+                self._write(deployments)
+
+
+def load_deployment_pool(size, max_age, get_container_id):
+    """
+    :param size: How many deployments to keep for each fingerprint.
+    :param max_age: How many seconds to keep a deployment.
+    :param get_container_id: A function that returns the manager
+        container ID.
+    :return: The pool of the manager container.
+    """
+    return DeploymentPool(
+        os.path.join(get_cache_dir('pool'),
+                     '{0}.json'.format(get_container_id())),
+        size,
+        max_age)
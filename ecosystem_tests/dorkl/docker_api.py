@@ -0,0 +1,432 @@
+########
+# Copyright (c) 2014-2022 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""A small Docker Engine API client over the docker unix socket.
+
+Selected with ECOSYSTEM_TEST_DOCKER_TRANSPORT=api, instead of spawning the
+docker CLI for every interaction with the manager container.
+"""
+
+import os
+import json
+import socket
+import struct
+import tarfile
+import threading
+from datetime import datetime, timedelta
+from tempfile import SpooledTemporaryFile
+
+try:
+    from http.client import HTTPConnection  # Python 3
+    from urllib.parse import quote, urlencode
+except ImportError:
+    from httplib import HTTPConnection  # Python 2
+    from urllib import quote, urlencode
+
+from ecosystem_tests.dorkl.constansts import (logger,
+                                              TIMEOUT,
+                                              DOCKER_SOCKET_ENVAR_NAME,
+                                              DOCKER_TRANSPORT_ENVAR_NAME)
+from ecosystem_tests.dorkl.exceptions import (EcosystemTimeout,
+                                              EcosystemTestException)
+
+CLI_TRANSPORT = 'cli'
+API_TRANSPORT = 'api'
+DEFAULT_DOCKER_SOCKET = '/var/run/docker.sock'
+STDOUT_STREAM = 1
+STDERR_STREAM = 2
+FRAME_HEADER_SIZE = 8
+MAX_IDLE_CONNECTIONS = 4
+# Archives are kept in memory up to this size, then spilled to disk.
+ARCHIVE_SPOOL_SIZE = 16 * 1024 * 1024
+
+
+def docker_transport():
+    """
+    Which transport to use for talking to docker: cli or api.
+    :return: The transport name.
+    """
+    transport = os.environ.get(
+        DOCKER_TRANSPORT_ENVAR_NAME, CLI_TRANSPORT).lower()
+    if transport not in [CLI_TRANSPORT, API_TRANSPORT]:
+        raise EcosystemTestException(
+            '{0} should be one of: {1}, {2}.'.format(
+                DOCKER_TRANSPORT_ENVAR_NAME, CLI_TRANSPORT, API_TRANSPORT))
+    return transport
+
+
+class DockerEngineError(EcosystemTestException):
+
+    def __init__(self, status, message):
+        super(DockerEngineError, self).__init__(
+            'Docker engine API error {0}: {1}'.format(status, message))
+        self.status = status
+
+
+class UnixHTTPConnection(HTTPConnection):
+    """HTTP connection over a unix socket."""
+
+    def __init__(self, socket_path, timeout=None):
+        HTTPConnection.__init__(self, 'localhost', timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.socket_path)
+        self.sock = sock
+
+
+class DockerEngineClient(object):
+    """Docker Engine API client with a pool of keep-alive connections."""
+
+    def __init__(self, socket_path=None, max_idle=MAX_IDLE_CONNECTIONS):
+        self.socket_path = socket_path or os.environ.get(
+            DOCKER_SOCKET_ENVAR_NAME, DEFAULT_DOCKER_SOCKET)
+        self.max_idle = max_idle
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def _get_connection(self):
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        return UnixHTTPConnection(self.socket_path)
+
+    def _put_connection(self, connection):
+        with self._lock:
+            if len(self._idle) < self.max_idle:
+                self._idle.append(connection)
+                return
+        connection.close()
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            connection.close()
+
+    def _send(self,
+              method,
+              path,
+              params=None,
+              body=None,
+              headers=None,
+              timeout=None):
+        if params:
+            path = '{0}?{1}'.format(path, urlencode(params))
+        headers = dict(headers or {})
+        if timeout:
+            connection = UnixHTTPConnection(self.socket_path, timeout)
+        else:
+            connection = self._get_connection()
+        for attempt in range(2):
+            try:
+                connection.request(method, path, body=body, headers=headers)
+                return connection, connection.getresponse()
+            except (socket.error, IOError) as e:
+                # A pooled connection may have been closed by the daemon.
+                connection.close()
+                if attempt or hasattr(body, 'read'):
+                    raise EcosystemTestException(
+                        'Unable to reach the docker engine at {0}: '
+                        '{1}'.format(self.socket_path, str(e)))
+                connection = UnixHTTPConnection(self.socket_path)
+
+    def request(self, method, path, params=None, body=None, headers=None):
+        """
+        Send a request and read the whole response.
+        :return: The decoded JSON response, or the raw body.
+        """
+        connection, response = self._send(
+            method, path, params, body, headers)
+        data = response.read()
+        if response.will_close:
+            connection.close()
+        else:
+            self._put_connection(connection)
+        if response.status >= 400:
+            raise DockerEngineError(response.status, _error_message(data))
+        if response.getheader('Content-Type', '').startswith(
+                'application/json') and data:
+            return json.loads(data.decode('utf-8'))
+        return data
+
+    def stream(self,
+               method,
+               path,
+               params=None,
+               body=None,
+               headers=None,
+               timeout=None):
+        """
+        Send a request and return the response for reading.
+        The connection is not reused.
+        """
+        connection, response = self._send(
+            method, path, params, body, headers, timeout)
+        if response.status >= 400:
+            data = response.read()
+            connection.close()
+            raise DockerEngineError(response.status, _error_message(data))
+        return response
+
+    def containers(self, all=True):
+        return self.request('GET', '/containers/json',
+                            params={'all': int(all)})
+
+    def inspect_container(self, container):
+        return self.request('GET', '/containers/{0}/json'.format(
+            quote(container)))
+
+    def create_container(self, name, config):
+        return self.request('POST', '/containers/create',
+                            params={'name': name},
+                            body=json.dumps(config),
+                            headers={'Content-Type': 'application/json'})
+
+    def start_container(self, container):
+        return self.request('POST', '/containers/{0}/start'.format(
+            quote(container)))
+
+    def remove_container(self, container, force=False):
+        return self.request('DELETE', '/containers/{0}'.format(
+            quote(container)), params={'force': int(force)})
+
+    def images(self):
+        return self.request('GET', '/images/json')
+
+    def inspect_image(self, image):
+        return self.request('GET', '/images/{0}/json'.format(quote(image)))
+
+    def commit(self, container, repository, tag, labels=None):
+        """
+        Create an image from a container, paused while it is copied.
+        :return: The image ID.
+        """
+        return self.request('POST', '/commit',
+                            params={'container': container,
+                                    'repo': repository,
+                                    'tag': tag,
+                                    'pause': 1},
+                            body=json.dumps({'Labels': labels or {}}),
+                            headers={'Content-Type': 'application/json'})['Id']
+
+    def remove_image(self, image):
+        return self.request('DELETE', '/images/{0}'.format(quote(image)))
+
+    def load_image(self, fileobj):
+        """
+        Stream an image archive to the daemon.
+        :param fileobj: A file object with the output of docker save.
+        :return: The loaded image name.
+        """
+        headers = {'Content-Type': 'application/x-tar'}
+        headers.update(_length_header(fileobj))
+        response = self.stream('POST', '/images/load',
+                               params={'quiet': 1},
+                               body=fileobj,
+                               headers=headers)
+        image_name = None
+        for line in response.read().decode('utf-8').splitlines():
+            if not line.strip():
+                continue
+            message = json.loads(line)
+            if 'error' in message:
+                raise DockerEngineError(response.status, message['error'])
+            logger.info('Docker load: {0}'.format(
+                message.get('stream', '').strip()))
+            if 'Loaded image' in message.get('stream', ''):
+                image_name = message['stream'].split()[-1]
+        return image_name
+
+    def put_archive(self, container, path, fileobj):
+        """
+        Extract a tar archive into a container directory.
+        :param container: The container name.
+        :param path: The directory in the container.
+        :param fileobj: A file object with a tar archive.
+        """
+        headers = {'Content-Type': 'application/x-tar'}
+        headers.update(_length_header(fileobj))
+        return self.request('PUT', '/containers/{0}/archive'.format(
+            quote(container)), params={'path': path},
+            body=fileobj, headers=headers)
+
+    def exec_run(self,
+                 container,
+                 cmd,
+                 timeout=TIMEOUT,
+                 on_stdout=None,
+                 on_stderr=None):
+        """
+        Execute a command in a container.
+        :param container: The container name.
+        :param cmd: The command argument list.
+        :param timeout: How long to permit the command to run.
+        :param on_stdout: A function to call with every stdout line, as it
+            arrives.
+        :param on_stderr: The same for stderr.
+        :return: A tuple of return code, stdout and stderr.
+        """
+        exec_instance = self.request(
+            'POST', '/containers/{0}/exec'.format(quote(container)),
+            body=json.dumps({'AttachStdout': True,
+                             'AttachStderr': True,
+                             'Cmd': cmd}),
+            headers={'Content-Type': 'application/json'})
+        response = self.stream(
+            'POST', '/exec/{0}/start'.format(exec_instance['Id']),
+            body=json.dumps({'Detach': False, 'Tty': False}),
+            headers={'Content-Type': 'application/json'},
+            timeout=timeout)
+        try:
+            stdout, stderr = demultiplex_stream(
+                response,
+                timeout,
+                {STDOUT_STREAM: OutputLines(on_stdout),
+                 STDERR_STREAM: OutputLines(on_stderr)})
+        except socket.timeout:
+            raise EcosystemTimeout('The timeout was reached.')
+        finally:
+            response.close()
+        result = self.request('GET', '/exec/{0}/json'.format(
+            exec_instance['Id']))
+        return result.get('ExitCode'), stdout, stderr
+
+
+def demultiplex_stream(response, timeout=TIMEOUT, lines=None):
+    """
+    Split a multiplexed attach stream into stdout and stderr.
+    Each frame starts with a header of the stream type and the frame size.
+    :param response: A file like object with the attach stream.
+    :param timeout: How long to permit the stream to run.
+    :param lines: A dict of stream type to the OutputLines that get its
+        frames as they arrive.
+    :return: A tuple of stdout and stderr bytes.
+    """
+
+    lines = lines or {}
+    deadline = datetime.now() + timedelta(seconds=timeout)
+    output = {STDOUT_STREAM: [], STDERR_STREAM: []}
+    while True:
+        if datetime.now() > deadline:
+            raise EcosystemTimeout('The timeout was reached.')
+        header = _read_exactly(response, FRAME_HEADER_SIZE)
+        if not header:
+            break
+        stream_type, size = struct.unpack('>BxxxL', header)
+        frame = _read_exactly(response, size)
+        output.setdefault(stream_type, []).append(frame)
+        if stream_type in lines:
+            lines[stream_type].write(frame)
+    for stream_lines in lines.values():
+        stream_lines.flush()
+    return b''.join(output[STDOUT_STREAM]), b''.join(output[STDERR_STREAM])
+
+
+class OutputLines(object):
+    """Split the chunks of an output stream into lines.
+
+    A frame can end in the middle of a line, the rest of the line is kept
+    until it is complete, or until the stream ends.
+    """
+
+    def __init__(self, on_line=None):
+        self.on_line = on_line
+        self._partial = b''
+
+    def write(self, data):
+        if not self.on_line:
+            return
+        lines = (self._partial + data).splitlines(True)
+        self._partial = b''
+        if lines and not lines[-1].endswith(b'\n'):
+            self._partial = lines.pop()
+        for line in lines:
+            self.on_line(line.decode('utf-8', 'replace'))
+
+    def flush(self):
+        if self.on_line and self._partial:
+            self.on_line(self._partial.decode('utf-8', 'replace'))
+        self._partial = b''
+
+
+def _read_exactly(response, size):
+    data = b''
+    while len(data) < size:
+        chunk = response.read(size - len(data))
+        if not chunk:
+            break
+        data += chunk
+    return data
+
+
+def _length_header(fileobj):
+    if isinstance(fileobj, bytes):
+        return {'Content-Length': str(len(fileobj))}
+    try:
+        position = fileobj.tell()
+        fileobj.seek(0, os.SEEK_END)
+        size = fileobj.tell() - position
+        fileobj.seek(position)
+    except (AttributeError, IOError, OSError):
+        # http.client sends bodies of unknown length chunked.
+        return {}
+    return {'Content-Length': str(size)}
+
+
+def _error_message(data):
+    try:
+        return json.loads(data.decode('utf-8')).get('message', data)
+    except (ValueError, AttributeError):
+        return data
+
+
+def create_archive(paths):
+    """
+    Pack local files and directories into a tar archive.
+    :param paths: A dict of local path to the name in the archive.
+    :return: A file object positioned at the start of the archive.
+    """
+
+    archive = SpooledTemporaryFile(max_size=ARCHIVE_SPOOL_SIZE)
+    write_archive(paths, archive)
+    archive.seek(0)
+    return archive
+
+
+def write_archive(paths, fileobj):
+    """
+    Stream local files and directories as a tar archive.
+    :param paths: A dict of local path to the name in the archive.
+    :param fileobj: A writable file object, it doesn't need to be seekable.
+    """
+
+    with tarfile.open(fileobj=fileobj, mode='w|') as tar:
+        for local_path, arcname in paths.items():
+            tar.add(local_path, arcname=arcname)
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_docker_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = DockerEngineClient()
+        return _client
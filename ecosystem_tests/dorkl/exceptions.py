@@ -20,3 +20,15 @@ class EcosystemTestException(Exception):
 
 class EcosystemTimeout(Exception):
     pass
+
+
+class EcosystemExecSessionError(EcosystemTestException):
+    pass
+
+
+class EcosystemCommandError(EcosystemTestException):
+
+    def __init__(self, message, returncode=None, output=''):
+        super(EcosystemCommandError, self).__init__(message)
+        self.returncode = returncode
+        self.output = output
@@ -0,0 +1,277 @@
+########
+# Copyright (c) 2014-2022 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import uuid
+import atexit
+import threading
+import subprocess
+from shlex import split, quote
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+try:
+    from queue import Queue, Empty  # Python 3
+except ImportError:
+    from Queue import Queue, Empty  # Python 2
+
+from ecosystem_tests.dorkl.constansts import (logger,
+                                              TIMEOUT,
+                                              EXEC_SESSION_ENVAR_NAME)
+from ecosystem_tests.dorkl.exceptions import (EcosystemTimeout,
+                                              EcosystemTestException,
+                                              EcosystemExecSessionError)
+
+SESSION_SHELL = 'sh'
+SESSION_START_TIMEOUT = 30
+MAX_IDLE_SESSIONS = 4
+
+
+def exec_session_enabled():
+    """
+    Whether docker_exec should reuse a persistent shell in the container.
+    Set ECOSYSTEM_TEST_EXEC_SESSION=false to always spawn docker exec.
+    :return: Bool.
+    """
+    return os.environ.get(EXEC_SESSION_ENVAR_NAME, 'true').lower() not in \
+        ['false', 'no', 'off', '0']
+
+
+class ExecSession(object):
+    """A long-lived shell that receives framed commands.
+
+    Every command is written to the shell's stdin followed by a marker
+    which carries a unique token and the exit code, on stdout and on
+    stderr. Reading both streams up to the marker gives the command output
+    without spawning a new process.
+    """
+
+    def __init__(self, argv):
+        self.argv = argv
+        self._process = None
+        self._stdout = Queue()
+        self._stderr = Queue()
+
+    @classmethod
+    def for_container(cls, container_name, shell=SESSION_SHELL):
+        return cls(['docker', 'exec', '-i', container_name, shell])
+
+    @property
+    def alive(self):
+        return self._process is not None and self._process.poll() is None
+
+    def start(self, timeout=SESSION_START_TIMEOUT):
+        try:
+            self._process = subprocess.Popen(self.argv,
+                                             stdin=subprocess.PIPE,
+                                             stdout=subprocess.PIPE,
+                                             stderr=subprocess.PIPE)
+        except OSError as e:
+            raise EcosystemExecSessionError(
+                'Unable to start exec session {0}: {1}'.format(
+                    ' '.join(self.argv), str(e)))
+        for stream, lines in [(self._process.stdout, self._stdout),
+                              (self._process.stderr, self._stderr)]:
+            reader = threading.Thread(target=self._read_lines,
+                                      args=(stream, lines))
+            reader.daemon = True
+            reader.start()
+        # Make sure the shell really answers before we rely on it.
+        try:
+            self.run('true', timeout=timeout)
+        except (EcosystemTimeout, EcosystemTestException) as e:
+            raise EcosystemExecSessionError(
+                'Exec session {0} did not start: {1}'.format(
+                    ' '.join(self.argv), str(e)))
+
+    def close(self):
+        if not self._process:
+            return
+        try:
+            self._process.stdin.close()
+        except (IOError, OSError):
+            pass
+        if self._process.poll() is None:
+            self._process.kill()
+        self._process.wait()
+
+    def run(self, cmd, timeout=TIMEOUT, on_stdout=None, on_stderr=None):
+        """
+        Execute a command in the session.
+        :param cmd: The command, parsed like a docker exec argument list.
+        :param timeout: How long to permit the command to run.
+        :param on_stdout: A function to call with every stdout line, as it
+            arrives.
+        :param on_stderr: The same for stderr, which is read after stdout.
+        :return: A tuple of return code, stdout and stderr.
+        """
+
+        if not self.alive:
+            raise EcosystemExecSessionError('The exec session is not alive.')
+        token = uuid.uuid4().hex
+        script = '( {cmd} ) </dev/null; ' \
+                 '__rc=$?; ' \
+                 'printf "\\n%s %d\\n" {token} $__rc; ' \
+                 'printf "\\n%s\\n" {token} >&2\n'.format(
+                     cmd=' '.join(quote(arg) for arg in split(cmd)),
+                     token=token)
+        try:
+            self._process.stdin.write(script.encode('utf-8'))
+            self._process.stdin.flush()
+        except (IOError, OSError) as e:
+            raise EcosystemExecSessionError(
+                'Unable to write to the exec session: {0}'.format(str(e)))
+        deadline = datetime.now() + timedelta(seconds=timeout)
+        try:
+            stdout, marker = self._read_frame(
+                self._stdout, token, deadline, on_stdout)
+            stderr, _ = self._read_frame(
+                self._stderr, token, deadline, on_stderr)
+        except EcosystemTimeout:
+            # The shell is still busy with the command, it can't be reused.
+            self.close()
+            raise
+        return int(marker.split()[-1]), stdout, stderr
+
+    def _read_frame(self, lines, token, deadline, on_line=None):
+        chunks = []
+        while True:
+            remaining = (deadline - datetime.now()).total_seconds()
+            if remaining <= 0:
+                raise EcosystemTimeout('The timeout was reached.')
+            try:
+                line = lines.get(timeout=remaining)
+            except Empty:
+                continue
+            if line is None:
+                # The command may have run, so it is not safe to retry.
+                raise EcosystemTestException(
+                    'The exec session was closed unexpectedly.')
+            line = line.decode('utf-8', 'replace')
+            if line.startswith(token):
+                # Drop the newline written in front of the marker.
+                if on_line and chunks and chunks[-1][:-1]:
+                    on_line(chunks[-1][:-1])
+                return ''.join(chunks)[:-1], line.strip()
+            # The newline in front of the marker may end the last line, so
+            # a line is only passed on once the next one arrived.
+            if on_line and chunks:
+                on_line(chunks[-1])
+            chunks.append(line)
+
+    @staticmethod
+    def _read_lines(stream, lines):
+        for line in iter(stream.readline, b''):
+            lines.put(line)
+        lines.put(None)
+
+
+class ExecSessionPool(object):
+    """Idle exec sessions for one container.
+
+    A session runs a single command at a time, so concurrent callers get
+    their own session and hand it back when they are done.
+    """
+
+    def __init__(self, factory, max_idle=MAX_IDLE_SESSIONS):
+        self.factory = factory
+        self.max_idle = max_idle
+        self.available = True
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            while self._idle:
+                session = self._idle.pop()
+                if session.alive:
+                    return session
+        session = self.factory()
+        try:
+            session.start()
+        except EcosystemExecSessionError:
+            session.close()
+            # Don't try again for every command, the fallback works.
+            self.available = False
+            raise
+        return session
+
+    def release(self, session):
+        with self._lock:
+            if session.alive and len(self._idle) < self.max_idle:
+                self._idle.append(session)
+                return
+        session.close()
+
+    @contextmanager
+    def session(self):
+        session = self.acquire()
+        try:
+            yield session
+        finally:
+            self.release(session)
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for session in idle:
+            session.close()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_exec_session_pool(container_name):
+    with _pools_lock:
+        if container_name not in _pools:
+            _pools[container_name] = ExecSessionPool(
+                lambda: ExecSession.for_container(container_name))
+        return _pools[container_name]
+
+
+def exec_in_session(container_name,
+                    cmd,
+                    timeout=TIMEOUT,
+                    on_stdout=None,
+                    on_stderr=None):
+    """
+    Execute a command in a persistent session in the container.
+    :param container_name: The manager container name.
+    :param cmd: The command.
+    :param timeout: How long to permit the command to run.
+    :param on_stdout: A function to call with every stdout line.
+    :param on_stderr: A function to call with every stderr line.
+    :return: A tuple of return code, stdout and stderr.
+    """
+
+    pool = get_exec_session_pool(container_name)
+    if not pool.available:
+        raise EcosystemExecSessionError(
+            'Exec sessions are not available for {0}.'.format(
+                container_name))
+    with pool.session() as session:
+        return session.run(cmd, timeout, on_stdout, on_stderr)
+
+
+@atexit.register
+def close_exec_sessions():
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
+    if pools:
+        logger.debug('Closed exec sessions.')
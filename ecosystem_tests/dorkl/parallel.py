@@ -0,0 +1,169 @@
+########
+# Copyright (c) 2014-2022 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Run blueprint tests side by side against the same manager.
+
+Every test runs in a worker thread that knows its own test ID, so that
+its log lines can be told apart and nothing is shared through the
+environment.
+"""
+
+import os
+import logging
+import threading
+from time import time
+from functools import wraps
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+from nose.tools import nottest
+
+from ecosystem_tests.dorkl.constansts import (logger,
+                                              RED,
+                                              GREEN,
+                                              RESET,
+                                              TEST_ID_ENVAR_NAME)
+
+PASSED = 'passed'
+FAILED = 'failed'
+
+_context = threading.local()
+
+
+def current_test_id():
+    """
+    :return: The ID of the test that runs in this thread, or the one in
+        the environment.
+    """
+    return getattr(_context, 'test_id', None) or \
+        os.environ.get(TEST_ID_ENVAR_NAME)
+
+
+@nottest
+@contextmanager
+def test_id_context(test_id):
+    previous = getattr(_context, 'test_id', None)
+    _context.test_id = test_id
+    try:
+        yield
+    finally:
+        _context.test_id = previous
+
+
+def with_test_id(fn):
+    """
+    Wrap a function that runs in another thread, like a reader of command
+    output, so that it runs with the test ID of this thread.
+    """
+    test_id = getattr(_context, 'test_id', None)
+
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        with test_id_context(test_id):
+            return fn(*args, **kwargs)
+    return wrapper
+
+
+class TestIdLogFilter(logging.Filter):
+    """Prefix log lines with the ID of the test that logged them."""
+
+    def filter(self, record):
+        test_id = getattr(_context, 'test_id', None)
+        if test_id:
+            record.msg = '[{0}] {1}'.format(test_id, record.getMessage())
+            record.args = None
+        return True
+
+
+@contextmanager
+def test_id_log_prefix(*loggers):
+    log_filter = TestIdLogFilter()
+    for prefixed_logger in loggers:
+        prefixed_logger.addFilter(log_filter)
+    try:
+        yield
+    finally:
+        for prefixed_logger in loggers:
+            prefixed_logger.removeFilter(log_filter)
+
+
+class TestResult(object):
+
+    def __init__(self, test_id, blueprint, status, duration, error=None):
+        self.test_id = test_id
+        self.blueprint = blueprint
+        self.status = status
+        self.duration = duration
+        self.error = error
+
+
+@nottest
+def run_test(test_id, blueprint, test_fn):
+    """
+    Run a test in the context of its test ID.
+    :param test_id: The test ID.
+    :param blueprint: The blueprint path.
+    :param test_fn: A function that runs the test, and may return a
+        status other than passed, like a cached pass.
+    :return: A TestResult.
+    """
+    start = time()
+    with test_id_context(test_id):
+        try:
+            status = test_fn() or PASSED
+        except Exception as e:
+            logger.error('Test {0} failed: {1}'.format(test_id, str(e)))
+            return TestResult(test_id, blueprint, FAILED, time() - start,
+                              str(e))
+    return TestResult(test_id, blueprint, status, time() - start)
+
+
+@nottest
+def run_tests_in_parallel(tests, test_fn, workers, *loggers):
+    """
+    Run tests in a pool of worker threads. A failed test doesn't stop
+    the others.
+    :param tests: A list of blueprint path and test ID pairs.
+    :param test_fn: A function that runs a test from its blueprint path
+        and test ID.
+    :param workers: How many tests to run at a time.
+    :param loggers: Loggers to prefix with the test ID.
+    :return: A list of TestResult, in the order of the tests.
+    """
+    logger.info('Running {0} tests, {1} at a time.'.format(
+        len(tests), workers))
+    with test_id_log_prefix(logger, *loggers):
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(
+                lambda test: run_test(
+                    test[1], test[0], lambda: test_fn(*test)),
+                tests))
+
+
+@nottest
+def log_test_summary(results):
+    failed = [r for r in results if r.status == FAILED]
+    passed = [r for r in results if r.status == PASSED]
+    lines = ['Test summary: {0} passed, {1} failed, {2} cached.'.format(
+        len(passed), len(failed), len(results) - len(passed) - len(failed))]
+    for result in results:
+        color = RED if result.status == FAILED else GREEN
+        line = '{0}{1}{2} {3} ({4}) in {5:.1f}s'.format(
+            color, result.status.upper(), RESET, result.test_id,
+            result.blueprint, result.duration)
+        if result.error:
+            line += ': {0}'.format(result.error)
+        lines.append(line)
+    logger.info('\n'.join(lines))
@@ -0,0 +1,177 @@
+########
+# Copyright (c) 2014-2022 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import json
+import tarfile
+import hashlib
+import zipfile
+import threading
+
+try:
+    from urllib.parse import urlparse, unquote  # Python 3
+except ImportError:
+    from urlparse import urlparse  # Python 2
+    from urllib import unquote
+
+from wagon import show
+
+from ecosystem_tests.dorkl.constansts import logger
+from ecosystem_tests.dorkl.cache import (file_digest,
+                                         get_cache_dir,
+                                         read_json_file,
+                                         write_json_file)
+
+WAGON_METADATA_FILE = 'package.json'
+# Build tags of wagon names that are a distribution, not a platform tag.
+KNOWN_DISTRIBUTIONS = ['centos', 'redhat', 'rhel', 'rocky', 'almalinux',
+                       'ubuntu', 'debian', 'amzn', 'fedora']
+
+
+def plugin_key(package_name, package_version, distribution):
+    """
+    The identity of a plugin, the same for a wagon and an uploaded plugin.
+    :return: A tuple of name, version and distribution.
+    """
+    return ((package_name or '').lower().replace('_', '-'),
+            package_version or '',
+            (distribution or '').lower())
+
+
+def manager_plugin_key(plugin):
+    """
+    The plugin key of a plugin on the manager. A plugin without a
+    distribution is identified by its plugin YAML URL path instead, which
+    mentions the distribution.
+    """
+    return plugin_key(
+        plugin.get('package_name'),
+        plugin.get('package_version'),
+        plugin.get('distribution') or plugin.get('yaml_url_path'))
+
+
+def wagon_key_from_metadata(metadata):
+    return plugin_key(
+        metadata.get('package_name'),
+        metadata.get('package_version'),
+        metadata.get('build_server_os_properties', {}).get('distribution'))
+
+
+def wagon_key_from_name(wagon_name):
+    """
+    Parse a wagon file name, which is built from the package name, version,
+    build tag, python versions, "none" and the platform. Cloudify plugin
+    wagons use the distribution and release as the build tag, for example:
+    cloudify_aws_plugin-2.12.0-centos-Core-py36-none-linux_x86_64.wgn
+    :param wagon_name: The file name.
+    :return: The plugin key, or None if the name has no distribution.
+    """
+    if not wagon_name.endswith('.wgn'):
+        return
+    tags = wagon_name[:-len('.wgn')].split('-')
+    if len(tags) < 6 or tags[-2] != 'none' or \
+            tags[2].lower() not in KNOWN_DISTRIBUTIONS:
+        return
+    return plugin_key(tags[0], tags[1], tags[2])
+
+
+def read_wagon_metadata(wagon_path):
+    """
+    Read the metadata of a local wagon without extracting it.
+    """
+    if zipfile.is_zipfile(wagon_path):
+        with zipfile.ZipFile(wagon_path) as archive:
+            for name in archive.namelist():
+                if _is_metadata_file(name):
+                    return json.loads(archive.read(name).decode('utf-8'))
+    else:
+        with tarfile.open(wagon_path, 'r:*') as archive:
+            for member in archive:
+                if _is_metadata_file(member.name):
+                    return json.load(archive.extractfile(member))
+    # Let wagon tell what's wrong with it.
+    return show(wagon_path)
+
+
+def _is_metadata_file(name):
+    parts = name.strip('/').split('/')
+    return len(parts) == 2 and parts[1] == WAGON_METADATA_FILE
+
+
+_wagon_keys = {}
+_wagon_keys_lock = threading.Lock()
+
+
+def wagon_key(wagon_path):
+    """
+    Get the plugin key of a local or remote wagon.
+    Keys are cached by the file content hash, or by the URL. The name of a
+    remote wagon is enough, otherwise it is downloaded once.
+    :param wagon_path: A local path or a URL.
+    :return: The plugin key.
+    """
+    if '://' in wagon_path:
+        digest = hashlib.sha256(wagon_path.encode('utf-8')).hexdigest()
+    else:
+        digest = file_digest(wagon_path)
+    with _wagon_keys_lock:
+        if digest in _wagon_keys:
+            return _wagon_keys[digest]
+    cache_path = os.path.join(get_cache_dir('wagons'),
+                              '{0}.json'.format(digest))
+    key = read_json_file(cache_path)
+    if key:
+        key = tuple(key)
+    elif '://' in wagon_path:
+        key = wagon_key_from_name(
+            unquote(os.path.basename(urlparse(wagon_path).path))) or \
+            wagon_key_from_metadata(show(wagon_path))
+    else:
+        key = wagon_key_from_metadata(read_wagon_metadata(wagon_path))
+    try:
+        write_json_file(cache_path, list(key))
+    except (IOError, OSError) as e:
+        logger.debug('Failed to cache wagon metadata: {0}'.format(str(e)))
+    with _wagon_keys_lock:
+        _wagon_keys[digest] = key
+    return key
+
+
+class PluginInventory(object):
+    """The plugins on the manager, indexed by their version.
+
+    A wagon is on the manager if a plugin of the same version has a name
+    and distribution that contain those of the wagon.
+    """
+
+    def __init__(self, plugins):
+        self._plugins = {}
+        self._lock = threading.Lock()
+        for plugin in plugins or []:
+            self.add(manager_plugin_key(plugin))
+
+    def __contains__(self, key):
+        name, version, distribution = key
+        with self._lock:
+            return any(name in plugin_name and
+                       distribution in plugin_distribution
+                       for plugin_name, plugin_distribution in
+                       self._plugins.get(version, []))
+
+    def add(self, key):
+        name, version, distribution = key
+        with self._lock:
+            self._plugins.setdefault(version, set()).add(
+                (name, distribution))
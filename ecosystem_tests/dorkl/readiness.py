@@ -0,0 +1,156 @@
+########
+# Copyright (c) 2014-2022 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Wait until the manager answers and its services are up.
+
+A probe is a function that returns the manager status, either the REST
+/status response or the output of cfy status --json, and raises if the
+manager doesn't answer. Probes are polled with a growing, jittered delay
+until one of them reports the manager as OK, or the deadline passes.
+"""
+
+from time import sleep
+from datetime import datetime, timedelta
+
+from requests.exceptions import RequestException
+from cloudify_rest_client.exceptions import CloudifyClientError
+
+from ecosystem_tests.dorkl.constansts import logger
+from ecosystem_tests.dorkl.backoff import backoff_delays
+from ecosystem_tests.dorkl.commands import cloudify_exec
+from ecosystem_tests.dorkl.rest_client import create_rest_client
+from ecosystem_tests.dorkl.exceptions import (EcosystemTimeout,
+                                              EcosystemTestException)
+
+READY_STATUSES = ['active', 'running', 'ok']
+PROBE_TIMEOUT = 5
+PROBE_ERRORS = (EcosystemTestException,
+                RequestException,
+                CloudifyClientError,
+                ValueError)
+
+
+def service_statuses(status):
+    """
+    Get the status of every manager service.
+    :param status: The REST /status response, or cfy status --json output.
+    :return: A dict of service name to its status.
+    """
+    if isinstance(status, dict):
+        services = status.get('services') or {}
+        if isinstance(services, dict):
+            return {name: (service or {}).get('status', '')
+                    for name, service in services.items()}
+        status = services
+    return {service.get('service'): service.get('status', '')
+            for service in status or []}
+
+
+def not_ready_services(statuses, services=None):
+    """
+    :param statuses: A dict of service name to its status.
+    :param services: The services to wait for, all of them if None.
+    :return: The names of the services that are not ready, sorted.
+    """
+    return sorted(
+        name for name in (services or statuses)
+        if statuses.get(name, '').lower() not in READY_STATUSES)
+
+
+def overall_status(status):
+    """
+    :param status: The REST /status response, or cfy status --json output.
+    :return: The status of the whole manager, like OK, or None.
+    """
+    if isinstance(status, dict) and status.get('status'):
+        return status['status']
+
+
+def not_ready(status, services=None):
+    """
+    What the manager is not ready with. The manager is ready when its
+    overall status is OK, some of its services may be optional. When the
+    status has no overall status, or services are given, the services are
+    checked.
+    :param status: The REST /status response, or cfy status --json output.
+    :param services: The services to wait for.
+    :return: A list of what to wait for, empty if the manager is ready.
+    """
+    statuses = service_statuses(status)
+    overall = overall_status(status)
+    if services or overall is None:
+        return not_ready_services(statuses, services)
+    if overall.lower() in READY_STATUSES:
+        return []
+    return not_ready_services(statuses) or \
+        ['the manager status {0}'.format(overall)]
+
+
+def rest_status_probe():
+    return create_rest_client(timeout=PROBE_TIMEOUT).manager.get_status()
+
+
+def cli_status_probe():
+    status = cloudify_exec('cfy status', log=False)
+    if status is None:
+        raise EcosystemTestException('cfy status returned no JSON.')
+    return status
+
+
+def wait_for_manager(timeout, probes=None, services=None):
+    """
+    Wait until the manager is ready.
+    :param timeout: How many seconds to wait.
+    :param probes: Functions that get the manager status, tried in order
+        until one answers. The REST service and then cfy status by default.
+    :param services: The services to wait for. By default the manager
+        overall status is checked.
+    :return: A dict of service name to its status.
+    """
+
+    probes = probes or [rest_status_probe, cli_status_probe]
+    deadline = datetime.now() + timedelta(seconds=timeout)
+    delays = backoff_delays(initial=0.5, factor=2, maximum=10,
+                            deadline=deadline, jitter=0.2)
+    waiting_for = None
+    while True:
+        status = None
+        for probe in probes:
+            try:
+                status = probe()
+            except PROBE_ERRORS as e:
+                logger.debug('Manager status probe failed: {0}'.format(
+                    str(e)))
+                continue
+            break
+        if status:
+            missing = not_ready(status, services)
+            if not missing:
+                statuses = service_statuses(status)
+                logger.info('Manager is ready: {0}.'.format(', '.join(
+                    '{0}: {1}'.format(name, statuses.get(name))
+                    for name in sorted(services or statuses))))
+                return statuses
+        else:
+            missing = ['the manager to answer']
+        if missing != waiting_for:
+            waiting_for = missing
+            logger.info('Waiting for {0}.'.format(', '.join(missing)))
+        try:
+            sleep(next(delays))
+        except StopIteration:
+            raise EcosystemTimeout(
+                'The manager was not ready after {0} seconds, '
+                'waiting for: {1}.'.format(timeout, ', '.join(waiting_for)))
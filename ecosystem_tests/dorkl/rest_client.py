@@ -0,0 +1,179 @@
+########
+# Copyright (c) 2014-2022 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Talk to the manager REST API instead of the cfy CLI in the container.
+
+Selected with ECOSYSTEM_TEST_MANAGER_BACKEND=rest. The REST service is
+reached with the protocol and on the port of the cfy profile in the manager
+container, which the container publishes, and the cfy CLI is used whenever
+the REST service can't be reached.
+"""
+
+import os
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from cloudify_rest_client.client import CloudifyClient
+from cloudify_rest_client.exceptions import CloudifyClientError
+
+from ecosystem_tests.dorkl.constansts import (logger,
+                                              MANAGER_REST_PORT,
+                                              MANAGER_HOST_ENVAR_NAME,
+                                              MANAGER_BACKEND_ENVAR_NAME,
+                                              MANAGER_TENANT_ENVAR_NAME,
+                                              MANAGER_USERNAME_ENVAR_NAME,
+                                              MANAGER_PASSWORD_ENVAR_NAME)
+from ecosystem_tests.dorkl.commands import cloudify_exec
+from ecosystem_tests.dorkl.exceptions import EcosystemTestException
+
+CLI_BACKEND = 'cli'
+REST_BACKEND = 'rest'
+REST_POOL_SIZE = 10
+DEFAULT_REST_PROTOCOL = 'http'
+
+
+def manager_backend():
+    """
+    Which backend to use for talking to the manager: cli or rest.
+    :return: The backend name.
+    """
+    backend = os.environ.get(MANAGER_BACKEND_ENVAR_NAME, CLI_BACKEND).lower()
+    if backend not in [CLI_BACKEND, REST_BACKEND]:
+        raise EcosystemTestException(
+            '{0} should be one of: {1}, {2}.'.format(
+                MANAGER_BACKEND_ENVAR_NAME, CLI_BACKEND, REST_BACKEND))
+    return backend
+
+
+def manager_tenant():
+    return os.environ.get(MANAGER_TENANT_ENVAR_NAME, 'default_tenant')
+
+
+_endpoint = None
+
+
+def rest_endpoint():
+    """
+    The protocol and port of the manager REST service, from the current cfy
+    profile in the manager container. The defaults are used until the
+    profile can be read.
+    :return: A tuple of the protocol and the port, like ('https', 443).
+    """
+    global _endpoint
+    if _endpoint is not None:
+        return _endpoint
+    try:
+        profile = cloudify_exec('cfy profiles show-current', log=False)
+    except EcosystemTestException as e:
+        logger.debug('Failed to read the cfy profile: {0}'.format(str(e)))
+        profile = None
+    if isinstance(profile, list):
+        profile = profile[0] if profile else None
+    if not profile:
+        return DEFAULT_REST_PROTOCOL, MANAGER_REST_PORT
+    _endpoint = (profile.get('rest_protocol') or DEFAULT_REST_PROTOCOL,
+                 int(profile.get('rest_port') or MANAGER_REST_PORT))
+    return _endpoint
+
+
+def create_rest_client(timeout=None):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=REST_POOL_SIZE)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    protocol, port = rest_endpoint()
+    kwargs = {
+        'host': os.environ.get(MANAGER_HOST_ENVAR_NAME, 'localhost'),
+        'port': port,
+        'protocol': protocol,
+        # The manager container has a self signed certificate.
+        'trust_all': protocol == 'https',
+        'username': os.environ.get(MANAGER_USERNAME_ENVAR_NAME, 'admin'),
+        'password': os.environ.get(MANAGER_PASSWORD_ENVAR_NAME, 'admin'),
+        'tenant': manager_tenant(),
+        'timeout': timeout
+    }
+    try:
+        return CloudifyClient(session=session, **kwargs)
+    except TypeError:
+        # Older clients open a connection per request, and don't time out.
+        kwargs.pop('timeout')
+        return CloudifyClient(**kwargs)
+
+
+_client = None
+_client_lock = threading.Lock()
+_rest_available = True
+
+
+def get_rest_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = create_rest_client()
+        return _client
+
+
+def rest_backend_enabled():
+    return _rest_available and manager_backend() == REST_BACKEND
+
+
+def call_manager(rest, cli):
+    """
+    Call the manager with the selected backend.
+    :param rest: A function that receives a REST client.
+    :param cli: A function that does the same with the cfy CLI.
+    :return: The result of the function that was used.
+    """
+
+    global _rest_available
+    if rest_backend_enabled():
+        try:
+            return rest(get_rest_client())
+        except CloudifyClientError as e:
+            raise EcosystemTestException(
+                'Manager REST call failed: {0}'.format(str(e)))
+        except requests.exceptions.ConnectionError as e:
+            # Don't wait for the connection timeout on every call.
+            _rest_available = False
+            logger.warning('The manager REST service is unreachable, '
+                           'falling back to the cfy CLI: {0}'.format(str(e)))
+    return cli()
+
+
+def call_rest(rest):
+    """
+    Call the manager REST API whatever the backend is, for what the cfy CLI
+    doesn't cover.
+    :param rest: A function that receives a REST client.
+    :return: The result of the function.
+    """
+    try:
+        return rest(get_rest_client())
+    except CloudifyClientError as e:
+        raise EcosystemTestException(
+            'Manager REST call failed: {0}'.format(str(e)))
+    except requests.exceptions.ConnectionError as e:
+        raise EcosystemTestException(
+            'The manager REST service is unreachable: {0}'.format(str(e)))
+
+
+def deployment_outputs_from_rest(outputs):
+    """
+    Shape REST deployment outputs like cfy deployments outputs --json.
+    """
+    return {name: {'value': value}
+            for name, value in outputs.get('outputs', {}).items()}
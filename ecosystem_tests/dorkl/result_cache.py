@@ -0,0 +1,129 @@
+########
+# Copyright (c) 2014-2022 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Remember which blueprint tests passed, to skip them when nothing changed.
+
+A test is identified by a fingerprint of the blueprint directory, which is
+what is copied to the manager, the inputs, the manager version, the plugins
+on the manager and any other files the test runs, like nested tests.
+"""
+
+import os
+import json
+import hashlib
+from time import time
+
+from nose.tools import nottest
+
+from ecosystem_tests.dorkl.constansts import logger
+from ecosystem_tests.dorkl.cloudify_api import plugins_list, manager_version
+from ecosystem_tests.dorkl.plugin_inventory import manager_plugin_key
+from ecosystem_tests.dorkl.cache import (content_digest,
+                                         get_cache_dir,
+                                         read_json_file,
+                                         write_json_file)
+
+CACHED_PASS = 'cached-pass'
+
+
+def manager_plugin_keys():
+    return sorted(list(manager_plugin_key(plugin))
+                  for plugin in plugins_list() or [])
+
+
+@nottest
+def blueprint_test_fingerprint(blueprint_file_name, inputs, files=None):
+    """
+    :param blueprint_file_name: The blueprint path.
+    :param inputs: The inputs dict.
+    :param files: Other files that the test runs.
+    :return: The fingerprint, or None if it can't be computed, so that the
+        test runs.
+    """
+    if not os.path.isfile(blueprint_file_name):
+        return
+    try:
+        plugins = manager_plugin_keys()
+        blueprint_dir = os.path.dirname(os.path.abspath(blueprint_file_name))
+        content = {
+            'blueprint_dir': content_digest(blueprint_dir),
+            'blueprint': os.path.basename(blueprint_file_name),
+            'inputs': inputs or {},
+            'manager': manager_version(),
+            'plugins': plugins,
+            'files': {path: content_digest(path) for path in files or []
+                      if os.path.exists(path)}
+        }
+    except Exception as e:
+        logger.warning('Unable to fingerprint the test of {0}, it will '
+                       'run: {1}'.format(blueprint_file_name, str(e)))
+        return
+    return hashlib.sha256(json.dumps(
+        content, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+class ResultCache(object):
+    """The fingerprints of tests that passed."""
+
+    def __init__(self, cache_dir=None):
+        self.cache_dir = cache_dir or get_cache_dir('results')
+
+    def _path(self, fingerprint):
+        return os.path.join(self.cache_dir, '{0}.json'.format(fingerprint))
+
+    def passed(self, fingerprint):
+        """
+        :return: The record of the passing run, or None.
+        """
+        return read_json_file(self._path(fingerprint))
+
+    def record_passed(self, fingerprint, test_id, blueprint_file_name):
+        try:
+            write_json_file(self._path(fingerprint),
+                            {'test_id': test_id,
+                             'blueprint': blueprint_file_name,
+                             'passed_at': time()})
+        except (IOError, OSError) as e:
+            logger.warning('Failed to cache the test result: {0}'.format(
+                str(e)))
+
+
+@nottest
+def run_cached_test(test_id, blueprint_file_name, inputs, run, files=None):
+    """
+    Run a blueprint test, unless the same test already passed.
+    :param run: A function that runs the test.
+    :return: CACHED_PASS if the test was skipped.
+    """
+    fingerprint = blueprint_test_fingerprint(
+        blueprint_file_name, inputs, files)
+    cache = None
+    if fingerprint:
+        try:
+            cache = ResultCache()
+        except (IOError, OSError) as e:
+            logger.warning('The test results cache is unavailable: '
+                           '{0}'.format(str(e)))
+    if cache:
+        record = cache.passed(fingerprint)
+        if record:
+            logger.info('Test {0} is a cached pass, the same blueprint, '
+                        'inputs, manager and plugins passed as test '
+                        '{1}.'.format(
+                            test_id, record.get('test_id')))
+            return CACHED_PASS
+    run()
+    if cache:
+        cache.record_passed(fingerprint, test_id, blueprint_file_name)
@@ -15,6 +15,7 @@
 
 import os
 import base64
+import logging
 import traceback
 from time import sleep
 from datetime import datetime
@@ -34,6 +35,10 @@ from ecosystem_tests.dorkl.constansts import (RERUN,
                                               UNINSTALL_FORCE,
                                               VPN_CONFIG_PATH,
                                               ROLLBACK_PARTIAL,
+                                              DIAGNOSTICS_DEBUG,
+                                              DIAGNOSTICS_ALWAYS,
+                                              DIAGNOSTICS_ENVAR_NAME,
+                                              DIAGNOSTICS_ON_FAILURE,
                                               RED,
                                               GREEN,
                                               YELLOW,
@@ -43,13 +48,35 @@ from ecosystem_tests.dorkl.constansts import (RERUN,
                                               RESET,
                                               BOLD,
                                               UNDERLINE)
+from ecosystem_tests.dorkl.timing import span, timed, test_report
+from ecosystem_tests.dorkl.cleanup import schedule_cleanup
+from ecosystem_tests.dorkl.parallel import (PASSED,
+                                            FAILED,
+                                            TestResult,
+                                            test_id_context)
+from ecosystem_tests.dorkl.result_cache import blueprint_test_fingerprint
+from ecosystem_tests.dorkl.checkpoints import (INSTALL,
+                                               DELETE,
+                                               UNINSTALL,
+                                               BLUEPRINT_UPLOAD,
+                                               DEPLOYMENT_CREATE,
+                                               USER_DEFINED_CHECK,
+                                               checkpoint,
+                                               forget_test,
+                                               load_test_state,
+                                               discard_test_state,
+                                               phase_completed,
+                                               test_state_context,
+                                               current_test_state)
 from ecosystem_tests.dorkl.exceptions import (EcosystemTimeout,
                                               EcosystemTestException)
 from ecosystem_tests.dorkl.cloudify_api import (use_cfy,
                                                 license_upload,
                                                 verify_endpoint,
+                                                executions_get,
                                                 executions_list,
                                                 executions_start,
+                                                blueprints_list,
                                                 blueprint_exists,
                                                 deployment_delete,
                                                 deployment_update,
@@ -58,7 +85,13 @@ from ecosystem_tests.dorkl.cloudify_api import (use_cfy,
                                                 blueprints_upload,
                                                 cleanup_on_failure,
                                                 wait_for_execution,
+                                                execution_group_start,
+                                                deployment_group_create,
+                                                deployment_group_delete,
+                                                wait_for_group_workflow,
+                                                deployments_list,
                                                 deployments_create,
+                                                get_latest_execution,
                                                 upload_test_plugins,
                                                 create_test_secrets,
                                                 upload_test_plugins_dev,
@@ -66,8 +99,9 @@ from ecosystem_tests.dorkl.cloudify_api import (use_cfy,
                                                 get_deployment_output_by_name,
                                                 get_blueprint_id_of_deployment)
 from ecosystem_tests.dorkl.commands import (docker_exec,
-                                            cloudify_exec,
-                                            copy_file_to_docker)
+                                            forget_pushed_file,
+                                            copy_file_to_docker,
+                                            get_manager_container_id)
 
 
 def prepare_test(plugins=None,
@@ -142,48 +176,120 @@ def _basic_blueprint_test(blueprint_file_name,
     if inputs != '':
         inputs = inputs or os.path.join(
             os.path.dirname(blueprint_file_name), 'inputs/test-inputs.yaml')
-    logger.info('Blueprints list: {0}'.format(
-        cloudify_exec('cfy blueprints list')))
-    blueprints_upload(blueprint_file_name, test_name)
-    logger.info('Deployments list: {0}'.format(
-        cloudify_exec('cfy deployments list')))
-    deployments_create(test_name, inputs)
-    sleep(5)
-    logger.info(GREEN + 'Installing...' + RESET)
-    try:
-        executions_list(test_name)
-        executions_start('install', test_name, timeout)
-    except EcosystemTimeout:
-        # Give 5 seconds grace.
-        executions_list(test_name)
-        wait_for_execution(test_name, 'install', 10)
-    else:
-        wait_for_execution(test_name, 'install', timeout)
+    with test_report(test_name), failure_diagnostics():
+        _run_basic_blueprint_test(blueprint_file_name,
+                                  test_name,
+                                  inputs,
+                                  timeout,
+                                  endpoint_name,
+                                  endpoint_value)
+
+
+@nottest
+def _run_basic_blueprint_test(blueprint_file_name,
+                              test_name,
+                              inputs,
+                              timeout,
+                              endpoint_name,
+                              endpoint_value):
+    with span('blueprint_upload'):
+        log_diagnostics('Blueprints list', blueprints_list)
+        blueprints_upload(blueprint_file_name, test_name)
+    with span('deployment_create'):
+        log_diagnostics('Deployments list', deployments_list)
+        deployments_create(test_name, inputs, wait=True, timeout=timeout)
+    start_install_workflow(test_name, timeout)
     if endpoint_name and endpoint_value:
-        verify_endpoint(
-            get_deployment_output_by_name(
-                test_name,
-                endpoint_name
-            ), endpoint_value)
-    logger.info(BLUE + 'Uninstalling...' + RESET)
-    executions_start('uninstall', test_name, timeout)
-    wait_for_execution(test_name, 'uninstall', timeout)
+        with span('endpoint_check'):
+            verify_endpoint(
+                get_deployment_output_by_name(
+                    test_name,
+                    endpoint_name
+                ), endpoint_value)
+    with span('uninstall'):
+        logger.info(BLUE + 'Uninstalling...' + RESET)
+        executions_start('uninstall', test_name, timeout)
+        wait_for_execution(test_name, 'uninstall', timeout)
     try:
-        deployment_delete(test_name)
-        blueprints_delete(test_name)
-        delete_blueprint_from_tmp(blueprint_file_name)
+        with span('delete'):
+            deployment_delete(test_name)
+            blueprints_delete(test_name)
+            delete_blueprint_from_tmp(blueprint_file_name)
     except Exception as e:
         logger.info(RED +
                     'Failed to delete blueprint, {0}'.format(str(e)) +
                     RESET)
 
 
+def diagnostics_mode():
+    """
+    When to log snapshots of the manager state, like the blueprints list.
+    :return: always, debug (when the root logger is in DEBUG level) or
+        on-failure (only after a test failed).
+    """
+    mode = os.environ.get(DIAGNOSTICS_ENVAR_NAME, DIAGNOSTICS_ON_FAILURE)
+    if mode not in [DIAGNOSTICS_ALWAYS,
+                    DIAGNOSTICS_DEBUG,
+                    DIAGNOSTICS_ON_FAILURE]:
+        raise EcosystemTestException(
+            '{0} should be one of: always, debug, on-failure.'.format(
+                DIAGNOSTICS_ENVAR_NAME))
+    return mode
+
+
+def log_diagnostics(title, snapshot):
+    """
+    Log a snapshot of the manager state, only if the diagnostics mode
+    asks for it during the test.
+    :param title: What the snapshot is.
+    :param snapshot: A function that takes the snapshot.
+    :return:
+    """
+    mode = diagnostics_mode()
+    if mode == DIAGNOSTICS_ALWAYS:
+        logger.info('{0}: {1}'.format(title, snapshot()))
+    elif mode == DIAGNOSTICS_DEBUG and debug_logging_requested():
+        logger.debug('{0}: {1}'.format(title, snapshot()))
+
+
+def debug_logging_requested():
+    """
+    Whether the user asked for DEBUG logs, like with pytest
+    --log-level=DEBUG. The dorkl logger is always in DEBUG level, so this
+    checks the root logger.
+    """
+    return logging.getLogger().isEnabledFor(logging.DEBUG)
+
+
+def log_failure_diagnostics():
+    """
+    Log the manager state after a test failed.
+    """
+    for title, snapshot in [('Blueprints list', blueprints_list),
+                            ('Deployments list', deployments_list)]:
+        try:
+            logger.info('{0}: {1}'.format(title, snapshot()))
+        except Exception as e:
+            # Don't hide the test failure.
+            logger.error('Failed to get {0}: {1}'.format(title, str(e)))
+
+
+@contextmanager
+def failure_diagnostics():
+    try:
+        yield
+    except Exception:
+        log_failure_diagnostics()
+        raise
+
+
 def delete_blueprint_from_tmp(filename):
     delete_docker_manager_file('/tmp/{filename}'.format(filename=filename))
 
 
 def delete_docker_manager_file(filename):
     docker_exec('rm {}'.format(filename))
+    forget_pushed_file(filename)
 
 
 @contextmanager
@@ -245,17 +351,29 @@ def is_first_invocation(test_name):
     """
     Check if this is the first invocation of the test,
     by check existence of blueprint and deployment with test_name id.
+    The test state answers this without the manager, when it is usable.
     param: test_name: The test name.
     """
+    state = current_test_state()
+    if state and state.usable:
+        first_invocation = not state.deployment_exists
+        logger.info('{0} (from the test state)'.format(
+            'First invocation!' if first_invocation
+            else 'Not first invocation!'))
+        return first_invocation
+
     logger.info(
         'Checking if {test_name} in deployments list '.format(
             test_name=test_name))
-    deployments_list = cloudify_exec('cfy deployments list')
 
     def _map_func(bl_or_dep_dict):
         return bl_or_dep_dict["id"]
 
-    if test_name in [_map_func(deployment) for deployment in deployments_list]:
+    first_invocation = test_name not in [
+        _map_func(deployment) for deployment in deployments_list()]
+    if state:
+        state.reset(deployment_exists=not first_invocation)
+    if not first_invocation:
         logger.info('Not first invocation!')
         return False
     else:
@@ -287,7 +405,9 @@ def basic_blueprint_test_dev(blueprint_file_name,
                              on_failure=ROLLBACK_PARTIAL,
                              uninstall_on_success=True,
                              user_defined_check=None,
-                             user_defined_check_params=None
+                             user_defined_check_params=None,
+                             report_dir=None,
+                             deployment_pool=None
                              ):
     """
     blueprint test.
@@ -308,45 +428,161 @@ def basic_blueprint_test_dev(blueprint_file_name,
      after the deployment installation succeeds.
     :param: user_defined_check_params: dictionary contains parameters
       for user defined check.
+    :param report_dir: Where to write a report of the test phase timings,
+      by default ECOSYSTEM_TEST_REPORT_DIR, if it is set.
+    :param deployment_pool: A DeploymentPool. When the pool has a deployment
+      of the same blueprint and inputs, only the user defined check runs,
+      with the pooled deployment as the current test ID. Otherwise the
+      deployment is kept in the pool after the test passed, if it has room.
     :return:
     """
-    timeout = timeout or TIMEOUT
-    validate_on_failure_param(on_failure)
-    if is_first_invocation(test_name):
-        try:
-            first_invocation_test_path(
-                blueprint_file_name,
-                test_name,
-                inputs=inputs,
-                timeout=timeout,
-                uninstall_on_success=uninstall_on_success,
-                user_defined_check=user_defined_check,
-                user_defined_check_params=user_defined_check_params)
+    state = load_test_state(test_name,
+                            blueprint_file_name,
+                            inputs,
+                            get_manager_container_id)
+    with test_report(test_name, report_dir), test_state_context(state):
+        timeout = timeout or TIMEOUT
+        validate_on_failure_param(on_failure)
+        fingerprint = None
+        if deployment_pool:
+            fingerprint = blueprint_test_fingerprint(blueprint_file_name,
+                                                     inputs)
+            pooled_deployment = fingerprint and lease_pooled_deployment(
+                deployment_pool, fingerprint, test_name)
+            if pooled_deployment:
+                return pooled_test_path(deployment_pool,
+                                        pooled_deployment,
+                                        test_name,
+                                        user_defined_check,
+                                        user_defined_check_params)
+        if is_first_invocation(test_name):
+            try:
+                first_invocation_test_path(
+                    blueprint_file_name,
+                    test_name,
+                    inputs=inputs,
+                    timeout=timeout,
+                    uninstall_on_success=uninstall_on_success and
+                    not fingerprint,
+                    user_defined_check=user_defined_check,
+                    user_defined_check_params=user_defined_check_params)
 
-        except Exception as e:
-            logger.error(traceback.format_exc())
-            handle_test_failure(test_name, on_failure, timeout)
-            raise EcosystemTestException(
-                'Test {test_id} failed first invoke. {e}'.format(
-                    test_id=test_name, e=str(e)))
-    else:
-        validate_on_subsequent_invoke_param(on_subsequent_invoke)
-        try:
-            subsequent_invocation_test_path(
-                blueprint_file_name,
-                test_name,
-                on_subsequent_invoke=on_subsequent_invoke,
-                inputs=inputs,
-                timeout=timeout,
-                uninstall_on_success=uninstall_on_success,
-                user_defined_check=user_defined_check,
-                user_defined_check_params=user_defined_check_params)
-        except Exception:
-            logger.error(RED + traceback.format_exc() + RESET)
-            handle_test_failure(test_name, on_failure, timeout)
-            raise EcosystemTestException(
-                'Test {test_id} failed subsequent invoke.'.format(
-                    test_id=test_name))
+            except Exception as e:
+                logger.error(traceback.format_exc())
+                schedule_cleanup('failure handling of {0}'.format(test_name),
+                                 handle_test_failure,
+                                 test_name,
+                                 on_failure,
+                                 timeout)
+                raise EcosystemTestException(
+                    'Test {test_id} failed first invoke. {e}'.format(
+                        test_id=test_name, e=str(e)))
+        else:
+            validate_on_subsequent_invoke_param(on_subsequent_invoke)
+            try:
+                subsequent_invocation_test_path(
+                    blueprint_file_name,
+                    test_name,
+                    on_subsequent_invoke=on_subsequent_invoke,
+                    inputs=inputs,
+                    timeout=timeout,
+                    uninstall_on_success=uninstall_on_success and
+                    not fingerprint,
+                    user_defined_check=user_defined_check,
+                    user_defined_check_params=user_defined_check_params)
+            except Exception:
+                logger.error(RED + traceback.format_exc() + RESET)
+                schedule_cleanup('failure handling of {0}'.format(test_name),
+                                 handle_test_failure,
+                                 test_name,
+                                 on_failure,
+                                 timeout)
+                raise EcosystemTestException(
+                    'Test {test_id} failed subsequent invoke.'.format(
+                        test_id=test_name))
+        if fingerprint:
+            offer_to_pool(deployment_pool,
+                          fingerprint,
+                          test_name,
+                          timeout,
+                          uninstall_on_success)
+
+
+def lease_pooled_deployment(deployment_pool, fingerprint, test_name):
+    """
+    Evict the expired deployments of the pool, and lease a deployment that
+    still exists on the manager.
+    :return: The deployment ID, or None.
+    """
+    for deployment_id in deployment_pool.take_expired():
+        schedule_cleanup('eviction of {0}'.format(deployment_id),
+                         evict_pooled_deployment,
+                         deployment_id)
+    existing = [deployment['id'] for deployment in deployments_list()]
+    deployment_id = deployment_pool.lease(fingerprint, test_name)
+    while deployment_id and deployment_id not in existing:
+        logger.info('The pooled deployment {0} is gone.'.format(
+            deployment_id))
+        deployment_pool.remove(deployment_id)
+        discard_test_state(deployment_id)
+        deployment_id = deployment_pool.lease(fingerprint, test_name)
+    return deployment_id
+
+
+def evict_pooled_deployment(deployment_id):
+    logger.info(BLUE + 'Evicting the pooled deployment {0}...'.format(
+        deployment_id) + RESET)
+    try:
+        with span('evict', deployment_id=deployment_id):
+            cleanup_on_failure(deployment_id)
+    except EcosystemTestException as e:
+        logger.error(RED + 'Failed to evict the pooled deployment {0}, '
+                     '{1}'.format(deployment_id, str(e)) + RESET)
+    discard_test_state(deployment_id)
+
+
+@nottest
+def pooled_test_path(deployment_pool,
+                     deployment_id,
+                     test_name,
+                     user_defined_check=None,
+                     user_defined_check_params=None):
+    """
+    Run the user defined check of a test on a pooled deployment. The
+    deployment goes back to the pool if the check passed, and is evicted
+    otherwise.
+    """
+    logger.info(GREEN + 'Test {0} runs on the pooled deployment {1}.'.format(
+        test_name, deployment_id) + RESET)
+    try:
+        with test_id_context(deployment_id):
+            run_user_defined_check(user_defined_check,
+                                   user_defined_check_params)
+    except Exception as e:
+        logger.error(RED + traceback.format_exc() + RESET)
+        deployment_pool.remove(deployment_id)
+        schedule_cleanup('eviction of {0}'.format(deployment_id),
+                         evict_pooled_deployment,
+                         deployment_id)
+        raise EcosystemTestException(
+            'Test {test_id} failed on the pooled deployment {dep_id}. '
+            '{e}'.format(test_id=test_name, dep_id=deployment_id, e=str(e)))
+    deployment_pool.release(deployment_id)
+
+
+def offer_to_pool(deployment_pool,
+                  fingerprint,
+                  test_name,
+                  timeout,
+                  uninstall_on_success):
+    if deployment_pool.add(fingerprint, test_name):
+        logger.info('The deployment {0} is kept in the deployment '
+                    'pool.'.format(test_name))
+    elif uninstall_on_success:
+        schedule_cleanup('uninstall of {0}'.format(test_name),
+                         handle_uninstall_on_success,
+                         test_name,
+                         timeout)
 
 
 @nottest
@@ -358,17 +594,24 @@ def first_invocation_test_path(blueprint_file_name,
                                user_defined_check=None,
                                user_defined_check_params=None
                                ):
-    logger.info('Blueprints list: {0}'.format(
-        cloudify_exec('cfy blueprints list')))
-    blueprints_upload(blueprint_file_name, test_name)
-    logger.info('Deployments list: {0}'.format(
-        cloudify_exec('cfy deployments list')))
-    deployments_create(test_name, inputs)
-    sleep(5)
+    if not phase_completed(BLUEPRINT_UPLOAD):
+        with span('blueprint_upload'):
+            checkpoint(BLUEPRINT_UPLOAD, completed=False)
+            log_diagnostics('Blueprints list', blueprints_list)
+            blueprints_upload(blueprint_file_name, test_name)
+            checkpoint(BLUEPRINT_UPLOAD)
+    with span('deployment_create'):
+        checkpoint(DEPLOYMENT_CREATE, completed=False)
+        log_diagnostics('Deployments list', deployments_list)
+        deployments_create(test_name, inputs, wait=True, timeout=timeout)
+        checkpoint(DEPLOYMENT_CREATE)
     start_install_workflow(test_name, timeout)
     run_user_defined_check(user_defined_check, user_defined_check_params)
     if uninstall_on_success:
-        handle_uninstall_on_success(test_name, timeout)
+        schedule_cleanup('uninstall of {0}'.format(test_name),
+                         handle_uninstall_on_success,
+                         test_name,
+                         timeout)
 
 
 @nottest
@@ -415,11 +658,19 @@ def subsequent_invocation_test_path(blueprint_file_name,
         # with the same blueprint X and it
         # succeeds(because nothing changed in the blueprint)
         start_install_workflow(test_name, timeout)
-    run_user_defined_check(user_defined_check, user_defined_check_params)
+    if on_subsequent_invoke == RESUME and \
+            phase_completed(USER_DEFINED_CHECK):
+        logger.info('The user defined check already passed.')
+    else:
+        run_user_defined_check(user_defined_check, user_defined_check_params)
     if uninstall_on_success:
-        handle_uninstall_on_success(test_name, timeout)
+        schedule_cleanup('uninstall of {0}'.format(test_name),
+                         handle_uninstall_on_success,
+                         test_name,
+                         timeout)
 
 
+@timed('deployment_update')
 def handle_deployment_update(blueprint_file_name,
                              update_bp_name,
                              test_name,
@@ -427,8 +678,7 @@ def handle_deployment_update(blueprint_file_name,
                              timeout):
     logger.info('updating deployment...')
     try:
-        logger.info('Blueprints list: {0}'.format(
-            cloudify_exec('cfy blueprints list')))
+        log_diagnostics('Blueprints list', blueprints_list)
         blueprints_upload(blueprint_file_name, update_bp_name)
         deployment_update(test_name,
                           update_bp_name,
@@ -443,23 +693,34 @@ def handle_deployment_update(blueprint_file_name,
 
 
 def handle_uninstall_on_success(test_name, timeout):
-    logger.info(BLUE + 'Uninstalling...' + RESET)
-    executions_start('uninstall', test_name, timeout)
-    wait_for_execution(test_name, 'uninstall', timeout)
+    if not phase_completed(UNINSTALL):
+        with span('uninstall'):
+            logger.info(BLUE + 'Uninstalling...' + RESET)
+            checkpoint(UNINSTALL, completed=False)
+            executions_start('uninstall', test_name, timeout)
+            wait_for_execution(test_name, 'uninstall', timeout)
+            checkpoint(UNINSTALL)
     blueprint_of_deployment = get_blueprint_id_of_deployment(test_name)
     logger.info(
         "Blueprint id of deployment {dep_id} is : {blueprint_id}".format(
             dep_id=test_name, blueprint_id=blueprint_of_deployment))
     try:
-        deployment_delete(test_name)
-        blueprints_delete(blueprint_of_deployment)
+        with span('delete'):
+            checkpoint(DELETE, completed=False)
+            deployment_delete(test_name)
+            blueprints_delete(blueprint_of_deployment)
+            forget_test()
     except Exception as e:
         logger.info(RED +
                     'Failed to delete blueprint, {0}'.format(str(e)) +
                     RESET)
 
 
+@timed('install')
 def resume_install_workflow(test_name, timeout):
+    if phase_completed(INSTALL):
+        logger.info('The install workflow already completed.')
+        return
     exec_id = find_install_execution_to_resume(test_name)
     logger.debug('execution to resume: {id}'.format(id=exec_id))
     try:
@@ -468,11 +729,12 @@ def resume_install_workflow(test_name, timeout):
     except EcosystemTimeout:
         # Give 5 seconds grace.
         executions_list(test_name)
-        wait_for_execution(test_name, 'install', 10)
+        wait_for_install(test_name, 10)
     else:
-        wait_for_execution(test_name, 'install', timeout)
+        wait_for_install(test_name, timeout)
 
 
+@timed('install')
 def start_install_workflow(test_name, timeout):
     logger.info(GREEN + 'Installing...' + RESET)
     try:
@@ -481,9 +743,33 @@ def start_install_workflow(test_name, timeout):
     except EcosystemTimeout:
         # Give 5 seconds grace.
         executions_list(test_name)
-        wait_for_execution(test_name, 'install', 10)
+        wait_for_install(test_name, 10)
     else:
-        wait_for_execution(test_name, 'install', timeout)
+        wait_for_install(test_name, timeout)
+
+
+def wait_for_install(test_name, timeout):
+    """
+    Wait for the install workflow, and record its execution in the test
+    state, so that it can be resumed without looking it up.
+    """
+    ex = get_latest_execution(test_name, 'install')
+    checkpoint(INSTALL, completed=False, execution_id=ex['id'])
+    wait_for_execution(test_name, 'install', timeout, execution=ex)
+    checkpoint(INSTALL)
+
+
+def install_execution_from_state():
+    state = current_test_state()
+    execution_id = state and state.usable and \
+        state.get(INSTALL, 'execution_id')
+    if not execution_id:
+        return
+    try:
+        return executions_get(execution_id)
+    except EcosystemTestException as e:
+        logger.info('The install execution {0} of the test state was not '
+                    'found: {1}'.format(execution_id, str(e)))
 
 
 def find_install_execution_to_resume(deployment_id):
@@ -492,19 +778,22 @@ def find_install_execution_to_resume(deployment_id):
     :param deployment_id:
     :return:
     """
-    executions = executions_list(deployment_id)
-    try:
-        # Get the last install execution
-        ex = [e for e in executions
-              if 'install' == e['workflow_id']][-1]
-        # For debugging
-        logger.info("these are potential executions to resume")
-        logger.info([e for e in executions if 'install' == e['workflow_id']])
-    except (IndexError, KeyError):
-        raise EcosystemTestException(
-            'Workflow install to resume for deployment {dep_id} was not '
-            'found.'.format(
-                dep_id=deployment_id))
+    ex = install_execution_from_state()
+    if not ex:
+        executions = executions_list(deployment_id)
+        try:
+            # Get the last install execution
+            ex = [e for e in executions
+                  if 'install' == e['workflow_id']][-1]
+            # For debugging
+            logger.info("these are potential executions to resume")
+            logger.info(
+                [e for e in executions if 'install' == e['workflow_id']])
+        except (IndexError, KeyError):
+            raise EcosystemTestException(
+                'Workflow install to resume for deployment {dep_id} was not '
+                'found.'.format(
+                    dep_id=deployment_id))
 
     if ex['status'].lower() not in ['failed', 'cancelled']:
         raise EcosystemTestException(
@@ -542,11 +831,13 @@ def find_executions_to_cancel(deployment_id):
 
 
 @nottest
+@timed('failure_handling')
 def handle_test_failure(test_name, on_failure, timeout):
     """
     rollback-full,rollback-partial,uninstall-force
     """
     logger.info('Handling test failure...')
+    log_failure_diagnostics()
     executions_to_cancel = find_executions_to_cancel(test_name)
     if on_failure is DONOTHING:
         return
@@ -562,12 +853,186 @@ def handle_test_failure(test_name, on_failure, timeout):
     elif on_failure == UNINSTALL_FORCE:
         cancel_multiple_executions(executions_to_cancel, timeout, force=False)
         cleanup_on_failure(test_name)
+        forget_test()
     else:
         raise EcosystemTestException('Wrong on_failure param supplied,'
                                      ' Doing nothing please clean resources on'
                                      ' the manager manually.')
 
 
+@nottest
+def deployment_group_test(blueprint_file_name,
+                          test_name,
+                          members_inputs,
+                          inputs=None,
+                          timeout=None,
+                          on_failure=ROLLBACK_PARTIAL,
+                          uninstall_on_success=True,
+                          report_dir=None):
+    """
+    Test a blueprint with many sets of inputs at once. The blueprint is
+    uploaded once, a deployment group gets a deployment for every set of
+    inputs, and the group is installed with one execution group.
+    :param blueprint_file_name: Path to the blueprint for the test.
+    :param test_name: The ID of the blueprint and the deployment group.
+      The deployments are <test_name>-1, <test_name>-2 and so on.
+    :param members_inputs: A list of (name, inputs dict) for every member.
+    :param inputs: Inputs of all the members.
+    :param timeout:
+    :param on_failure: With uninstall-force, a group with a failed member
+      is uninstalled with ignore_failure. Otherwise it is left on the
+      manager, to look into. If the test itself fails, its executions are
+      also cancelled or rolled back like in basic_blueprint_test_dev, and a
+      blueprint without a group is deleted, unless this is donothing.
+    :param uninstall_on_success: Uninstall and delete the group if all its
+      members passed.
+    :param report_dir: Where to write a report of the test phase timings.
+    :return: A list of TestResult, one for every member.
+    """
+    timeout = timeout or TIMEOUT
+    validate_on_failure_param(on_failure)
+    members = ['{0}-{1}'.format(test_name, index)
+               for index in range(1, len(members_inputs) + 1)]
+    # What the test created on the manager, to clean it if the test fails.
+    created = []
+    with test_report(test_name, report_dir):
+        try:
+            with span('blueprint_upload'):
+                blueprints_upload(blueprint_file_name, test_name)
+                created.append('blueprint')
+            with span('deployment_create'):
+                deployment_group_create(
+                    test_name,
+                    test_name,
+                    dict(zip(members, [i for _, i in members_inputs])),
+                    inputs)
+                created.append('group')
+                environments = wait_for_group_workflow(
+                    members, 'create_deployment_environment', timeout)
+            with span('install'):
+                group = execution_group_start(test_name, 'install')
+                created.append('install')
+                installs = wait_for_group_workflow(
+                    members,
+                    'install',
+                    timeout,
+                    execution_ids=group.get('execution_ids'))
+        except Exception:
+            logger.error(traceback.format_exc())
+            if created:
+                schedule_cleanup(
+                    'failure handling of group {0}'.format(test_name),
+                    handle_group_failure,
+                    test_name,
+                    members,
+                    on_failure,
+                    timeout,
+                    created)
+            raise
+    results = [group_member_result(member,
+                                   name,
+                                   [environments[member], installs[member]])
+               for member, (name, _) in zip(members, members_inputs)]
+    failed = [r.test_id for r in results if r.status == FAILED]
+    if not failed and uninstall_on_success:
+        schedule_cleanup('uninstall of group {0}'.format(test_name),
+                         uninstall_deployment_group,
+                         test_name,
+                         members,
+                         timeout)
+    elif failed and on_failure == UNINSTALL_FORCE:
+        schedule_cleanup('uninstall of group {0}'.format(test_name),
+                         uninstall_deployment_group,
+                         test_name,
+                         members,
+                         timeout,
+                         ignore_failure=True)
+    elif failed:
+        logger.info(YELLOW + 'The deployment group {0} is left on the '
+                    'manager.'.format(test_name) + RESET)
+    return results
+
+
+def handle_group_failure(group_id,
+                         deployment_ids,
+                         on_failure,
+                         timeout,
+                         created):
+    """
+    Clean what a deployment group test created before it failed, the same
+    way handle_test_failure does for a single deployment.
+    :param created: What was created: blueprint, group and install.
+    """
+    logger.info('Handling deployment group test failure...')
+    log_failure_diagnostics()
+    if on_failure == DONOTHING:
+        return
+    if 'group' not in created:
+        blueprints_delete(group_id)
+    elif on_failure == UNINSTALL_FORCE:
+        uninstall_deployment_group(
+            group_id, deployment_ids, timeout, ignore_failure=True)
+    else:
+        for deployment_id in deployment_ids if 'install' in created else []:
+            cancel_multiple_executions(
+                find_executions_to_cancel(deployment_id), timeout,
+                force=False)
+            if on_failure == ROLLBACK_FULL:
+                executions_start('rollback', deployment_id, timeout,
+                                 params='full_rollback=true')
+            elif on_failure == ROLLBACK_PARTIAL:
+                executions_start('rollback', deployment_id, timeout)
+        logger.info(YELLOW + 'The deployment group {0} is left on the '
+                    'manager.'.format(group_id) + RESET)
+
+
+def group_member_result(member, name, executions):
+    """
+    :param executions: The executions of the member, in order.
+    :return: A TestResult, that passed if all the executions completed.
+    """
+    duration = 0
+    for ex in executions:
+        if not ex:
+            return TestResult(member, name, FAILED, duration, 'Timed out.')
+        duration += ex['waited']
+        if ex['status'] != 'completed':
+            return TestResult(member, name, FAILED, duration,
+                              ex.get('error') or '{0} {1}'.format(
+                                  ex['workflow_id'], ex['status']))
+    return TestResult(member, name, PASSED, duration)
+
+
+def uninstall_deployment_group(group_id,
+                               deployment_ids,
+                               timeout,
+                               ignore_failure=False):
+    logger.info(BLUE + 'Uninstalling deployment group {0}...'.format(
+        group_id) + RESET)
+    group = execution_group_start(
+        group_id,
+        'uninstall',
+        params={'ignore_failure': True} if ignore_failure else None)
+    executions = wait_for_group_workflow(deployment_ids,
+                                         'uninstall',
+                                         timeout,
+                                         execution_ids=group.get(
+                                             'execution_ids'))
+    failed = sorted(d for d, ex in executions.items()
+                    if not ex or ex['status'] != 'completed')
+    if failed:
+        raise EcosystemTestException(
+            'Uninstall of deployment group {0} failed on: {1}'.format(
+                group_id, ', '.join(failed)))
+    deployment_group_delete(group_id, deployment_ids, timeout)
+    try:
+        blueprints_delete(group_id)
+    except Exception as e:
+        logger.info(RED +
+                    'Failed to delete blueprint, {0}'.format(str(e)) +
+                    RESET)
+
+
 @nottest
 def prepare_test_dev(plugins=None,
                      secrets=None,
@@ -597,12 +1062,27 @@ def prepare_test_dev(plugins=None,
     create_test_secrets(secrets)
 
 
+@nottest
+def prepare_restored_test_dev(secrets=None):
+    """
+    Prepare a manager that runs from a prepared snapshot, and already has
+    the packages and plugins of the test.
+    :param secrets: A list of secrets to create.
+    """
+    use_cfy()
+    license_upload()
+    create_test_secrets(secrets)
+
+
+@timed('user_defined_check')
 def run_user_defined_check(user_defined_check, user_defined_check_params):
     if user_defined_check:
         if callable(user_defined_check):
             logger.info('Run user defined check...')
             params = user_defined_check_params or {}
+            checkpoint(USER_DEFINED_CHECK, completed=False)
             user_defined_check(**params)
+            checkpoint(USER_DEFINED_CHECK)
         else:
             raise EcosystemTestException('User defined check is not callable!')
 
@@ -0,0 +1,140 @@
+########
+# Copyright (c) 2014-2022 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+from mock import patch
+from testtools import TestCase
+
+from ...dorkl import async_commands
+from ...dorkl.parallel import current_test_id, test_id_context
+from ...dorkl.exceptions import (EcosystemTimeout,
+                                 EcosystemCommandError,
+                                 EcosystemTestException)
+
+
+class AsyncCommandsTest(TestCase):
+
+    def test_handle_process_returns_output(self):
+        output, = async_commands.run_concurrently(
+            async_commands.handle_process('echo hello', log=False))
+        self.assertEqual(output, 'hello\n')
+
+    def test_commands_run_concurrently(self):
+        results = async_commands.run_concurrently(
+            *[async_commands.handle_process(
+                'sh -c "sleep 0.5; echo {0}"'.format(i), log=False)
+              for i in range(4)])
+        self.assertEqual(results, ['0\n', '1\n', '2\n', '3\n'])
+
+    def test_concurrency_limit(self):
+        results = async_commands.run_concurrently(
+            *[async_commands.handle_process('echo {0}'.format(i), log=False)
+              for i in range(3)],
+            limit=1)
+        self.assertEqual(results, ['0\n', '1\n', '2\n'])
+
+    def test_handle_process_failure(self):
+        error = self.assertRaises(
+            EcosystemCommandError,
+            async_commands.run_concurrently,
+            async_commands.handle_process('sh -c "echo oops; exit 3"',
+                                          log=False))
+        self.assertEqual((error.returncode, error.output), (3, 'oops\n'))
+
+    def test_failure_waits_for_the_others(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        output = os.path.join(tmp, 'done')
+        self.assertRaises(
+            EcosystemTestException,
+            async_commands.run_concurrently,
+            async_commands.handle_process('false', log=False),
+            async_commands.handle_process(
+                'sh -c "sleep 0.3; touch {0}"'.format(output), log=False))
+        self.assertTrue(os.path.exists(output))
+
+    def test_handle_process_timeout(self):
+        self.assertRaises(
+            EcosystemTimeout,
+            async_commands.run_concurrently,
+            async_commands.handle_process('sleep 5', timeout=0.2, log=False))
+
+    @patch.dict(os.environ, {'ECOSYSTEM_TEST_EXEC_SESSION': 'false'})
+    @patch('ecosystem_tests.dorkl.async_commands.get_manager_container_name',
+           return_value='manager')
+    def test_cloudify_exec_parses_json(self, _):
+        commands = []
+
+        async def fake_handle_process(command, *_):
+            commands.append(command)
+            return '[{"id": "bp"}]'
+
+        with patch('ecosystem_tests.dorkl.async_commands.handle_process',
+                   fake_handle_process):
+            result, = async_commands.run_concurrently(
+                async_commands.cloudify_exec('cfy blueprints list'))
+        self.assertEqual(result, [{'id': 'bp'}])
+        self.assertEqual(commands,
+                         ['docker exec manager cfy blueprints list --json'])
+
+    @patch.dict(os.environ, {'ECOSYSTEM_TEST_EXEC_SESSION': 'true'})
+    def test_exec_session_is_used_in_a_worker_thread(self):
+        calls = []
+
+        def docker_exec(cmd, *_):
+            calls.append((cmd, current_test_id()))
+            return 'output'
+
+        with patch('ecosystem_tests.dorkl.commands.docker_exec',
+                   docker_exec), test_id_context('test1'):
+            result, = async_commands.run_concurrently(
+                async_commands.docker_exec('cfy status'))
+        self.assertEqual(result, 'output')
+        self.assertEqual(calls, [('cfy status', 'test1')])
+
+    @patch('ecosystem_tests.dorkl.async_commands.get_manager_container_name',
+           return_value='manager')
+    @patch('ecosystem_tests.dorkl.async_commands.docker_transport',
+           return_value='cli')
+    def test_pushed_files_are_not_copied_again(self, *_):
+        copied = []
+        recorded = []
+
+        @contextmanager
+        def skip_pushed_files(paths):
+            pending = {} if copied else paths
+            yield pending
+            recorded.append(pending)
+
+        async def handle_process(command, *_):
+            copied.append(command)
+
+        with patch('ecosystem_tests.dorkl.async_commands.skip_pushed_files',
+                   skip_pushed_files), \
+                patch('ecosystem_tests.dorkl.async_commands.handle_process',
+                      handle_process):
+            for _ in range(2):
+                self.assertEqual(
+                    async_commands.run_concurrently(
+                        async_commands.copy_file_to_docker('/a/plugin.wgn')),
+                    ['/tmp/plugin.wgn'])
+        self.assertEqual(copied,
+                         ['docker cp /a/plugin.wgn manager:/tmp/plugin.wgn'])
+        self.assertEqual(recorded,
+                         [{'/a/plugin.wgn': '/tmp/plugin.wgn'}, {}])
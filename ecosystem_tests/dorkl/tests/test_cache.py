@@ -0,0 +1,100 @@
+########
+# Copyright (c) 2014-2022 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from mock import patch, Mock
+from testtools import TestCase
+
+from ...dorkl import cloudify_api
+from ...dorkl.cache import ListCache
+
+
+class ListCacheTest(TestCase):
+
+    def test_hit_returns_a_copy(self):
+        cache = ListCache()
+        load = Mock(return_value=[{'id': 'a'}])
+        cache.get('blueprints', load)[0]['id'] = 'changed'
+        self.assertEqual(cache.get('blueprints', load), [{'id': 'a'}])
+        load.assert_called_once()
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_invalidate_resource(self):
+        cache = ListCache()
+        load = Mock(return_value=[])
+        cache.get('blueprints', load)
+        cache.get('deployments', load)
+        cache.invalidate('blueprints')
+        cache.get('blueprints', load)
+        cache.get('deployments', load)
+        self.assertEqual(load.call_count, 3)
+
+    def test_invalidate_all(self):
+        cache = ListCache()
+        load = Mock(return_value=[])
+        cache.get('blueprints', load)
+        cache.invalidate()
+        cache.get('blueprints', load)
+        self.assertEqual(load.call_count, 2)
+
+    def test_change_during_load_is_not_kept(self):
+        cache = ListCache()
+
+        def load():
+            cache.invalidate('blueprints')
+            return []
+
+        cache.get('blueprints', load)
+        self.assertEqual(cache.misses, 1)
+        cache.get('blueprints', Mock(return_value=[]))
+        self.assertEqual(cache.misses, 2)
+
+    @patch('ecosystem_tests.dorkl.cache.time')
+    def test_ttl(self, mock_time):
+        cache = ListCache(ttl=10)
+        load = Mock(return_value=[])
+        mock_time.return_value = 100
+        cache.get('blueprints', load)
+        mock_time.return_value = 105
+        cache.get('blueprints', load)
+        mock_time.return_value = 111
+        cache.get('blueprints', load)
+        self.assertEqual(load.call_count, 2)
+
+    def test_zero_ttl_disables(self):
+        cache = ListCache(ttl=0)
+        load = Mock(return_value=[])
+        cache.get('blueprints', load)
+        cache.get('blueprints', load)
+        self.assertEqual(load.call_count, 2)
+
+
+@patch('ecosystem_tests.dorkl.cloudify_api.list_cache', ListCache())
+@patch('ecosystem_tests.dorkl.cloudify_api.cloudify_exec', return_value=[])
+class CloudifyApiListCacheTest(TestCase):
+
+    def test_lists_are_cached(self, mock_exec):
+        cloudify_api.deployments_list()
+        cloudify_api.get_blueprint_id_of_deployment('dep')
+        mock_exec.assert_called_once_with('cfy deployments list')
+
+    def test_mutation_invalidates(self, mock_exec):
+        cloudify_api.blueprints_list()
+        cloudify_api.blueprints_delete('bp')
+        cloudify_api.blueprints_list()
+        self.assertEqual(
+            [c[0][0] for c in mock_exec.call_args_list],
+            ['cfy blueprints list',
+             'cfy blueprints delete bp',
+             'cfy blueprints list'])
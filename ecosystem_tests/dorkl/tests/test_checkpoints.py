@@ -0,0 +1,112 @@
+########
+# Copyright (c) 2014-2022 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import tempfile
+
+from mock import patch
+from testtools import TestCase
+
+from ...dorkl import runners, checkpoints
+
+
+class TestStateTest(TestCase):
+
+    def setUp(self):
+        super(TestStateTest, self).setUp()
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        env = patch.dict(os.environ, {'ECOSYSTEM_TEST_CACHE_DIR': self.tmp})
+        env.start()
+        self.addCleanup(env.stop)
+        self.blueprint = os.path.join(self.tmp, 'blueprint.yaml')
+        with open(self.blueprint, 'w') as outfile:
+            outfile.write('tosca_definitions_version: cloudify_dsl_1_3')
+
+    def load(self, container_id='manager', inputs=None):
+        return checkpoints.load_test_state(
+            'test', self.blueprint, inputs, lambda: container_id)
+
+    def test_state_is_kept_for_the_same_test(self):
+        self.load().record(checkpoints.DEPLOYMENT_CREATE)
+        state = self.load()
+        self.assertTrue(state.usable)
+        self.assertTrue(state.deployment_exists)
+
+    def test_state_is_stale_for_other_inputs_or_manager(self):
+        self.load().record(checkpoints.DEPLOYMENT_CREATE)
+        self.assertFalse(self.load(inputs={'a': 'b'}).fresh)
+        self.assertFalse(self.load(container_id='new').fresh)
+
+    def test_phase_that_did_not_complete_is_uncertain(self):
+        self.load().record(checkpoints.DEPLOYMENT_CREATE, completed=False)
+        self.assertFalse(self.load().usable)
+
+    def test_starting_a_phase_forgets_later_phases(self):
+        state = self.load()
+        for phase in [checkpoints.INSTALL, checkpoints.UNINSTALL]:
+            state.record(phase)
+        state.record(checkpoints.INSTALL, completed=False)
+        self.assertEqual(list(state.phases), [checkpoints.INSTALL])
+
+    def test_unknown_manager_has_no_state(self):
+        def fail():
+            raise OSError('docker not found')
+        self.assertIsNone(checkpoints.load_test_state(
+            'test', self.blueprint, None, fail))
+
+    @patch('ecosystem_tests.dorkl.runners.deployments_list')
+    def test_first_invocation_from_state(self, mock_deployments):
+        self.load().record(checkpoints.DEPLOYMENT_CREATE)
+        with checkpoints.test_state_context(self.load()):
+            self.assertFalse(runners.is_first_invocation('test'))
+        mock_deployments.assert_not_called()
+
+    @patch('ecosystem_tests.dorkl.runners.deployments_list',
+           return_value=[])
+    def test_new_state_asks_the_manager(self, mock_deployments):
+        with checkpoints.test_state_context(self.load()):
+            self.assertTrue(runners.is_first_invocation('test'))
+        mock_deployments.assert_called_once_with()
+
+    @patch('ecosystem_tests.dorkl.runners.deployments_list',
+           return_value=[{'id': 'test'}])
+    def test_stale_state_is_reset_from_manager(self, _):
+        state = self.load()
+        state.record(checkpoints.DELETE, completed=False)
+        with checkpoints.test_state_context(state):
+            self.assertFalse(runners.is_first_invocation('test'))
+        self.assertTrue(self.load().usable)
+        self.assertTrue(self.load().deployment_exists)
+
+    @patch('ecosystem_tests.dorkl.runners.executions_list')
+    @patch('ecosystem_tests.dorkl.runners.executions_get',
+           return_value={'id': 'ex1', 'status': 'failed'})
+    def test_resume_execution_from_state(self, mock_get, mock_list):
+        self.load().record(checkpoints.INSTALL, completed=False,
+                           execution_id='ex1')
+        with checkpoints.test_state_context(self.load()):
+            self.assertEqual(
+                runners.find_install_execution_to_resume('test'), 'ex1')
+        mock_get.assert_called_once_with('ex1')
+        mock_list.assert_not_called()
+
+    @patch('ecosystem_tests.dorkl.runners.executions_resume')
+    def test_completed_install_is_not_resumed(self, mock_resume):
+        self.load().record(checkpoints.INSTALL)
+        with checkpoints.test_state_context(self.load()):
+            runners.resume_install_workflow('test', 10)
+        mock_resume.assert_not_called()
@@ -0,0 +1,94 @@
+########
+# Copyright (c) 2014-2022 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import json
+import shutil
+import tempfile
+import threading
+
+from mock import Mock
+from testtools import TestCase
+
+from ...dorkl import cleanup, timing
+from ...dorkl.exceptions import EcosystemTestException
+from ...dorkl.parallel import current_test_id, test_id_context
+from ...dorkl.checkpoints import current_test_state, test_state_context
+
+
+class BackgroundCleanupTest(TestCase):
+
+    def test_jobs_run_in_place_without_a_queue(self):
+        job = Mock(return_value='done')
+        self.assertEqual('done', cleanup.schedule_cleanup('job', job, 'dep'))
+        job.assert_called_once_with('dep')
+
+    def test_jobs_run_in_the_context_of_their_test(self):
+        started = threading.Event()
+        release = threading.Event()
+        contexts = []
+
+        def job():
+            started.set()
+            release.wait(5)
+            contexts.append((current_test_id(), current_test_state()))
+
+        state = Mock()
+        with cleanup.background_cleanup(2):
+            with test_id_context('test'), test_state_context(state):
+                cleanup.schedule_cleanup('job', job)
+            # The test goes on while the job runs.
+            self.assertTrue(started.wait(5))
+            self.assertEqual([], contexts)
+            release.set()
+        self.assertEqual([('test', state)], contexts)
+
+    def test_failed_jobs_fail_the_block(self):
+        jobs = [Mock(side_effect=Exception('uninstall failed')), Mock()]
+        with self.assertRaisesRegex(EcosystemTestException,
+                                    'Failed cleanups: first'):
+            with cleanup.background_cleanup(2):
+                cleanup.schedule_cleanup('first', jobs[0])
+                cleanup.schedule_cleanup('second', jobs[1])
+        jobs[1].assert_called_once_with()
+
+    def test_failure_of_the_block_is_kept(self):
+        job = Mock(side_effect=Exception('uninstall failed'))
+        with self.assertRaisesRegex(ValueError, 'test failed'):
+            with cleanup.background_cleanup(1):
+                cleanup.schedule_cleanup('job', job)
+                raise ValueError('test failed')
+        job.assert_called_once_with()
+
+    def test_job_spans_are_added_to_the_test_report(self):
+        report_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, report_dir)
+
+        def uninstall():
+            with timing.span('uninstall'):
+                pass
+            raise Exception('delete failed')
+
+        with self.assertRaises(EcosystemTestException):
+            with cleanup.background_cleanup(1):
+                with timing.test_report('test1', report_dir):
+                    cleanup.schedule_cleanup('uninstall of test1', uninstall)
+        with open(os.path.join(report_dir, 'test1.json')) as f:
+            job = json.load(f)['spans'][0]
+        self.assertEqual(
+            (job['name'], job['attributes'], job['status'], job['error']),
+            ('cleanup', {'job': 'uninstall of test1'}, timing.FAILED,
+             'delete failed'))
+        self.assertEqual([s['name'] for s in job['spans']], ['uninstall'])
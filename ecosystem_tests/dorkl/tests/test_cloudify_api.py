@@ -0,0 +1,320 @@
+########
+# Copyright (c) 2014-2022 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+from tempfile import NamedTemporaryFile
+from datetime import datetime, timedelta
+
+from mock import patch
+from testtools import TestCase
+from cloudify_rest_client.exceptions import CloudifyClientError
+
+from ...dorkl import cloudify_api
+from ...dorkl.cache import ListCache
+from ...dorkl.backoff import backoff_delays
+from ...dorkl.exceptions import (EcosystemTimeout,
+                                 EcosystemCommandError,
+                                 EcosystemTestException)
+
+
+def execution(status, workflow_id='install', execution_id='ex2'):
+    return {'id': execution_id, 'workflow_id': workflow_id, 'status': status}
+
+
+@patch('ecosystem_tests.dorkl.cloudify_api.sleep')
+@patch('ecosystem_tests.dorkl.cloudify_api.executions_get')
+@patch('ecosystem_tests.dorkl.cloudify_api.executions_list',
+       return_value=[execution('failed', execution_id='ex1'),
+                     execution('started', 'uninstall', 'other'),
+                     execution('pending')])
+class WaitForExecutionTest(TestCase):
+
+    def test_polls_the_latest_execution(self, mock_list, mock_get, mock_sleep):
+        mock_get.side_effect = [execution('started'),
+                                execution('started'),
+                                execution('completed')]
+        self.assertEqual(
+            cloudify_api.wait_for_execution('dep', 'install', 100),
+            execution('completed'))
+        mock_list.assert_called_once_with('dep')
+        self.assertEqual([c[0][0] for c in mock_get.call_args_list],
+                         ['ex2', 'ex2', 'ex2'])
+        self.assertEqual([c[0][0] for c in mock_sleep.call_args_list],
+                         [1, 1.5, 2.25])
+
+    def test_cancelled_execution_fails(self, _, mock_get, __):
+        mock_get.return_value = execution('cancelled')
+        self.assertRaises(EcosystemTestException,
+                          cloudify_api.wait_for_execution,
+                          'dep', 'install', 100)
+
+    def test_missing_workflow_fails(self, *_):
+        self.assertRaises(EcosystemTestException,
+                          cloudify_api.wait_for_execution,
+                          'dep', 'update', 100)
+
+    @patch('ecosystem_tests.dorkl.cloudify_api.events_page')
+    def test_tail_events(self, mock_page, _, mock_get, __):
+        mock_get.side_effect = [execution('failed')]
+        mock_page.side_effect = [[], [{'error_causes': ['cause']}]]
+        with patch.object(cloudify_api.logger, 'info') as mock_info:
+            self.assertRaises(EcosystemTestException,
+                              cloudify_api.wait_for_execution,
+                              'dep', 'install', 100, tail_events=True)
+        mock_info.assert_called_with(['cause'])
+        self.assertEqual([c[0][1] for c in mock_page.call_args_list],
+                         [0, 0])
+
+    def test_timeout(self, _, mock_get, __):
+        mock_get.return_value = execution('started')
+        self.assertRaises(EcosystemTimeout,
+                          cloudify_api.wait_for_execution,
+                          'dep', 'install', 0)
+
+
+@patch('ecosystem_tests.dorkl.cloudify_api.list_cache', ListCache())
+@patch('ecosystem_tests.dorkl.cloudify_api.cloudify_exec')
+@patch('ecosystem_tests.dorkl.cloudify_api.wait_for_execution')
+class DeploymentsCreateTest(TestCase):
+
+    def test_waits_for_deployment_environment(self, mock_wait, _):
+        cloudify_api.deployments_create('bp', None, wait=True, timeout=30)
+        mock_wait.assert_called_once_with(
+            'bp', 'create_deployment_environment', 30, tail_events=False)
+
+    def test_does_not_wait_by_default(self, mock_wait, mock_exec):
+        cloudify_api.deployments_create('bp', None)
+        mock_exec.assert_called_once_with('cfy deployments create -b bp',
+                                          get_json=False)
+        mock_wait.assert_not_called()
+
+
+@patch('ecosystem_tests.dorkl.cloudify_api.sleep')
+@patch('ecosystem_tests.dorkl.cloudify_api.group_executions')
+class WaitForGroupWorkflowTest(TestCase):
+
+    def test_one_poll_for_all_deployments(self, mock_executions, _):
+        mock_executions.side_effect = [
+            [{'id': 'old', 'deployment_id': 'd1', 'status': 'failed'},
+             {'id': 'e1', 'deployment_id': 'd1', 'status': 'started'},
+             {'id': 'e2', 'deployment_id': 'd2', 'status': 'failed'}],
+            [{'id': 'e1', 'deployment_id': 'd1', 'status': 'completed'}]]
+        executions = cloudify_api.wait_for_group_workflow(
+            ['d1', 'd2'], 'install', 30, execution_ids=['e1', 'e2'])
+        self.assertEqual('completed', executions['d1']['status'])
+        self.assertEqual('failed', executions['d2']['status'])
+        self.assertEqual(2, mock_executions.call_count)
+        mock_executions.assert_called_with(['d1'], 'install')
+
+    def test_returns_pending_deployments_on_timeout(self, mock_executions,
+                                                    _):
+        mock_executions.return_value = []
+        executions = cloudify_api.wait_for_group_workflow(
+            ['d1'], 'install', 0)
+        self.assertEqual({'d1': None}, executions)
+
+
+class BackoffDelaysTest(TestCase):
+
+    def test_delays_grow_to_maximum(self):
+        delays = backoff_delays(initial=1, factor=2, maximum=5)
+        self.assertEqual([next(delays) for _ in range(5)], [1, 2, 4, 5, 5])
+
+    def test_delays_are_capped_by_deadline(self):
+        deadline = datetime.now() + timedelta(seconds=3)
+        self.assertLessEqual(
+            next(backoff_delays(initial=10, deadline=deadline)), 3)
+
+    def test_delays_stop_at_deadline(self):
+        deadline = datetime.now() - timedelta(seconds=1)
+        self.assertEqual(list(backoff_delays(deadline=deadline)), [])
+
+    def test_jitter_spreads_delays(self):
+        delays = backoff_delays(initial=10, factor=1, jitter=0.2)
+        for delay in [next(delays) for _ in range(20)]:
+            self.assertGreaterEqual(delay, 8)
+            self.assertLessEqual(delay, 12)
+
+
+@patch('ecosystem_tests.dorkl.cloudify_api.events_page')
+class EventTailerTest(TestCase):
+
+    def test_fetches_pages_from_offset(self, mock_page):
+        mock_page.side_effect = [[{'id': 1}, {'id': 2}],
+                                 [{'id': 3}],
+                                 [],
+                                 [{'id': 4}]]
+        tailer = cloudify_api.EventTailer('ex', page_size=2)
+        self.assertEqual(list(tailer.new_events()),
+                         [{'id': 1}, {'id': 2}, {'id': 3}])
+        self.assertEqual(list(tailer.new_events()), [])
+        self.assertEqual(list(tailer.new_events()), [{'id': 4}])
+        self.assertEqual([c[0][1:] for c in mock_page.call_args_list],
+                         [(0, 2), (2, 2), (3, 2), (3, 2)])
+
+    def test_legacy_error_causes(self, mock_page):
+        mock_page.return_value = [
+            {'context': {'task_error_causes': ['cause']}},
+            {'context': {}}]
+        with patch.object(cloudify_api.logger, 'info') as mock_info:
+            cloudify_api.log_events('ex')
+        mock_info.assert_called_once_with(['cause'])
+
+
+@patch('ecosystem_tests.dorkl.cloudify_api.sleep')
+@patch('ecosystem_tests.dorkl.cloudify_api.stage_plugin_files',
+       return_value={})
+@patch('ecosystem_tests.dorkl.cloudify_api.get_plugin_inventory')
+@patch('ecosystem_tests.dorkl.cloudify_api.plugin_already_uploaded',
+       side_effect=lambda wagon_path, _: wagon_path == 'old.wgn')
+class UploadPluginsTest(TestCase):
+
+    @patch('ecosystem_tests.dorkl.cloudify_api.plugins_upload')
+    def test_uploads_missing_plugins(self, mock_upload, _, __, mock_stage,
+                                     *___):
+        cloudify_api.upload_plugins([('old.wgn', 'old.yaml'),
+                                     ('a.wgn', 'a.yaml'),
+                                     ('b.wgn', 'b.yaml')], workers=2)
+        mock_stage.assert_called_once_with([('a.wgn', 'a.yaml'),
+                                            ('b.wgn', 'b.yaml')])
+        self.assertEqual(sorted(c[0][0] for c in mock_upload.call_args_list),
+                         ['a.wgn', 'b.wgn'])
+
+    @patch('ecosystem_tests.dorkl.cloudify_api.plugins_upload')
+    def test_conflicts_are_retried(self, mock_upload, *_):
+        mock_upload.side_effect = [
+            EcosystemCommandError('Command failed.', 1, '409: conflict'),
+            'uploaded']
+        cloudify_api.upload_plugins([('a.wgn', 'a.yaml')])
+        self.assertEqual(mock_upload.call_count, 2)
+
+    @patch('ecosystem_tests.dorkl.cloudify_api.plugins_upload')
+    def test_rest_conflicts_are_retried(self, mock_upload, *_):
+        mock_upload.side_effect = [
+            CloudifyClientError('busy', status_code=409),
+            'uploaded']
+        cloudify_api.upload_plugins([('a.wgn', 'a.yaml')])
+        self.assertEqual(mock_upload.call_count, 2)
+
+    def test_conflict_is_matched_explicitly(self, *_):
+        for output, conflict in [('409: Conflict', True),
+                                 ('409 Client Error: Conflict for url', True),
+                                 ('Failed to fetch plugin-1.409.wgn', False),
+                                 ('Version conflict in requirements', False)]:
+            self.assertEqual(cloudify_api.upload_conflict(
+                EcosystemCommandError('Command failed.', 1, output)),
+                conflict, output)
+        self.assertFalse(cloudify_api.upload_conflict(
+            CloudifyClientError('conflict', status_code=404)))
+
+    @patch('ecosystem_tests.dorkl.cloudify_api.plugins_upload',
+           side_effect=EcosystemCommandError('Command failed.', 1, 'boom'))
+    def test_failures_are_reported(self, mock_upload, *_):
+        self.assertRaises(EcosystemTestException,
+                          cloudify_api.upload_plugins,
+                          [('a.wgn', 'a.yaml')])
+        mock_upload.assert_called_once()
+
+
+@patch.dict('os.environ', {'plain': 'dmFsdWUK', 'ssh_key': 'a2V5'})
+@patch('ecosystem_tests.dorkl.cloudify_api.list_cache', ListCache())
+@patch('ecosystem_tests.dorkl.cloudify_api.delete_file_from_docker')
+@patch('ecosystem_tests.dorkl.cloudify_api.copy_file_to_docker',
+       return_value='/tmp/secrets.json')
+class SecretsImportTest(TestCase):
+
+    def test_one_import_for_all_secrets(self, mock_copy, mock_delete):
+        imported = []
+
+        def copy_file_to_docker(local_path):
+            with open(local_path) as infile:
+                imported.extend(json.load(infile))
+            return '/tmp/secrets.json'
+
+        def cloudify_exec(cmd, **_):
+            if cmd == 'cfy secrets list':
+                return [{'key': 'plain'}, {'key': 'ssh_key'}]
+
+        mock_copy.side_effect = copy_file_to_docker
+
+        with patch('ecosystem_tests.dorkl.cloudify_api.cloudify_exec',
+                   side_effect=cloudify_exec) as mock_exec:
+            cloudify_api.create_test_secrets({'plain': False,
+                                              'ssh_key': True})
+        self.assertEqual(
+            [(s['key'], s['value']) for s in imported],
+            [('plain', 'value'), ('ssh_key', 'key')])
+        self.assertEqual(
+            [c[0][0] for c in mock_exec.call_args_list],
+            ['cfy secrets import -i /tmp/secrets.json --override-collisions',
+             'cfy secrets list'])
+        mock_delete.assert_called_once_with('/tmp/secrets.json')
+
+    @patch('ecosystem_tests.dorkl.cloudify_api.delete_files_from_docker')
+    @patch('ecosystem_tests.dorkl.cloudify_api.copy_files_to_docker')
+    def test_failed_import_falls_back(self,
+                                      mock_copy_files,
+                                      mock_delete_files,
+                                      *_):
+        copied = []
+        created = []
+
+        def copy_files_to_docker(local_paths):
+            for local_path in local_paths:
+                with open(local_path) as infile:
+                    copied.append(infile.read())
+            return {local_path: '/tmp/key' for local_path in local_paths}
+
+        async def cloudify_exec(cmd, **_):
+            created.append(cmd)
+
+        mock_copy_files.side_effect = copy_files_to_docker
+        with patch('ecosystem_tests.dorkl.cloudify_api.cloudify_exec',
+                   side_effect=EcosystemCommandError('Command failed.')), \
+                patch.object(cloudify_api.async_commands, 'cloudify_exec',
+                             cloudify_exec):
+            cloudify_api.secrets_import({'plain': False, 'ssh_key': True})
+        self.assertEqual(sorted(created),
+                         ['cfy secrets create -u plain -s value',
+                          'cfy secrets create -u ssh_key -f /tmp/key'])
+        self.assertEqual(copied, ['key'])
+        mock_delete_files.assert_called_once_with(['/tmp/key'])
+
+
+@patch('ecosystem_tests.dorkl.cloudify_api.delete_file_from_docker')
+@patch('ecosystem_tests.dorkl.cloudify_api.copy_file_to_docker')
+class PrepareInputsTest(TestCase):
+
+    def test_shared_inputs_file_is_copied_per_test(self,
+                                                   mock_copy,
+                                                   mock_delete):
+        copied = {}
+
+        def copy_file_to_docker(local_path):
+            with open(local_path) as infile:
+                copied[local_path] = infile.read()
+            return local_path
+
+        mock_copy.side_effect = copy_file_to_docker
+        with NamedTemporaryFile(mode='w') as inputs:
+            inputs.write('key: value\n')
+            inputs.flush()
+            with cloudify_api.prepare_inputs(inputs.name) as first, \
+                    cloudify_api.prepare_inputs(inputs.name) as second:
+                self.assertNotEqual(first, second)
+                mock_delete.assert_not_called()
+        self.assertEqual(list(copied.values()), ['key: value\n'] * 2)
+        self.assertEqual([c[0][0] for c in mock_delete.call_args_list],
+                         [second, first])
@@ -0,0 +1,291 @@
+########
+# Copyright (c) 2014-2022 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import io
+import os
+import shutil
+import tarfile
+import tempfile
+import subprocess
+
+from mock import patch, Mock
+from testtools import TestCase
+
+from ...dorkl import commands
+from ...dorkl.exceptions import (EcosystemTimeout,
+                                 EcosystemTestException,
+                                 EcosystemExecSessionError)
+
+
+class HandleProcessTest(TestCase):
+
+    def test_returns_output(self):
+        self.assertEqual(
+            commands.handle_process('printf "one\ntwo\n"', log=False),
+            'one\ntwo\n')
+
+    def test_logs_lines_as_they_arrive(self):
+        with patch.object(commands.logger, 'info') as mock_info, \
+                patch.object(commands.logger, 'error') as mock_error:
+            commands.handle_process(
+                'sh -c "echo out; echo err >&2"', stdout_color='')
+        self.assertIn(
+            'Execution output: out\n' + commands.RESET,
+            [c[0][0] for c in mock_info.call_args_list])
+        mock_error.assert_called_once_with(
+            commands.RED + 'Execution error: err\n' + commands.RESET)
+
+    def test_failure_raises(self):
+        self.assertRaises(EcosystemTestException,
+                          commands.handle_process, 'false', log=False)
+
+    def test_timeout_raises(self):
+        self.assertRaises(EcosystemTimeout,
+                          commands.handle_process,
+                          'sleep 5',
+                          timeout=0.2,
+                          log=False)
+
+    def test_timeout_closes_output(self):
+        buffers = []
+        processes = []
+        real_popen = subprocess.Popen
+
+        def spool(**kwargs):
+            buffers.append(tempfile.SpooledTemporaryFile(**kwargs))
+            return buffers[-1]
+
+        def popen(*args, **kwargs):
+            processes.append(real_popen(*args, **kwargs))
+            return processes[-1]
+
+        with patch('ecosystem_tests.dorkl.commands.SpooledTemporaryFile',
+                   side_effect=spool), \
+                patch('ecosystem_tests.dorkl.commands.subprocess.Popen',
+                      side_effect=popen):
+            self.assertRaises(EcosystemTimeout,
+                              commands.handle_process,
+                              'sleep 5',
+                              timeout=0.2,
+                              log=False)
+        self.assertEqual([b.closed for b in buffers], [True, True])
+        self.assertIsNotNone(processes[0].returncode)
+
+    def test_detach_returns_process(self):
+        p = commands.handle_process('sleep 0', detach=True, log=False)
+        self.assertEqual(p.wait(), 0)
+
+    def test_stdin_writer(self):
+        self.assertEqual(
+            commands.handle_process(
+                'cat', log=False, stdin_writer=lambda f: f.write(b'input')),
+            'input')
+
+    @patch('ecosystem_tests.dorkl.commands.OUTPUT_SPOOL_SIZE', 10)
+    def test_large_output_is_spilled(self):
+        output = commands.handle_process(
+            'sh -c "seq 1 1000"', log=False)
+        self.assertEqual(output.split(), [str(i) for i in range(1, 1001)])
+
+
+class DockerExecTest(TestCase):
+
+    @patch('ecosystem_tests.dorkl.commands.handle_process')
+    @patch('ecosystem_tests.dorkl.commands.exec_in_session',
+           return_value=(0, '{"a": 1}\n', ''))
+    def test_docker_exec_uses_session(self, mock_session, mock_process):
+        self.assertEqual(commands.cloudify_exec('cfy status'), {'a': 1})
+        mock_session.assert_called_once()
+        mock_process.assert_not_called()
+
+    @patch('ecosystem_tests.dorkl.commands.handle_process',
+           return_value='output')
+    @patch('ecosystem_tests.dorkl.commands.exec_in_session',
+           side_effect=EcosystemExecSessionError('no session'))
+    def test_docker_exec_falls_back(self, _, mock_process):
+        self.assertEqual(commands.docker_exec('ls'), 'output')
+        mock_process.assert_called_once()
+
+    @patch('ecosystem_tests.dorkl.commands.get_manager_container_name',
+           return_value='manager')
+    @patch('ecosystem_tests.dorkl.commands.docker_transport',
+           return_value='api')
+    def test_api_output_is_logged_as_it_arrives(self, *_):
+        logged = []
+
+        def exec_run(container, cmd, timeout, on_stdout, on_stderr):
+            on_stdout('one\n')
+            # The first line is logged before the command finishes.
+            self.assertEqual(len(logged), 1)
+            on_stderr('warning\n')
+            return 0, b'one\n', b'warning\n'
+
+        client = Mock()
+        client.exec_run.side_effect = exec_run
+        with patch('ecosystem_tests.dorkl.commands.get_docker_client',
+                   return_value=client), \
+                patch.object(commands, 'log_output_line',
+                             side_effect=lambda line, **_: logged.append(
+                                 line)), \
+                patch.object(commands, 'log_error_line',
+                             side_effect=logged.append):
+            self.assertEqual(commands.docker_exec('cfy status'), 'one\n')
+        self.assertEqual(logged, ['one\n', 'warning\n'])
+
+
+@patch.dict(os.environ, {'ECOSYSTEM_TEST_PUSH_CACHE': 'false'})
+@patch('ecosystem_tests.dorkl.commands.get_manager_container_name',
+       return_value='manager')
+class CopyDirectoryToDockerTest(TestCase):
+
+    @patch('ecosystem_tests.dorkl.commands.docker_transport',
+           return_value='cli')
+    @patch('ecosystem_tests.dorkl.commands.handle_process',
+           side_effect=EcosystemTestException('Command failed.'))
+    def test_cli_failure_raises(self, *_):
+        self.assertRaises(EcosystemTestException,
+                          commands.copy_directory_to_docker,
+                          '/blueprints/test/blueprint.yaml')
+
+    @patch('ecosystem_tests.dorkl.commands.docker_transport',
+           return_value='api')
+    @patch('ecosystem_tests.dorkl.commands.put_archive_to_docker',
+           side_effect=EcosystemTestException('No such container.'))
+    def test_api_failure_raises(self, *_):
+        self.assertRaises(EcosystemTestException,
+                          commands.copy_directory_to_docker,
+                          '/blueprints/test/blueprint.yaml')
+
+
+class CopyFilesToDockerTest(TestCase):
+
+    def setUp(self):
+        super(CopyFilesToDockerTest, self).setUp()
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.paths = []
+        for directory in ['one', 'two']:
+            os.mkdir(os.path.join(self.tmp, directory))
+            for name in ['plugin.yaml', directory + '.wgn']:
+                path = os.path.join(self.tmp, directory, name)
+                with open(path, 'w') as outfile:
+                    outfile.write(directory)
+                self.paths.append(path)
+        env = patch.dict(os.environ, {'ECOSYSTEM_TEST_PUSH_CACHE': 'false'})
+        env.start()
+        self.addCleanup(env.stop)
+
+    @patch('ecosystem_tests.dorkl.commands.get_manager_container_name',
+           return_value='manager')
+    @patch('ecosystem_tests.dorkl.commands.handle_process')
+    def test_single_tar_stream(self, mock_process, _):
+        remote_paths = commands.copy_files_to_docker(self.paths)
+        mock_process.assert_called_once()
+        self.assertEqual(mock_process.call_args[0][0],
+                         'docker cp - manager:/tmp')
+        archive = io.BytesIO()
+        mock_process.call_args[1]['stdin_writer'](archive)
+        archive.seek(0)
+        with tarfile.open(fileobj=archive) as tar:
+            names = tar.getnames()
+            self.assertEqual(
+                tar.extractfile('dorkl-2/plugin.yaml').read(), b'two')
+        self.assertEqual(
+            names, ['plugin.yaml', 'one.wgn', 'dorkl-2/plugin.yaml',
+                    'two.wgn'])
+        self.assertEqual(remote_paths, {
+            self.paths[0]: '/tmp/plugin.yaml',
+            self.paths[1]: '/tmp/one.wgn',
+            self.paths[2]: '/tmp/dorkl-2/plugin.yaml',
+            self.paths[3]: '/tmp/two.wgn'})
+
+    @patch('ecosystem_tests.dorkl.commands.copy_path_to_docker')
+    def test_single_file_uses_copy(self, mock_copy):
+        self.assertEqual(
+            commands.copy_files_to_docker(self.paths[:1]),
+            {self.paths[0]: '/tmp/plugin.yaml'})
+        mock_copy.assert_called_once_with(self.paths[0], '/tmp/plugin.yaml')
+
+
+@patch('ecosystem_tests.dorkl.commands.docker_exec')
+@patch('ecosystem_tests.dorkl.commands.copy_path_to_docker')
+class PushedFilesTest(TestCase):
+
+    def setUp(self):
+        super(PushedFilesTest, self).setUp()
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.container_id = 'first'
+        self.local_path = os.path.join(self.tmp, 'plugin.wgn')
+        with open(self.local_path, 'w') as outfile:
+            outfile.write('wagon')
+        env = patch.dict(os.environ, {
+            'ECOSYSTEM_TEST_CACHE_DIR': os.path.join(self.tmp, 'cache'),
+            'MANAGER_CONTAINER': 'manager'})
+        container_id = patch(
+            'ecosystem_tests.dorkl.commands.get_manager_container_id',
+            side_effect=lambda: self.container_id)
+        manifests = patch.dict('ecosystem_tests.dorkl.cache._manifests')
+        for patcher in [env, container_id, manifests]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def reload_manifests(self):
+        from ...dorkl import cache
+        cache._manifests.clear()
+
+    def test_unchanged_file_is_skipped(self, mock_copy, mock_exec):
+        commands.copy_file_to_docker(self.local_path)
+        self.reload_manifests()
+        self.assertEqual(commands.copy_file_to_docker(self.local_path),
+                         '/tmp/plugin.wgn')
+        mock_copy.assert_called_once_with(self.local_path, '/tmp/plugin.wgn')
+        mock_exec.assert_called_once_with('ls -d /tmp/plugin.wgn', log=False)
+
+    def test_changed_file_is_copied(self, mock_copy, _):
+        commands.copy_file_to_docker(self.local_path)
+        with open(self.local_path, 'w') as outfile:
+            outfile.write('new wagon')
+        commands.copy_file_to_docker(self.local_path)
+        self.assertEqual(mock_copy.call_count, 2)
+
+    def test_new_container_invalidates_manifest(self, mock_copy, mock_exec):
+        commands.copy_file_to_docker(self.local_path)
+        self.reload_manifests()
+        self.container_id = 'second'
+        commands.copy_file_to_docker(self.local_path)
+        self.assertEqual(mock_copy.call_count, 2)
+        mock_exec.assert_not_called()
+
+    def test_missing_remote_file_is_copied(self, mock_copy, mock_exec):
+        commands.copy_file_to_docker(self.local_path)
+        mock_exec.side_effect = EcosystemTestException('Command failed.')
+        commands.copy_file_to_docker(self.local_path)
+        self.assertEqual(mock_copy.call_count, 2)
+
+    def test_deleted_file_is_copied(self, mock_copy, _):
+        commands.copy_file_to_docker(self.local_path)
+        commands.delete_file_from_docker('/tmp/plugin.wgn')
+        commands.copy_file_to_docker(self.local_path)
+        self.assertEqual(mock_copy.call_count, 2)
+
+    def test_only_changed_files_are_streamed(self, mock_copy, _):
+        other_path = os.path.join(self.tmp, 'plugin.yaml')
+        with open(other_path, 'w') as outfile:
+            outfile.write('yaml')
+        commands.copy_file_to_docker(self.local_path)
+        commands.copy_files_to_docker([self.local_path, other_path])
+        mock_copy.assert_called_with(other_path, '/tmp/plugin.yaml')
+        self.assertEqual(mock_copy.call_count, 2)
@@ -0,0 +1,99 @@
+########
+# Copyright (c) 2014-2022 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import tempfile
+
+from mock import patch, Mock
+from testtools import TestCase
+
+from ...dorkl import runners
+from ...dorkl.parallel import current_test_id
+from ...dorkl.deployment_pool import DeploymentPool
+from ...dorkl.exceptions import EcosystemTestException
+
+
+class DeploymentPoolTest(TestCase):
+
+    def setUp(self):
+        super(DeploymentPoolTest, self).setUp()
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.pool = DeploymentPool(os.path.join(self.tmp, 'pool.json'),
+                                   size=1,
+                                   max_age=60)
+
+    def test_deployment_is_leased_once(self):
+        self.assertTrue(self.pool.add('fp', 'dep'))
+        self.assertIsNone(self.pool.lease('other', 'test1'))
+        self.assertEqual('dep', self.pool.lease('fp', 'test1'))
+        self.assertIsNone(self.pool.lease('fp', 'test2'))
+        self.pool.release('dep')
+        self.assertEqual('dep', self.pool.lease('fp', 'test2'))
+
+    def test_pool_keeps_size_deployments_per_fingerprint(self):
+        self.assertTrue(self.pool.add('fp', 'dep1'))
+        self.assertFalse(self.pool.add('fp', 'dep2'))
+        self.assertTrue(self.pool.add('other', 'dep3'))
+        self.assertEqual(['dep1', 'dep3'], self.pool.deployments())
+
+    def test_old_free_deployments_expire(self):
+        with patch('ecosystem_tests.dorkl.deployment_pool.time',
+                   return_value=0):
+            self.pool.add('fp', 'dep1')
+            self.pool.add('other', 'dep2')
+            self.pool.lease('other', 'test')
+        self.assertEqual(['dep1'], self.pool.take_expired())
+        self.assertEqual(['dep2'], self.pool.deployments())
+
+
+class PooledTestPathTest(TestCase):
+
+    def setUp(self):
+        super(PooledTestPathTest, self).setUp()
+        self.pool = Mock()
+
+    @patch('ecosystem_tests.dorkl.runners.discard_test_state')
+    @patch('ecosystem_tests.dorkl.runners.deployments_list',
+           return_value=[{'id': 'dep2'}])
+    @patch('ecosystem_tests.dorkl.runners.cleanup_on_failure')
+    def test_lease_skips_expired_and_missing_deployments(
+            self, cleanup_on_failure, *_):
+        self.pool.take_expired.return_value = ['old']
+        self.pool.lease.side_effect = ['dep1', 'dep2']
+        self.assertEqual('dep2', runners.lease_pooled_deployment(
+            self.pool, 'fp', 'test'))
+        cleanup_on_failure.assert_called_once_with('old')
+        self.pool.remove.assert_called_once_with('dep1')
+
+    def test_check_runs_on_the_pooled_deployment(self):
+        check = Mock(side_effect=lambda: self.assertEqual(
+            'dep', current_test_id()))
+        runners.pooled_test_path(self.pool, 'dep', 'test', check)
+        check.assert_called_once_with()
+        self.pool.release.assert_called_once_with('dep')
+
+    @patch('ecosystem_tests.dorkl.runners.evict_pooled_deployment')
+    def test_failed_check_evicts_the_deployment(self, evict):
+        self.assertRaises(EcosystemTestException,
+                          runners.pooled_test_path,
+                          self.pool,
+                          'dep',
+                          'test',
+                          Mock(side_effect=Exception('check failed')))
+        self.pool.remove.assert_called_once_with('dep')
+        evict.assert_called_once_with('dep')
+        self.pool.release.assert_not_called()
@@ -0,0 +1,209 @@
+########
+# Copyright (c) 2014-2022 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import io
+import os
+import json
+import shutil
+import struct
+import tarfile
+import tempfile
+import threading
+from mock import patch
+from testtools import TestCase
+
+try:
+    from socketserver import ThreadingMixIn, UnixStreamServer
+    from http.server import BaseHTTPRequestHandler
+except ImportError:
+    from SocketServer import ThreadingMixIn, UnixStreamServer
+    from BaseHTTPServer import BaseHTTPRequestHandler
+
+from ...dorkl import commands
+from ...dorkl.docker_api import (DockerEngineError,
+                                 DockerEngineClient,
+                                 OutputLines)
+
+
+def frame(stream_type, data):
+    return struct.pack('>BxxxL', stream_type, len(data)) + data
+
+
+class FakeDockerHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *_):
+        pass
+
+    def _body(self):
+        length = int(self.headers.get('Content-Length', 0))
+        if length:
+            return self.rfile.read(length)
+        if self.headers.get('Transfer-Encoding') == 'chunked':
+            data = b''
+            while True:
+                size = int(self.rfile.readline().strip(), 16)
+                chunk = self.rfile.read(size)
+                self.rfile.readline()
+                if not size:
+                    return data
+                data += chunk
+        return b''
+
+    def _json(self, status, payload):
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path.startswith('/containers/json'):
+            return self._json(200, [{'Id': 'abcdef1234567890',
+                                     'Image': 'manager:latest',
+                                     'Names': ['/cfy_manager'],
+                                     'State': 'running',
+                                     'Status': 'Up'}])
+        if self.path == '/exec/e1/json':
+            return self._json(200, {'ExitCode': self.server.exit_code})
+        return self._json(404, {'message': 'page not found'})
+
+    def do_POST(self):
+        self.server.requests.append((self.path, self._body()))
+        if self.path == '/containers/cfy_manager/exec':
+            return self._json(201, {'Id': 'e1'})
+        if self.path == '/exec/e1/start':
+            # The daemon hijacks the connection for the attach stream.
+            self.send_response(200)
+            self.send_header('Content-Type',
+                             'application/vnd.docker.raw-stream')
+            self.end_headers()
+            self.wfile.write(frame(1, b'hello ') +
+                             frame(2, b'warning\n') +
+                             frame(1, b'world\n'))
+            self.close_connection = True
+            return
+        if self.path.startswith('/images/load'):
+            return self._json(
+                200, {'stream': 'Loaded image: manager:latest\n'})
+        if self.path.startswith('/commit'):
+            return self._json(201, {'Id': 'sha256:snapshot'})
+        return self._json(404, {'message': 'no such container'})
+
+    def do_PUT(self):
+        self.server.requests.append((self.path, self._body()))
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+
+class FakeDockerServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path):
+        UnixStreamServer.__init__(self, path, FakeDockerHandler)
+        self.requests = []
+        self.exit_code = 0
+
+
+class DockerEngineClientTest(TestCase):
+
+    def setUp(self):
+        super(DockerEngineClientTest, self).setUp()
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.server = FakeDockerServer(os.path.join(self.tmp, 'docker.sock'))
+        thread = threading.Thread(target=self.server.serve_forever,
+                                  kwargs={'poll_interval': 0.05})
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.client = DockerEngineClient(self.server.server_address)
+        self.addCleanup(self.client.close)
+
+    def test_connections_are_kept_alive(self):
+        self.client.containers()
+        self.client.containers()
+        self.assertEqual(len(self.client._idle), 1)
+
+    def test_error_response(self):
+        error = self.assertRaises(DockerEngineError,
+                                  self.client.inspect_container, 'missing')
+        self.assertEqual(error.status, 404)
+
+    def test_exec_run_demultiplexes_output(self):
+        self.server.exit_code = 3
+        returncode, stdout, stderr = self.client.exec_run(
+            'cfy_manager', ['cfy', 'status'])
+        self.assertEqual(returncode, 3)
+        self.assertEqual(stdout, b'hello world\n')
+        self.assertEqual(stderr, b'warning\n')
+        self.assertEqual(json.loads(self.server.requests[0][1].decode()),
+                         {'AttachStdout': True,
+                          'AttachStderr': True,
+                          'Cmd': ['cfy', 'status']})
+
+    def test_exec_run_passes_lines(self):
+        stdout, stderr = [], []
+        self.client.exec_run('cfy_manager', ['cfy', 'status'],
+                             on_stdout=stdout.append,
+                             on_stderr=stderr.append)
+        self.assertEqual((stdout, stderr), (['hello world\n'], ['warning\n']))
+
+    def test_lines_split_across_frames(self):
+        lines = []
+        output = OutputLines(lines.append)
+        for frame in [b'one\ntw', b'o\n', b'three']:
+            output.write(frame)
+        self.assertEqual(lines, ['one\n', 'two\n'])
+        output.flush()
+        self.assertEqual(lines, ['one\n', 'two\n', 'three'])
+
+    def test_load_image(self):
+        self.assertEqual(self.client.load_image(io.BytesIO(b'tar')),
+                         'manager:latest')
+
+    def test_commit(self):
+        self.assertEqual(
+            self.client.commit('cfy_manager', 'snapshot', 'abc',
+                               {'fingerprint': 'abc'}),
+            'sha256:snapshot')
+        path, body = self.server.requests[0]
+        self.assertIn('container=cfy_manager', path)
+        self.assertIn('tag=abc', path)
+        self.assertEqual(json.loads(body.decode()),
+                         {'Labels': {'fingerprint': 'abc'}})
+
+    @patch('ecosystem_tests.dorkl.commands.get_manager_container_name',
+           return_value='cfy_manager')
+    def test_transport_is_used_by_commands(self, _):
+        local_file = os.path.join(self.tmp, 'plugin.yaml')
+        with open(local_file, 'w') as outfile:
+            outfile.write('plugins: {}')
+        with patch.dict(os.environ,
+                        {'ECOSYSTEM_TEST_DOCKER_TRANSPORT': 'api'}), \
+                patch('ecosystem_tests.dorkl.commands.get_docker_client',
+                      return_value=self.client):
+            self.assertEqual(commands.docker_exec('cfy status', log=False),
+                             'hello world\n')
+            self.assertEqual(commands.copy_file_to_docker(local_file),
+                             '/tmp/plugin.yaml')
+        path, body = self.server.requests[-1]
+        self.assertEqual(path, '/containers/cfy_manager/archive?path=%2Ftmp')
+        with tarfile.open(fileobj=io.BytesIO(body)) as tar:
+            self.assertEqual(
+                tar.extractfile('plugin.yaml').read(), b'plugins: {}')
@@ -0,0 +1,83 @@
+########
+# Copyright (c) 2014-2022 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from testtools import TestCase
+
+from ...dorkl.exec_session import ExecSession, ExecSessionPool
+from ...dorkl.exceptions import (EcosystemTimeout,
+                                 EcosystemExecSessionError)
+
+
+class ExecSessionTest(TestCase):
+
+    def setUp(self):
+        super(ExecSessionTest, self).setUp()
+        self.session = ExecSession(['sh'])
+        self.session.start()
+        self.addCleanup(self.session.close)
+
+    def test_run_returns_framed_output(self):
+        returncode, stdout, stderr = self.session.run('echo hello world')
+        self.assertEqual(returncode, 0)
+        self.assertEqual(stdout, 'hello world\n')
+        self.assertEqual(stderr, '')
+
+    def test_run_keeps_output_without_trailing_newline(self):
+        _, stdout, _ = self.session.run('printf abc')
+        self.assertEqual(stdout, 'abc')
+
+    def test_run_returns_exit_code_and_stderr(self):
+        returncode, _, stderr = self.session.run(
+            'sh -c "echo oops >&2; exit 3"')
+        self.assertEqual(returncode, 3)
+        self.assertEqual(stderr, 'oops\n')
+
+    def test_run_does_not_interpret_arguments(self):
+        _, stdout, _ = self.session.run("echo '$HOME; exit 1'")
+        self.assertEqual(stdout, '$HOME; exit 1\n')
+        self.assertTrue(self.session.alive)
+
+    def test_run_passes_lines_as_they_arrive(self):
+        lines = []
+        _, stdout, _ = self.session.run(
+            'sh -c "echo one; echo two; printf three"',
+            on_stdout=lines.append)
+        self.assertEqual(lines, ['one\n', 'two\n', 'three'])
+        self.assertEqual(''.join(lines), stdout)
+        lines = []
+        self.session.run('echo four', on_stdout=lines.append)
+        self.assertEqual(lines, ['four\n'])
+
+    def test_timeout_closes_session(self):
+        self.assertRaises(EcosystemTimeout,
+                          self.session.run, 'sleep 5', timeout=0.2)
+        self.assertFalse(self.session.alive)
+
+
+class ExecSessionPoolTest(TestCase):
+
+    def test_sessions_are_reused(self):
+        pool = ExecSessionPool(lambda: ExecSession(['sh']))
+        self.addCleanup(pool.close)
+        with pool.session() as first:
+            pass
+        with pool.session() as second:
+            self.assertIs(first, second)
+
+    def test_unavailable_after_failed_start(self):
+        pool = ExecSessionPool(
+            lambda: ExecSession(['/non/existing/docker']))
+        self.assertRaises(EcosystemExecSessionError, pool.acquire)
+        self.assertFalse(pool.available)
@@ -0,0 +1,86 @@
+########
+# Copyright (c) 2014-2022 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import logging
+import threading
+
+from mock import patch
+from testtools import TestCase
+
+from ...dorkl import parallel, commands
+
+
+class RunTestsInParallelTest(TestCase):
+
+    def test_every_test_has_its_own_id(self):
+        seen = {}
+        barrier = threading.Barrier(2, timeout=5)
+
+        def test_fn(blueprint, test_id):
+            barrier.wait()
+            seen[test_id] = parallel.current_test_id()
+
+        results = parallel.run_tests_in_parallel(
+            [('bp1.yaml', 'test1'), ('bp2.yaml', 'test2')], test_fn, 2)
+        self.assertEqual(seen, {'test1': 'test1', 'test2': 'test2'})
+        self.assertEqual([r.status for r in results],
+                         [parallel.PASSED, parallel.PASSED])
+
+    def test_failure_does_not_stop_other_tests(self):
+        def test_fn(blueprint, test_id):
+            if test_id == 'test1':
+                raise Exception('boom')
+
+        results = parallel.run_tests_in_parallel(
+            [('bp1.yaml', 'test1'), ('bp2.yaml', 'test2')], test_fn, 2)
+        self.assertEqual([(r.test_id, r.status, r.error) for r in results],
+                         [('test1', parallel.FAILED, 'boom'),
+                          ('test2', parallel.PASSED, None)])
+
+    def test_log_lines_are_prefixed(self):
+        test_logger = logging.getLogger('test_parallel')
+        records = []
+        handler = logging.Handler()
+        handler.emit = records.append
+        test_logger.addHandler(handler)
+        self.addCleanup(test_logger.removeHandler, handler)
+        parallel.run_tests_in_parallel(
+            [('bp.yaml', 'test1')],
+            lambda *_: test_logger.info('Installing %s', 'now'),
+            1,
+            test_logger)
+        self.assertEqual([r.getMessage() for r in records],
+                         ['[test1] Installing now'])
+
+    def test_command_output_is_prefixed(self):
+        records = []
+        handler = logging.Handler()
+        handler.emit = records.append
+        commands.logger.addHandler(handler)
+        self.addCleanup(commands.logger.removeHandler, handler)
+        parallel.run_tests_in_parallel(
+            [('bp.yaml', 'test1')],
+            lambda *_: commands.handle_process('echo hello', stdout_color=''),
+            1)
+        self.assertIn('[test1] Execution output: hello\n' + commands.RESET,
+                      [r.getMessage() for r in records])
+
+    @patch.dict(os.environ, {'__ECOSYSTEM_TEST_ID': 'from_env'})
+    def test_id_outside_a_test_comes_from_env(self):
+        self.assertEqual(parallel.current_test_id(), 'from_env')
+        with parallel.test_id_context('test1'):
+            self.assertEqual(parallel.current_test_id(), 'test1')
+        self.assertEqual(parallel.current_test_id(), 'from_env')
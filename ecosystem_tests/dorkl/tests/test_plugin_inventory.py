@@ -0,0 +1,112 @@
+########
+# Copyright (c) 2014-2022 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import json
+import shutil
+import tarfile
+import tempfile
+
+from mock import patch
+from testtools import TestCase
+
+from ...dorkl import plugin_inventory
+from ...dorkl.plugin_inventory import (wagon_key,
+                                       PluginInventory,
+                                       wagon_key_from_name)
+
+METADATA = {'package_name': 'cloudify-aws-plugin',
+            'package_version': '2.12.0',
+            'build_server_os_properties': {'distribution': 'Centos'}}
+KEY = ('cloudify-aws-plugin', '2.12.0', 'centos')
+
+
+class PluginInventoryTest(TestCase):
+
+    def setUp(self):
+        super(PluginInventoryTest, self).setUp()
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        for patcher in [
+                patch.dict(os.environ, {'ECOSYSTEM_TEST_CACHE_DIR': self.tmp}),
+                patch.dict(plugin_inventory._wagon_keys, clear=True)]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def create_wagon(self):
+        package_dir = os.path.join(self.tmp, 'cloudify-aws-plugin')
+        os.mkdir(package_dir)
+        with open(os.path.join(package_dir, 'package.json'), 'w') as outfile:
+            json.dump(METADATA, outfile)
+        wagon_path = os.path.join(self.tmp, 'plugin.wgn')
+        with tarfile.open(wagon_path, 'w:gz') as tar:
+            tar.add(package_dir, arcname='cloudify-aws-plugin')
+        return wagon_path
+
+    def test_key_from_name(self):
+        self.assertEqual(
+            wagon_key_from_name('cloudify_aws_plugin-2.12.0-centos-Core-'
+                                'py36-none-linux_x86_64.wgn'),
+            KEY)
+        self.assertIsNone(
+            wagon_key_from_name('cloudify_aws_plugin-2.12.0-py36-none-'
+                                'linux_x86_64.wgn'))
+        self.assertIsNone(
+            wagon_key_from_name('cloudify_aws_plugin-2.12.0-manylinux2014-'
+                                'py36-none-linux_x86_64.wgn'))
+
+    @patch('ecosystem_tests.dorkl.plugin_inventory.show')
+    def test_local_wagon_is_not_extracted(self, mock_show):
+        self.assertEqual(wagon_key(self.create_wagon()), KEY)
+        mock_show.assert_not_called()
+
+    @patch('ecosystem_tests.dorkl.plugin_inventory.show',
+           return_value=METADATA)
+    def test_remote_wagon_is_downloaded_once(self, mock_show):
+        url = 'https://example.com/wagons/plugin.wgn'
+        self.assertEqual(wagon_key(url), KEY)
+        plugin_inventory._wagon_keys.clear()
+        self.assertEqual(wagon_key(url), KEY)
+        mock_show.assert_called_once_with(url)
+
+    @patch('ecosystem_tests.dorkl.plugin_inventory.show')
+    def test_remote_wagon_name_is_enough(self, mock_show):
+        self.assertEqual(
+            wagon_key('https://example.com/cloudify_aws_plugin-2.12.0-'
+                      'centos-Core-py36-none-linux_x86_64.wgn'),
+            KEY)
+        mock_show.assert_not_called()
+
+    def test_inventory_lookup(self):
+        inventory = PluginInventory([
+            {'package_name': 'cloudify-aws-plugin',
+             'package_version': '2.12.0',
+             'distribution': 'centos'}])
+        self.assertIn(KEY, inventory)
+        self.assertNotIn(('cloudify-aws-plugin', '2.11.0', 'centos'),
+                         inventory)
+        inventory.add(('cloudify-aws-plugin', '2.11.0', 'centos'))
+        self.assertIn(('cloudify-aws-plugin', '2.11.0', 'centos'), inventory)
+
+    def test_inventory_lookup_without_distribution(self):
+        inventory = PluginInventory([
+            {'package_name': 'cloudify-aws-plugin',
+             'package_version': '2.12.0',
+             'distribution': '',
+             'yaml_url_path': 'plugin:cloudify-aws-plugin?version=2.12.0&'
+                              'distribution=centos'}])
+        self.assertIn(KEY, inventory)
+        self.assertNotIn(('cloudify-aws-plugin', '2.12.0', 'ubuntu'),
+                         inventory)
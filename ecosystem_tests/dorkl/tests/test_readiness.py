@@ -0,0 +1,88 @@
+########
+# Copyright (c) 2014-2022 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from mock import patch, Mock
+from testtools import TestCase
+from requests.exceptions import ConnectionError
+
+from ...dorkl import readiness
+from ...dorkl.exceptions import EcosystemTimeout, EcosystemTestException
+
+
+def rest_status(overall='OK', **services):
+    return {'status': overall,
+            'services': {name: {'status': status}
+                         for name, status in services.items()}}
+
+
+@patch('ecosystem_tests.dorkl.readiness.sleep')
+class WaitForManagerTest(TestCase):
+
+    def test_polls_until_services_are_active(self, mock_sleep):
+        probe = Mock(side_effect=[
+            ConnectionError('refused'),
+            rest_status('Fail', Webserver='Active', Worker='Inactive'),
+            rest_status(Webserver='Active', Worker='Active')])
+        self.assertEqual(readiness.wait_for_manager(60, probes=[probe]),
+                         {'Webserver': 'Active', 'Worker': 'Active'})
+        self.assertEqual(probe.call_count, 3)
+        self.assertEqual(mock_sleep.call_count, 2)
+
+    def test_ready_manager_does_not_sleep(self, mock_sleep):
+        readiness.wait_for_manager(
+            60, probes=[Mock(return_value=rest_status(Webserver='Active'))])
+        mock_sleep.assert_not_called()
+
+    def test_falls_back_to_next_probe(self, _):
+        cli_probe = Mock(return_value=[
+            {'service': 'Webserver', 'status': 'Active'}])
+        self.assertEqual(
+            readiness.wait_for_manager(
+                60, probes=[Mock(side_effect=EcosystemTestException('no')),
+                            cli_probe]),
+            {'Webserver': 'Active'})
+        cli_probe.assert_called_once_with()
+
+    def test_waits_only_for_given_services(self, _):
+        readiness.wait_for_manager(
+            60,
+            probes=[Mock(return_value=rest_status(
+                Webserver='Active', Monitoring='Inactive'))],
+            services=['Webserver'])
+
+    def test_deadline_names_services(self, _):
+        e = self.assertRaises(
+            EcosystemTimeout,
+            readiness.wait_for_manager,
+            0,
+            probes=[Mock(return_value=rest_status(
+                'Fail', Webserver='Active', Worker='Inactive'))])
+        self.assertIn('waiting for: Worker.', str(e))
+
+    def test_ok_manager_with_inactive_optional_service(self, mock_sleep):
+        readiness.wait_for_manager(
+            60,
+            probes=[Mock(return_value=rest_status(
+                Webserver='Active', Monitoring='Inactive'))])
+        mock_sleep.assert_not_called()
+
+    def test_given_services_are_checked_on_ok_manager(self, _):
+        self.assertRaises(
+            EcosystemTimeout,
+            readiness.wait_for_manager,
+            0,
+            probes=[Mock(return_value=rest_status(
+                Webserver='Active', Monitoring='Inactive'))],
+            services=['Monitoring'])
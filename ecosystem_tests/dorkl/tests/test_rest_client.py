@@ -0,0 +1,136 @@
+########
+# Copyright (c) 2014-2022 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+
+import requests
+from mock import patch, Mock
+from testtools import TestCase
+from cloudify_rest_client.exceptions import CloudifyClientError
+
+from ...dorkl import rest_client, cloudify_api
+from ...dorkl.exceptions import EcosystemTestException
+
+
+class CallManagerTest(TestCase):
+
+    def setUp(self):
+        super(CallManagerTest, self).setUp()
+        self.client = Mock()
+        for patcher in [
+                patch.dict(os.environ,
+                           {'ECOSYSTEM_TEST_MANAGER_BACKEND': 'rest'}),
+                patch.object(rest_client, '_rest_available', True),
+                patch.object(rest_client, 'get_rest_client',
+                             return_value=self.client)]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_cli_backend(self):
+        cli = Mock(return_value='cli')
+        with patch.dict(os.environ, {'ECOSYSTEM_TEST_MANAGER_BACKEND': 'cli'}):
+            self.assertEqual(rest_client.call_manager(Mock(), cli), 'cli')
+
+    def test_invalid_backend(self):
+        with patch.dict(os.environ,
+                        {'ECOSYSTEM_TEST_MANAGER_BACKEND': 'other'}):
+            self.assertRaises(EcosystemTestException,
+                              rest_client.call_manager, Mock(), Mock())
+
+    def test_rest_backend(self):
+        cli = Mock()
+        self.assertEqual(
+            rest_client.call_manager(lambda client: client, cli),
+            self.client)
+        cli.assert_not_called()
+
+    def test_rest_errors_raise(self):
+        def rest(_):
+            raise CloudifyClientError('not found', status_code=404)
+        self.assertRaises(EcosystemTestException,
+                          rest_client.call_manager, rest, Mock())
+
+    def test_unreachable_falls_back_to_cli(self):
+        rest = Mock(side_effect=requests.exceptions.ConnectionError())
+        cli = Mock(return_value='cli')
+        self.assertEqual(rest_client.call_manager(rest, cli), 'cli')
+        self.assertEqual(rest_client.call_manager(rest, cli), 'cli')
+        rest.assert_called_once()
+
+    def test_deployment_outputs_shape(self):
+        self.client.deployments.outputs.get.return_value = {
+            'deployment_id': 'dep', 'outputs': {'ip': '10.0.0.1'}}
+        self.assertEqual(
+            cloudify_api.get_deployment_output_by_name('dep', 'ip'),
+            '10.0.0.1')
+
+    def test_executions_list_of_missing_deployment(self):
+        self.client.executions.list.return_value = []
+        self.client.deployments.get.side_effect = CloudifyClientError(
+            'not found', status_code=404)
+        self.assertRaises(EcosystemTestException,
+                          cloudify_api.executions_list, 'dep')
+        self.client.executions.list.assert_called_once_with(
+            deployment_id='dep',
+            include_system_workflows=True,
+            sort='created_at')
+
+    def test_events_page(self):
+        self.client.events.list.return_value = [{'id': 3}]
+        self.assertEqual(cloudify_api.events_page('ex', 2, 100), [{'id': 3}])
+        self.client.events.list.assert_called_once_with(
+            execution_id='ex',
+            include_logs=True,
+            _offset=2,
+            _size=100,
+            sort='reported_timestamp')
+
+    def test_events_page_falls_back_to_cli(self):
+        self.client.events.list.side_effect = \
+            requests.exceptions.ConnectionError()
+        with patch('ecosystem_tests.dorkl.cloudify_api.cloudify_exec',
+                   return_value='{"id": 3}\n{"id": 4}\n') as mock_exec:
+            self.assertEqual(cloudify_api.events_page('ex', 2, 100),
+                             [{'id': 3}, {'id': 4}])
+        mock_exec.assert_called_once_with(
+            'cfy events list ex --pagination-offset 2 '
+            '--pagination-size 100 --json', get_json=False, log=False)
+
+
+@patch.object(rest_client, '_endpoint', None)
+@patch('ecosystem_tests.dorkl.rest_client.cloudify_exec')
+class RestEndpointTest(TestCase):
+
+    def test_endpoint_of_the_profile(self, mock_exec):
+        mock_exec.return_value = {'manager_ip': '172.17.0.2',
+                                  'rest_protocol': 'https',
+                                  'rest_port': 443}
+        with patch('ecosystem_tests.dorkl.rest_client.CloudifyClient') \
+                as mock_client:
+            rest_client.create_rest_client()
+            rest_client.create_rest_client()
+        self.assertEqual(
+            [(c[1]['protocol'], c[1]['port'], c[1]['trust_all'])
+             for c in mock_client.call_args_list],
+            [('https', 443, True)] * 2)
+        mock_exec.assert_called_once_with('cfy profiles show-current',
+                                          log=False)
+
+    def test_defaults_until_the_profile_is_read(self, mock_exec):
+        mock_exec.side_effect = EcosystemTestException('No profile.')
+        self.assertEqual(rest_client.rest_endpoint(), ('http', 80))
+        mock_exec.side_effect = None
+        mock_exec.return_value = {'rest_protocol': 'http', 'rest_port': 8080}
+        self.assertEqual(rest_client.rest_endpoint(), ('http', 8080))
@@ -0,0 +1,92 @@
+########
+# Copyright (c) 2014-2022 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import tempfile
+
+from mock import patch, Mock
+from testtools import TestCase
+
+from ...dorkl import result_cache
+
+PLUGIN = {'package_name': 'cloudify-aws-plugin',
+          'package_version': '3.0.0',
+          'distribution': 'centos'}
+
+
+class ResultCacheTest(TestCase):
+
+    def setUp(self):
+        super(ResultCacheTest, self).setUp()
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        env = patch.dict(os.environ, {'ECOSYSTEM_TEST_CACHE_DIR': self.tmp})
+        env.start()
+        self.addCleanup(env.stop)
+        plugins = patch.object(result_cache, 'plugins_list',
+                               return_value=[PLUGIN])
+        self.plugins_list = plugins.start()
+        self.addCleanup(plugins.stop)
+        version = patch.object(result_cache, 'manager_version',
+                               return_value={'version': '6.4.1'})
+        self.manager_version = version.start()
+        self.addCleanup(version.stop)
+        blueprint_dir = os.path.join(self.tmp, 'blueprints')
+        os.makedirs(blueprint_dir)
+        self.blueprint = os.path.join(blueprint_dir, 'blueprint.yaml')
+        with open(self.blueprint, 'w') as outfile:
+            outfile.write('tosca_definitions_version: cloudify_dsl_1_3')
+
+    def fingerprint(self, inputs=None):
+        return result_cache.blueprint_test_fingerprint(self.blueprint, inputs)
+
+    def test_passed_test_is_skipped(self):
+        run = Mock()
+        self.assertIsNone(result_cache.run_cached_test(
+            'first', self.blueprint, {'a': 'b'}, run))
+        self.assertEqual(result_cache.CACHED_PASS,
+                         result_cache.run_cached_test(
+                             'second', self.blueprint, {'a': 'b'}, run))
+        run.assert_called_once_with()
+
+    def test_failed_test_is_not_cached(self):
+        run = Mock(side_effect=Exception('failed'))
+        for _ in range(2):
+            self.assertRaises(Exception, result_cache.run_cached_test,
+                              'test', self.blueprint, None, run)
+        self.assertEqual(2, run.call_count)
+
+    def test_fingerprint_changes_with_the_test(self):
+        fingerprint = self.fingerprint()
+        self.assertEqual(fingerprint, self.fingerprint())
+        self.assertNotEqual(fingerprint, self.fingerprint({'a': 'b'}))
+        self.plugins_list.return_value = [dict(PLUGIN, package_version='3.1')]
+        self.assertNotEqual(fingerprint, self.fingerprint())
+        self.plugins_list.return_value = [PLUGIN]
+        self.manager_version.return_value = {'version': '7.0.0'}
+        self.assertNotEqual(fingerprint, self.fingerprint())
+        self.manager_version.return_value = {'version': '6.4.1'}
+        with open(os.path.join(os.path.dirname(self.blueprint),
+                               'imported.yaml'), 'w') as outfile:
+            outfile.write('node_types: {}')
+        self.assertNotEqual(fingerprint, self.fingerprint())
+
+    def test_test_runs_without_fingerprint(self):
+        self.plugins_list.side_effect = Exception('manager is down')
+        run = Mock()
+        for _ in range(2):
+            result_cache.run_cached_test('test', self.blueprint, None, run)
+        self.assertEqual(2, run.call_count)
@@ -0,0 +1,180 @@
+########
+# Copyright (c) 2014-2022 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import logging
+
+from mock import patch, Mock
+from testtools import TestCase
+
+from ...dorkl import runners
+from ...dorkl.exceptions import EcosystemTestException
+
+
+class DiagnosticsTest(TestCase):
+
+    def test_on_failure_mode_skips_snapshots(self):
+        snapshot = Mock()
+        with patch.dict(os.environ):
+            os.environ.pop('ECOSYSTEM_TEST_DIAGNOSTICS', None)
+            runners.log_diagnostics('Blueprints list', snapshot)
+        snapshot.assert_not_called()
+
+    def test_always_mode_logs_snapshots(self):
+        snapshot = Mock(return_value=[])
+        with patch.dict(os.environ,
+                        {'ECOSYSTEM_TEST_DIAGNOSTICS': 'always'}):
+            runners.log_diagnostics('Blueprints list', snapshot)
+        snapshot.assert_called_once_with()
+
+    def test_debug_mode_skips_snapshots_without_debug_logs(self):
+        snapshot = Mock(return_value=[])
+        root = logging.getLogger()
+        self.addCleanup(root.setLevel, root.level)
+        root.setLevel(logging.WARNING)
+        with patch.dict(os.environ,
+                        {'ECOSYSTEM_TEST_DIAGNOSTICS': 'debug'}):
+            runners.log_diagnostics('Blueprints list', snapshot)
+            snapshot.assert_not_called()
+            root.setLevel(logging.DEBUG)
+            runners.log_diagnostics('Blueprints list', snapshot)
+        snapshot.assert_called_once_with()
+
+    def test_invalid_mode(self):
+        with patch.dict(os.environ, {'ECOSYSTEM_TEST_DIAGNOSTICS': 'never'}):
+            self.assertRaises(EcosystemTestException,
+                              runners.log_diagnostics, 'Blueprints', Mock())
+
+    @patch('ecosystem_tests.dorkl.runners.deployments_list',
+           return_value=[{'id': 'dep'}])
+    @patch('ecosystem_tests.dorkl.runners.blueprints_list',
+           side_effect=EcosystemTestException('Command failed.'))
+    def test_failure_diagnostics_keep_the_failure(self, *_):
+        def fail():
+            with runners.failure_diagnostics():
+                raise ValueError('test failed')
+        with patch.object(runners.logger, 'info') as mock_info:
+            self.assertRaises(ValueError, fail)
+        mock_info.assert_called_once_with(
+            "Deployments list: [{'id': 'dep'}]")
+
+
+@patch('ecosystem_tests.dorkl.runners.blueprints_upload')
+@patch('ecosystem_tests.dorkl.runners.deployment_group_create')
+@patch('ecosystem_tests.dorkl.runners.execution_group_start',
+       return_value={'execution_ids': ['e1', 'e2']})
+@patch('ecosystem_tests.dorkl.runners.uninstall_deployment_group')
+@patch('ecosystem_tests.dorkl.runners.wait_for_group_workflow')
+class DeploymentGroupTest(TestCase):
+
+    def executions(self, workflow_id, *statuses):
+        return dict(('test-{0}'.format(index), {'workflow_id': workflow_id,
+                                                'status': status,
+                                                'waited': 1})
+                    for index, status in enumerate(statuses, 1))
+
+    def run_test(self, mock_wait, install_statuses, **kwargs):
+        mock_wait.side_effect = [
+            self.executions('create_deployment_environment',
+                            'completed', 'completed'),
+            self.executions('install', *install_statuses)]
+        return runners.deployment_group_test(
+            'blueprint.yaml',
+            'test',
+            [('a.yaml', {'region': 'a'}), ('b.yaml', {'region': 'b'})],
+            **kwargs)
+
+    def test_members_are_installed_together(
+            self, mock_wait, mock_uninstall, _, mock_create, mock_upload):
+        results = self.run_test(mock_wait, ['completed', 'completed'],
+                                timeout=30)
+        mock_upload.assert_called_once_with('blueprint.yaml', 'test')
+        mock_create.assert_called_once_with(
+            'test', 'test',
+            {'test-1': {'region': 'a'}, 'test-2': {'region': 'b'}}, None)
+        mock_wait.assert_called_with(['test-1', 'test-2'], 'install', 30,
+                                     execution_ids=['e1', 'e2'])
+        self.assertEqual(['passed', 'passed'], [r.status for r in results])
+        mock_uninstall.assert_called_once_with(
+            'test', ['test-1', 'test-2'], 30)
+
+    def test_failed_member_is_reported(self, mock_wait, mock_uninstall, *_):
+        results = self.run_test(mock_wait, ['completed', 'failed'])
+        self.assertEqual(['passed', 'failed'], [r.status for r in results])
+        self.assertEqual('install failed', results[1].error)
+        self.assertEqual('b.yaml', results[1].blueprint)
+        mock_uninstall.assert_not_called()
+
+    def test_failed_group_is_uninstalled_on_uninstall_force(
+            self, mock_wait, mock_uninstall, *_):
+        self.run_test(mock_wait, ['failed', 'failed'],
+                      on_failure='uninstall-force')
+        mock_uninstall.assert_called_once_with(
+            'test', ['test-1', 'test-2'], 2000, ignore_failure=True)
+
+    @patch('ecosystem_tests.dorkl.runners.log_failure_diagnostics')
+    @patch('ecosystem_tests.dorkl.runners.blueprints_delete')
+    def test_blueprint_is_deleted_when_group_create_fails(
+            self, mock_delete, _, mock_wait, mock_uninstall, __, mock_create,
+            ___):
+        mock_create.side_effect = EcosystemTestException('conflict')
+        self.assertRaises(EcosystemTestException,
+                          self.run_test, mock_wait, [])
+        mock_delete.assert_called_once_with('test')
+        mock_uninstall.assert_not_called()
+
+    @patch('ecosystem_tests.dorkl.runners.log_failure_diagnostics')
+    @patch('ecosystem_tests.dorkl.runners.blueprints_delete')
+    def test_group_is_uninstalled_when_test_fails(
+            self, mock_delete, _, mock_wait, mock_uninstall, mock_start, *__):
+        mock_start.side_effect = EcosystemTestException('REST failed')
+        self.assertRaises(EcosystemTestException,
+                          self.run_test, mock_wait, [],
+                          on_failure='uninstall-force')
+        mock_uninstall.assert_called_once_with(
+            'test', ['test-1', 'test-2'], 2000, ignore_failure=True)
+        mock_delete.assert_not_called()
+
+    @patch('ecosystem_tests.dorkl.runners.log_failure_diagnostics')
+    @patch('ecosystem_tests.dorkl.runners.blueprints_delete')
+    def test_nothing_is_cleaned_on_donothing(
+            self, mock_delete, _, mock_wait, mock_uninstall, __, mock_create,
+            ___):
+        mock_create.side_effect = EcosystemTestException('conflict')
+        self.assertRaises(EcosystemTestException,
+                          self.run_test, mock_wait, [],
+                          on_failure='donothing')
+        mock_delete.assert_not_called()
+        mock_uninstall.assert_not_called()
+
+    @patch('ecosystem_tests.dorkl.runners.log_failure_diagnostics')
+    @patch('ecosystem_tests.dorkl.runners.find_executions_to_cancel',
+           return_value=['e1'])
+    @patch('ecosystem_tests.dorkl.runners.cancel_multiple_executions')
+    @patch('ecosystem_tests.dorkl.runners.executions_start')
+    def test_started_install_is_rolled_back(
+            self, mock_start, mock_cancel, _, __, mock_wait, *___):
+        mock_wait.side_effect = [
+            self.executions('create_deployment_environment',
+                            'completed', 'completed'),
+            EcosystemTestException('REST failed')]
+        self.assertRaises(EcosystemTestException,
+                          runners.deployment_group_test,
+                          'blueprint.yaml',
+                          'test',
+                          [('a.yaml', {}), ('b.yaml', {})])
+        self.assertEqual(2, mock_cancel.call_count)
+        mock_start.assert_any_call('rollback', 'test-1', 2000)
+        mock_start.assert_any_call('rollback', 'test-2', 2000)
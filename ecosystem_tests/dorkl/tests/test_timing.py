@@ -0,0 +1,79 @@
+########
+# Copyright (c) 2014-2022 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import json
+import shutil
+import tempfile
+from xml.etree import ElementTree
+
+from mock import patch
+from testtools import TestCase
+
+from ...dorkl import commands, timing
+
+
+class TestReportTest(TestCase):
+
+    def setUp(self):
+        super(TestReportTest, self).setUp()
+        self.report_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.report_dir)
+
+    def read_report(self, test_id):
+        with open(os.path.join(self.report_dir, test_id + '.json')) as f:
+            report = json.load(f)
+        suite = ElementTree.parse(
+            os.path.join(self.report_dir, test_id + '.xml')).getroot()
+        return report, suite
+
+    @patch('ecosystem_tests.dorkl.commands._docker_exec',
+           return_value='output')
+    def test_phases_and_commands_are_reported(self, _):
+        with timing.test_report('test1', self.report_dir):
+            with timing.span('install'):
+                commands.docker_exec('cfy secrets create -u a -s secret')
+        report, suite = self.read_report('test1')
+        self.assertEqual(report['status'], timing.PASSED)
+        install = report['spans'][0]
+        self.assertEqual(install['name'], 'install')
+        self.assertEqual(install['spans'][0]['attributes'], {
+            'command': 'cfy secrets create -u a -s ***',
+            'output_bytes': 6})
+        self.assertEqual(suite.get('tests'), '1')
+        self.assertEqual([c.get('name') for c in suite], ['install'])
+
+    def test_failed_phase_is_reported(self):
+        def failed_phase():
+            with timing.test_report('test1', self.report_dir):
+                with timing.span('uninstall'):
+                    raise Exception('boom')
+
+        self.assertRaises(Exception, failed_phase)
+        report, suite = self.read_report('test1')
+        self.assertEqual((report['status'], report['error']),
+                         (timing.FAILED, 'boom'))
+        self.assertEqual(suite.get('failures'), '1')
+        self.assertEqual(suite.find('testcase/failure').get('message'),
+                         'boom')
+
+    def test_nothing_is_recorded_without_report_dir(self):
+        with patch.dict(os.environ, {}, clear=True):
+            with timing.test_report('test1') as root:
+                with timing.span('install') as install:
+                    pass
+        self.assertIsNone(root)
+        self.assertIsNone(install)
+        self.assertEqual(os.listdir(self.report_dir), [])
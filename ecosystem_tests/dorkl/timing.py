@@ -0,0 +1,229 @@
+########
+# Copyright (c) 2014-2022 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Time the phases of a blueprint test, and write them to a report.
+
+Spans are only recorded inside test_report, in the thread that runs the
+test, and only when a report directory is given. Work that the test hands to
+another thread, like a cleanup in the background, is added to the report
+with resume_report.
+"""
+
+import os
+import re
+import threading
+from time import time
+from functools import wraps
+from datetime import datetime
+from contextlib import contextmanager
+from xml.etree import ElementTree
+
+from nose.tools import nottest
+
+from ecosystem_tests.dorkl.cache import write_json_file
+from ecosystem_tests.dorkl.constansts import logger, REPORT_DIR_ENVAR_NAME
+
+PASSED = 'passed'
+FAILED = 'failed'
+
+# Secret values that commands carry, like cfy secrets create -s.
+SECRET_ARGUMENT = re.compile(r'(\s(?:-s|--secret-string)\s+)\S+')
+
+_local = threading.local()
+_write_lock = threading.Lock()
+
+
+class Span(object):
+
+    def __init__(self, name, attributes=None):
+        self.name = name
+        self.attributes = attributes or {}
+        self.start = time()
+        self.duration = None
+        self.status = PASSED
+        self.error = None
+        self.spans = []
+
+    def finish(self, error=None):
+        self.duration = time() - self.start
+        if error is not None:
+            self.status = FAILED
+            self.error = str(error)
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'start': datetime.utcfromtimestamp(self.start).isoformat() + 'Z',
+            'duration': self.duration,
+            'status': self.status,
+            'error': self.error,
+            'attributes': self.attributes,
+            'spans': [child.to_dict() for child in self.spans]
+        }
+
+
+@contextmanager
+def span(name, **attributes):
+    """
+    Time a block of the test that runs in this thread.
+    :param name: The phase name.
+    :param attributes: Details to report with the span.
+    :return: The Span, or None if no report is recorded.
+    """
+    stack = getattr(_local, 'stack', None)
+    if not stack:
+        yield
+        return
+    current = Span(name, attributes)
+    stack[-1].spans.append(current)
+    stack.append(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.finish(e)
+        raise
+    else:
+        current.finish()
+    finally:
+        stack.pop()
+
+
+def redact_command(cmd):
+    return SECRET_ARGUMENT.sub(r'\1***', cmd)
+
+
+def timed(name):
+    """
+    Time every call of a function as a span.
+    """
+
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def report_dir_from_env(report_dir=None):
+    return report_dir or os.environ.get(REPORT_DIR_ENVAR_NAME)
+
+
+@nottest
+@contextmanager
+def test_report(test_id, report_dir=None):
+    """
+    Record the spans of a test, and write them to <test_id>.json and to
+    JUnit XML in <test_id>.xml.
+    :param test_id: The test ID.
+    :param report_dir: Where to write the report, by default
+        ECOSYSTEM_TEST_REPORT_DIR. Nothing is recorded without it.
+    """
+    report_dir = report_dir_from_env(report_dir)
+    if not report_dir or getattr(_local, 'stack', None):
+        yield
+        return
+    root = Span(test_id)
+    _local.stack = [root]
+    _local.report_dir = report_dir
+    try:
+        yield root
+    except BaseException as e:
+        root.finish(e)
+        raise
+    else:
+        root.finish()
+    finally:
+        _local.stack = None
+        save_test_report(root, report_dir)
+
+
+def current_report():
+    """
+    The report of the test that runs in this thread, to hand to
+    resume_report in another thread.
+    :return: The root span and the report directory, or None.
+    """
+    stack = getattr(_local, 'stack', None)
+    if not stack:
+        return None
+    return stack[0], _local.report_dir
+
+
+@nottest
+@contextmanager
+def resume_report(report):
+    """
+    Record the spans of a block in this thread in the report of a test,
+    and write the report again at its end. The test may have ended.
+    :param report: What current_report returned in the test thread.
+    """
+    if report is None or getattr(_local, 'stack', None):
+        yield
+        return
+    root, report_dir = report
+    _local.stack = [root]
+    try:
+        yield root
+    finally:
+        _local.stack = None
+        save_test_report(root, report_dir)
+
+
+@nottest
+def save_test_report(root, report_dir):
+    with _write_lock:
+        try:
+            write_test_report(root, report_dir)
+        except (IOError, OSError) as e:
+            logger.error('Failed to write the test report: {0}'.format(
+                str(e)))
+
+
+@nottest
+def write_test_report(root, report_dir):
+    if not os.path.isdir(report_dir):
+        os.makedirs(report_dir)
+    path = os.path.join(report_dir, root.name)
+    write_json_file(path + '.json', root.to_dict())
+    ElementTree.ElementTree(junit_test_suite(root)).write(
+        path + '.xml', encoding='utf-8', xml_declaration=True)
+    logger.info('Test report written to {0}.json'.format(path))
+
+
+def junit_test_suite(root):
+    """
+    A JUnit test suite for the test, with a test case for every phase.
+    """
+    phases = list(root.spans)
+    if root.status == FAILED and all(p.status == PASSED for p in phases):
+        # The test failed outside of its phases.
+        phases.append(root)
+    suite = ElementTree.Element('testsuite', {
+        'name': root.name,
+        'tests': str(len(phases)),
+        'failures': str(len([p for p in phases if p.status == FAILED])),
+        'time': '{0:.3f}'.format(root.duration),
+        'timestamp': datetime.utcfromtimestamp(root.start).isoformat()})
+    for phase in phases:
+        case = ElementTree.SubElement(suite, 'testcase', {
+            'classname': root.name,
+            'name': phase.name,
+            'time': '{0:.3f}'.format(phase.duration)})
+        if phase.status == FAILED:
+            ElementTree.SubElement(
+                case, 'failure', {'message': phase.error or ''})
+    return suite
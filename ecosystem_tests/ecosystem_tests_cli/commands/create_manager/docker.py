@@ -14,20 +14,33 @@
 # limitations under the License.
 
 import json
-import shutil
-import requests
 from urllib.parse import urlparse
-from tempfile import NamedTemporaryFile
 
 from ecosystem_tests.dorkl.commands import handle_process
+from ecosystem_tests.dorkl.constansts import MANAGER_REST_PORT
+from ecosystem_tests.dorkl.exceptions import (EcosystemCommandError,
+                                              EcosystemTestException)
+from ecosystem_tests.dorkl.readiness import (rest_status_probe,
+                                             wait_for_manager)
 from ecosystem_tests.ecosystem_tests_cli.logger import logger
-from ecosystem_cicd_tools.new_cicd.s3 import download_from_s3
+from ecosystem_tests.dorkl.docker_api import (API_TRANSPORT,
+                                              docker_transport,
+                                              get_docker_client)
 
 from .utils import get_url
+from .image_cache import (ImageDownload,
+                          ImageCacheEntry,
+                          image_source,
+                          image_cache_enabled)
 
-DOCKER_RUN_COMMAND = """-d --name {container_name} \
-    -p 8000:8000 -p 80:80 -p 443:443 -p 5671:5671 {image_name}
-"""
+MANAGER_PORTS = [8000, MANAGER_REST_PORT, 443, 5671]
+MANAGER_START_TIMEOUT = 600
+# Loading a streamed image takes as long as downloading it.
+IMAGE_LOAD_TIMEOUT = 3600
+# The supervisor states of a starter that is still configuring the manager.
+STARTER_RUNNING_STATES = ['STARTING', 'RUNNING']
+DOCKER_RUN_COMMAND = '-d --name {container_name} ' + ' '.join(
+    '-p {0}:{0}'.format(port) for port in MANAGER_PORTS) + ' {image_name}'
 
 
 def container_exists(name):
@@ -62,25 +75,102 @@ def image_exists(image_name):
 
 
 def docker_ps():
+    if docker_transport() == API_TRANSPORT:
+        # Keep the shape of docker ps --format '{{json .}}'.
+        return [{'ID': container['Id'][:12],
+                 'Image': container['Image'],
+                 'Names': ','.join(
+                     name.lstrip('/') for name in container['Names']),
+                 'State': container['State'],
+                 'Status': container['Status']}
+                for container in get_docker_client().containers()]
     return handle_list_response(docker('ps -a'))
 
 
 def docker_rm(name):
+    if docker_transport() == API_TRANSPORT:
+        return get_docker_client().remove_container(name)
     return docker('rm {name}'.format(name=name))
 
 
 def docker_images():
+    if docker_transport() == API_TRANSPORT:
+        # Keep the shape of docker images --format '{{json .}}'.
+        images = []
+        for image in get_docker_client().images():
+            for repo_tag in image.get('RepoTags') or []:
+                repo, tag = repo_tag.rsplit(':', 1)
+                images.append({'ID': image['Id'].split(':')[-1][:12],
+                               'Repository': repo,
+                               'Tag': tag})
+        return images
     return handle_list_response(docker('images'))
 
 
 def docker_load(filename):
+    if docker_transport() == API_TRANSPORT:
+        with open(filename, 'rb') as image_archive:
+            return get_docker_client().load_image(image_archive)
     result = docker('load -i {filename}'.format(filename=filename),
                     json_format=False)
     if 'Loaded image' in result:
         return result.split()[-1]
 
 
+def docker_load_stream(archive):
+    """
+    Load an image archive from a file object, without writing it to disk.
+    :param archive: An ImageDownload.
+    """
+    if docker_transport() == API_TRANSPORT:
+        return get_docker_client().load_image(archive)
+    result = handle_process('docker load',
+                            timeout=IMAGE_LOAD_TIMEOUT,
+                            stdin_writer=archive.write_to)
+    if 'Loaded image' in result:
+        return result.split()[-1]
+
+
+def docker_inspect(kind, name):
+    """
+    :param kind: container or image.
+    :param name: The container or image name or ID.
+    :return: The docker inspect output of the object.
+    """
+    if docker_transport() == API_TRANSPORT:
+        client = get_docker_client()
+        if kind == 'container':
+            return client.inspect_container(name)
+        return client.inspect_image(name)
+    return json.loads(docker('{kind} inspect {name}'.format(
+        kind=kind, name=name)))
+
+
+def docker_commit(container_name, image_name, labels=None):
+    """
+    Create an image from a container, with labels.
+    """
+    repo, tag = get_repo_and_tag(image_name)
+    logger.info('Committing container {0} to image {1}.'.format(
+        container_name, image_name))
+    if docker_transport() == API_TRANSPORT:
+        return get_docker_client().commit(container_name, repo, tag, labels)
+    return handle_process('docker commit {changes} {container} {image}'.format(
+        changes=' '.join('--change "LABEL {0}={1}"'.format(key, value)
+                         for key, value in sorted((labels or {}).items())),
+        container=container_name,
+        image=image_name)).strip()
+
+
+def docker_rm_force(name):
+    if docker_transport() == API_TRANSPORT:
+        return get_docker_client().remove_container(name, force=True)
+    return docker('rm -f {name}'.format(name=name), json_format=False)
+
+
 def docker_rmi(image_name):
+    if docker_transport() == API_TRANSPORT:
+        return get_docker_client().remove_image(image_name)
     return docker('rmi {image_name}'.format(image_name=image_name),
                   json_format=False)
 
@@ -111,24 +201,25 @@ def get_repo_and_tag(image_name):
     return repo, tag
 
 
-def download_file(url, local_filename):
-    with requests.get(url, stream=True) as r:
-        with open(local_filename, 'wb') as f:
-            shutil.copyfileobj(r.raw, f)
-
-
 def download_and_load_docker_image(url, image_name=None):
+    """
+    Stream an image archive from S3 or HTTP into docker load, through the
+    local image cache unless ECOSYSTEM_TEST_IMAGE_CACHE is false.
+    """
     up = urlparse(url)
     if not up.path:
         logger.error('Unable to resolve download url: {}'.format(url))
-    with NamedTemporaryFile() as f:
-        logger.info('Downloading this object: {}'.format(url))
-        if up.scheme in ['http', 'https']:
-            download_file(url, f.name)
-        else:
-            download_from_s3(f.name, url)
-        image_name = docker_load(f.name) or image_name
-    return image_name
+    entry = ImageCacheEntry(url) if image_cache_enabled() else None
+    archive = ImageDownload(image_source(url), entry)
+    logger.info('Downloading this object: {}'.format(url))
+    try:
+        loaded = docker_load_stream(archive)
+    except Exception:
+        # A broken download is the reason that docker load failed.
+        archive.raise_error()
+        raise
+    archive.finish()
+    return loaded or image_name
 
 
 def load_new_image(image_name, url, version, release, architecture):
@@ -141,14 +232,86 @@ def docker_run(command):
 
 
 def docker_exec(command, interactive=True):
+    if docker_transport() == API_TRANSPORT:
+        container_name, cmd = command.split(' ', 1)
+        returncode, stdout, stderr = get_docker_client().exec_run(
+            container_name, cmd.split())
+        result = stdout.decode('utf-8', 'replace')
+        logger.info('Docker command result: {}'.format(result))
+        if returncode:
+            raise EcosystemTestException(
+                'Command failed: {0}'.format(stderr.decode('utf-8')))
+        return result
     if interactive:
         command = '-it ' + command
     return docker('exec {command}'.format(command=command), json_format=False)
 
 
+def api_run_container(container_name, image_name):
+    """
+    The Docker Engine API equivalent of docker run DOCKER_RUN_COMMAND.
+    """
+    port_bindings = {
+        '{0}/tcp'.format(port): [{'HostPort': str(port)}]
+        for port in MANAGER_PORTS}
+    client = get_docker_client()
+    client.create_container(container_name, {
+        'Image': image_name,
+        'ExposedPorts': {port: {} for port in port_bindings},
+        'HostConfig': {'PortBindings': port_bindings}})
+    client.start_container(container_name)
+
+
 def start_container(container_name, image_name):
-    docker_run(DOCKER_RUN_COMMAND.format(
-        image_name=image_name,
-        container_name=container_name)
-    )
-    docker_exec('cfy_manager cfy_manager wait-for-starter')
+    if docker_transport() == API_TRANSPORT:
+        api_run_container(container_name, image_name)
+    else:
+        docker_run(DOCKER_RUN_COMMAND.format(
+            image_name=image_name,
+            container_name=container_name)
+        )
+    wait_for_manager(MANAGER_START_TIMEOUT,
+                     probes=[lambda: starter_status(container_name),
+                             rest_status_probe,
+                             lambda: manager_status(container_name)])
+
+
+def starter_status(container_name):
+    """
+    A manager status probe that answers while the starter configures the
+    manager in a new container, so that the manager is not used before the
+    starter finished, even if its services are up.
+    :raises EcosystemTestException: When the starter finished, so that the
+        next probe gets the manager status.
+    """
+    command = ['supervisorctl', 'status', 'starter']
+    if docker_transport() == API_TRANSPORT:
+        _, stdout, _ = get_docker_client().exec_run(container_name, command)
+        output = stdout.decode('utf-8')
+    else:
+        try:
+            output = handle_process('docker exec {0} {1}'.format(
+                container_name, ' '.join(command)), log=False)
+        except EcosystemCommandError as e:
+            # supervisorctl exits with an error when the starter stopped.
+            output = e.output
+    if not set(STARTER_RUNNING_STATES).intersection((output or '').split()):
+        raise EcosystemTestException('The starter is not running.')
+    return {'status': 'Starting',
+            'services': {'starter': {'status': 'Configuring the manager'}}}
+
+
+def manager_status(container_name):
+    """
+    Get the manager status with cfy status in the container.
+    """
+    if docker_transport() == API_TRANSPORT:
+        returncode, stdout, stderr = get_docker_client().exec_run(
+            container_name, ['cfy', 'status', '--json'])
+        if returncode:
+            raise EcosystemTestException(
+                'Command failed: {0}'.format(stderr.decode('utf-8')))
+        return json.loads(stdout.decode('utf-8'))
+    return json.loads(handle_process(
+        'docker exec {0} cfy status --json'.format(container_name),
+        log=False))
@@ -0,0 +1,347 @@
+########
+# Copyright (c) 2014-2022 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""A local cache of manager image archives.
+
+An image archive is streamed from S3 or HTTP straight into docker load, and
+written to the cache on the way. The cache entry is keyed by the URL and
+remembers the ETag and size of the object, so a changed object is
+downloaded again. A download that stopped is resumed from where it stopped,
+with a ranged request, and the archive is verified before it is kept.
+"""
+
+import os
+import re
+import base64
+import hashlib
+import threading
+
+import requests
+from urllib.parse import urlparse
+from botocore.exceptions import BotoCoreError, ClientError
+
+from ecosystem_tests.dorkl.constansts import IMAGE_CACHE_ENVAR_NAME
+from ecosystem_tests.dorkl.exceptions import EcosystemTestException
+from ecosystem_tests.dorkl.cache import (get_cache_dir,
+                                         read_json_file,
+                                         write_json_file)
+from ecosystem_tests.ecosystem_tests_cli.logger import logger
+from ecosystem_cicd_tools.new_cicd.s3 import BUCKET_NAME, get_client
+
+CHUNK_SIZE = 1024 * 1024
+DOWNLOAD_RETRIES = 3
+MD5_ETAG = re.compile('^[0-9a-f]{32}$')
+
+
+def image_cache_enabled():
+    """
+    Whether to keep downloaded images in the local cache.
+    Set ECOSYSTEM_TEST_IMAGE_CACHE=false to only stream them.
+    :return: Bool.
+    """
+    return os.environ.get(IMAGE_CACHE_ENVAR_NAME, 'true').lower() not in \
+        ['false', 'no', 'off', '0']
+
+
+class HttpImageSource(object):
+
+    errors = (requests.RequestException, IOError)
+
+    def __init__(self, url):
+        self.url = url
+        self.etag = None
+        self.size = None
+        self.md5 = None
+        self.ranges = False
+
+    def describe(self):
+        response = requests.head(self.url, allow_redirects=True)
+        response.raise_for_status()
+        self.etag = response.headers.get('ETag', '').strip('"') or None
+        if response.headers.get('Content-Length'):
+            self.size = int(response.headers['Content-Length'])
+        self.ranges = response.headers.get('Accept-Ranges') == 'bytes'
+        # An ETag is not always an MD5 over HTTP, only trust Content-MD5.
+        if response.headers.get('Content-MD5'):
+            self.md5 = base64.b64decode(
+                response.headers['Content-MD5']).hex()
+
+    def chunks(self, offset=0):
+        """
+        :return: An iterator of the object bytes, from an offset.
+        """
+        headers = {'Range': 'bytes={0}-'.format(offset)} if offset else {}
+        response = requests.get(self.url, headers=headers, stream=True)
+        response.raise_for_status()
+        if offset and response.status_code != 206:
+            response.close()
+            raise EcosystemTestException(
+                'The server of {0} ignored the range request.'.format(
+                    self.url))
+        return response.iter_content(CHUNK_SIZE)
+
+
+class S3ImageSource(object):
+
+    errors = (BotoCoreError, ClientError, IOError)
+
+    def __init__(self, key):
+        self.url = key
+        self.etag = None
+        self.size = None
+        self.md5 = None
+        self.ranges = True
+        self._object = get_client().Object(BUCKET_NAME, key)
+
+    def describe(self):
+        self.etag = self._object.e_tag.strip('"')
+        self.size = self._object.content_length
+        # Multipart uploads have an ETag of the parts, like <hash>-<parts>.
+        if MD5_ETAG.match(self.etag):
+            self.md5 = self.etag
+
+    def chunks(self, offset=0):
+        kwargs = {'Range': 'bytes={0}-'.format(offset)} if offset else {}
+        body = self._object.get(**kwargs)['Body']
+        return iter(lambda: body.read(CHUNK_SIZE), b'')
+
+
+def image_source(url):
+    if urlparse(url).scheme in ['http', 'https']:
+        return HttpImageSource(url)
+    return S3ImageSource(url)
+
+
+class ImageCacheEntry(object):
+    """The cached archive of one URL, and its metadata."""
+
+    def __init__(self, url, cache_dir=None):
+        cache_dir = cache_dir or get_cache_dir('images')
+        key = hashlib.sha256(url.encode('utf-8')).hexdigest()
+        self.url = url
+        self.path = os.path.join(cache_dir, '{0}.tar'.format(key))
+        self.part_path = '{0}.part'.format(self.path)
+        self.metadata_path = os.path.join(cache_dir, '{0}.json'.format(key))
+
+    def metadata(self):
+        return read_json_file(self.metadata_path, {})
+
+    def matches(self, source):
+        metadata = self.metadata()
+        return metadata.get('url') == self.url and \
+            metadata.get('etag') == source.etag and \
+            metadata.get('size') == source.size
+
+    def complete(self, source):
+        """
+        :return: Whether the cached archive is the object of the source.
+        """
+        return self.matches(source) and \
+            bool(self.metadata().get('sha256')) and \
+            os.path.isfile(self.path) and \
+            os.path.getsize(self.path) == source.size
+
+    def resume_offset(self, source):
+        """
+        :return: How much of the source the partial download already has.
+        """
+        if not source.ranges or not self.matches(source) or \
+                not os.path.isfile(self.part_path):
+            return 0
+        offset = os.path.getsize(self.part_path)
+        return offset if offset < (source.size or 0) else 0
+
+    def start(self, source):
+        """
+        Drop any other version of the archive, and record the object that
+        is being downloaded.
+        """
+        if not self.matches(source):
+            self.discard()
+        write_json_file(self.metadata_path, {'url': self.url,
+                                             'etag': source.etag,
+                                             'size': source.size})
+
+    def commit(self, source, sha256):
+        os.rename(self.part_path, self.path)
+        write_json_file(self.metadata_path, {'url': self.url,
+                                             'etag': source.etag,
+                                             'size': source.size,
+                                             'sha256': sha256})
+
+    def discard(self):
+        for path in [self.path, self.part_path, self.metadata_path]:
+            if os.path.exists(path):
+                os.remove(path)
+
+
+class ImageDownload(object):
+    """The bytes of an image archive, read from the cache or the network.
+
+    Read the archive with read, like a file, then call finish to verify it.
+    A download is written to the cache as it is read, and retried from the
+    last byte when the connection breaks.
+    """
+
+    def __init__(self, source, entry=None):
+        self.source = source
+        self.entry = entry
+        self.error = None
+        self.sha256 = hashlib.sha256()
+        self.md5 = hashlib.md5()
+        self.size = 0
+        self.cached = False
+        self._chunks = self._iter_chunks()
+        self._chunk = b''
+        self._position = 0
+        self._lock = threading.Lock()
+
+    def read(self, size=-1):
+        with self._lock:
+            data = []
+            length = 0
+            while size < 0 or length < size:
+                if self._position >= len(self._chunk):
+                    self._chunk, self._position = self._next_chunk(), 0
+                    if not self._chunk:
+                        break
+                end = len(self._chunk) if size < 0 else \
+                    self._position + size - length
+                piece = self._chunk[self._position:end]
+                self._position += len(piece)
+                length += len(piece)
+                data.append(piece)
+            return b''.join(data)
+
+    def _next_chunk(self):
+        try:
+            for chunk in self._chunks:
+                if chunk:
+                    return chunk
+            return b''
+        except Exception as e:
+            self.error = e
+            raise
+
+    def write_to(self, stream):
+        """
+        Copy the whole archive to a stream, like the stdin of docker load.
+        """
+        for chunk in iter(lambda: self.read(CHUNK_SIZE), b''):
+            stream.write(chunk)
+
+    def _update(self, chunk):
+        self.sha256.update(chunk)
+        self.md5.update(chunk)
+        self.size += len(chunk)
+
+    def _iter_chunks(self):
+        self.source.describe()
+        if self.entry is None or self.source.etag is None:
+            for chunk in self._download(None):
+                yield chunk
+            return
+        if self.entry.complete(self.source):
+            logger.info('Loading {0} from the image cache.'.format(
+                self.source.url))
+            self.cached = True
+            for chunk in self._replay(self.entry.path):
+                yield chunk
+            return
+        offset = self.entry.resume_offset(self.source)
+        self.entry.start(self.source)
+        if offset:
+            logger.info('Resuming the download of {0} from {1} bytes.'.format(
+                self.source.url, offset))
+            for chunk in self._replay(self.entry.part_path):
+                yield chunk
+        with open(self.entry.part_path, 'ab' if offset else 'wb') as part:
+            for chunk in self._download(part):
+                yield chunk
+
+    def _replay(self, path):
+        with open(path, 'rb') as archive:
+            for chunk in iter(lambda: archive.read(CHUNK_SIZE), b''):
+                self._update(chunk)
+                yield chunk
+
+    def _download(self, part):
+        retries = 0
+        while True:
+            try:
+                for chunk in self.source.chunks(self.size):
+                    if part:
+                        part.write(chunk)
+                    self._update(chunk)
+                    yield chunk
+                return
+            except self.source.errors as e:
+                if part:
+                    part.flush()
+                if retries >= DOWNLOAD_RETRIES or not self.source.ranges:
+                    raise
+                retries += 1
+                logger.warning('The download of {0} broke at {1} bytes: {2}. '
+                               'Resuming...'.format(
+                                   self.source.url, self.size, str(e)))
+
+    def raise_error(self):
+        """
+        :raises EcosystemTestException: If reading the archive failed.
+        """
+        if self.error is not None:
+            raise EcosystemTestException(
+                'Failed to download {0}: {1}'.format(
+                    self.source.url, str(self.error)))
+
+    def finish(self):
+        """
+        Verify the archive, and keep it in the cache.
+        :raises EcosystemTestException: If the read failed or the archive
+            is not the expected one.
+        """
+        try:
+            # Whatever docker load didn't read still belongs in the archive.
+            while self.read(CHUNK_SIZE):
+                pass
+        except Exception:
+            pass
+        self.raise_error()
+        problem = self.verify()
+        if problem:
+            if self.entry is not None:
+                self.entry.discard()
+            raise EcosystemTestException(
+                'The image archive {0} is corrupt, {1}. It was removed from '
+                'the image cache, please try again.'.format(
+                    self.source.url, problem))
+        if self.entry is not None and not self.cached and \
+                os.path.isfile(self.entry.part_path):
+            self.entry.commit(self.source, self.sha256.hexdigest())
+
+    def verify(self):
+        """
+        :return: What is wrong with the archive, or None.
+        """
+        if self.source.size is not None and self.size != self.source.size:
+            return 'expected {0} bytes and got {1}'.format(
+                self.source.size, self.size)
+        if self.cached:
+            expected, actual = self.entry.metadata().get('sha256'), \
+                self.sha256.hexdigest()
+        else:
+            expected, actual = self.source.md5, self.md5.hexdigest()
+        if expected and expected != actual:
+            return 'expected checksum {0} and got {1}'.format(expected, actual)
@@ -0,0 +1,137 @@
+########
+# Copyright (c) 2014-2022 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Snapshots of prepared manager containers.
+
+A prepared manager is committed to a local image, tagged by a fingerprint
+of what was prepared on it: the image it started from, yum and pip
+packages, the plugins bundle and the plugins. A later preparation with the
+same fingerprint starts the manager from the snapshot instead.
+"""
+
+import os
+import json
+import hashlib
+
+from ecosystem_tests.dorkl.cache import content_digest
+from ecosystem_tests.ecosystem_tests_cli.logger import logger
+
+from .docker import (docker_commit,
+                     docker_inspect,
+                     docker_rm_force,
+                     image_exists,
+                     start_container)
+
+SNAPSHOT_VERSION = 1
+SNAPSHOT_REPOSITORY = 'ecosystem-test-manager'
+FINGERPRINT_LABEL = 'ecosystem-test.fingerprint'
+BASE_IMAGE_LABEL = 'ecosystem-test.base-image'
+DEFAULT_BUNDLE = 'default'
+
+
+def path_or_url_digest(path_or_url):
+    if path_or_url and os.path.isfile(path_or_url):
+        return content_digest(path_or_url)
+    return path_or_url
+
+
+def prepared_manager_fingerprint(base_image,
+                                 yum_packages=None,
+                                 pip_packages=None,
+                                 execute_bundle_upload=True,
+                                 bundle_path=None,
+                                 plugins=None):
+    """
+    :param base_image: The ID of the image that the manager started from.
+    :param plugins: A list of (wagon, plugin YAML) paths or URLs.
+    :return: The fingerprint of a manager preparation.
+    """
+    bundle = None
+    if execute_bundle_upload:
+        bundle = path_or_url_digest(bundle_path) or DEFAULT_BUNDLE
+    content = {
+        'version': SNAPSHOT_VERSION,
+        'base_image': base_image,
+        'yum_packages': sorted(yum_packages or []),
+        'pip_packages': sorted(pip_packages or []),
+        'bundle': bundle,
+        'plugins': sorted([path_or_url_digest(path) for path in plugin]
+                          for plugin in plugins or [])
+    }
+    return hashlib.sha256(
+        json.dumps(content, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def snapshot_image_name(fingerprint):
+    return '{0}:{1}'.format(SNAPSHOT_REPOSITORY, fingerprint[:16])
+
+
+def image_labels(image):
+    return (docker_inspect('image', image).get('Config') or {}).get(
+        'Labels') or {}
+
+
+def container_image(container_name):
+    """
+    :return: The ID of the image of a container, and its labels.
+    """
+    image = docker_inspect('container', container_name)['Image']
+    return image, image_labels(image)
+
+
+def base_image_of(container_name):
+    """
+    The image that a manager container started from, before any snapshot.
+    """
+    image, labels = container_image(container_name)
+    return labels.get(BASE_IMAGE_LABEL) or image
+
+
+def restore_prepared_manager(container_name, fingerprint):
+    """
+    Run the manager from the snapshot of the fingerprint, if there is one.
+    :return: Whether the manager now runs from the snapshot.
+    """
+    _, labels = container_image(container_name)
+    if labels.get(FINGERPRINT_LABEL) == fingerprint:
+        logger.info('The manager already runs from a prepared snapshot.')
+        return True
+    image_name = snapshot_image_name(fingerprint)
+    if not image_exists(image_name) or \
+            image_labels(image_name).get(FINGERPRINT_LABEL) != fingerprint:
+        logger.info('No prepared snapshot {0}, preparing the '
+                    'manager.'.format(image_name))
+        return False
+    logger.info('Restarting the manager from the prepared snapshot '
+                '{0}.'.format(image_name))
+    docker_rm_force(container_name)
+    start_container(container_name, image_name)
+    return True
+
+
+def commit_prepared_manager(container_name, fingerprint, base_image):
+    """
+    Commit the prepared manager to the snapshot image of the fingerprint.
+    :return: The image name.
+    """
+    image_name = snapshot_image_name(fingerprint)
+    docker_commit(container_name,
+                  image_name,
+                  {FINGERPRINT_LABEL: fingerprint,
+                   BASE_IMAGE_LABEL: base_image})
+    logger.info('The prepared manager is saved as {0}. Start from it with: '
+                'ecosystem-test create-manager --image-name {0} '
+                '--use-existing-image'.format(image_name))
+    return image_name
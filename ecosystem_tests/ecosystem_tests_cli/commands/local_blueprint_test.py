@@ -14,14 +14,28 @@
 # limitations under the License.
 
 import pytest
+import threading
 from os import environ
 
 import yaml
 from nose.tools import nottest
 
 from ..logger import logger
+from ..exceptions import EcosystemTestCliException
 from ...ecosystem_tests_cli import ecosystem_tests, decorators
-from ...dorkl.runners import basic_blueprint_test_dev
+from ...dorkl.runners import (deployment_group_test,
+                              basic_blueprint_test_dev)
+from ...dorkl.cleanup import background_cleanup
+from ...dorkl.commands import get_manager_container_id
+from ...dorkl.constansts import TEST_ID_ENVAR_NAME
+from ...dorkl.deployment_pool import load_deployment_pool
+from ...dorkl.result_cache import run_cached_test
+from ...dorkl.parallel import (FAILED,
+                               current_test_id,
+                               test_id_context,
+                               log_test_summary,
+                               run_tests_in_parallel)
+from ..inputs import inputs_to_dict
 from ..utilities import (prepare_test_env,
                          validate_and_generate_test_ids)
 
@@ -40,6 +54,13 @@ from ..utilities import (prepare_test_env,
 @ecosystem_tests.options.container_name
 @ecosystem_tests.options.nested_test
 @ecosystem_tests.options.dry_run
+@ecosystem_tests.options.parallel
+@ecosystem_tests.options.report_dir
+@ecosystem_tests.options.no_cache
+@ecosystem_tests.options.pool_size
+@ecosystem_tests.options.pool_max_age
+@ecosystem_tests.options.cleanup_workers
+@ecosystem_tests.options.group_inputs
 @decorators.timer_decorator
 def local_blueprint_test(blueprint_path,
                          test_id,
@@ -50,7 +71,14 @@ def local_blueprint_test(blueprint_path,
                          on_subsequent_invoke,
                          container_name,
                          nested_test,
-                         dry_run):
+                         dry_run,
+                         parallel,
+                         report_dir,
+                         no_cache,
+                         pool_size,
+                         pool_max_age,
+                         cleanup_workers,
+                         group_inputs):
 
     bp_test_ids = validate_and_generate_test_ids(blueprint_path, test_id)
 
@@ -64,21 +92,89 @@ def local_blueprint_test(blueprint_path,
                               container_name,
                               nested_test)
 
+    deployment_pool = load_deployment_pool(
+        pool_size,
+        pool_max_age,
+        get_manager_container_id) if pool_size else None
+
+    def run_blueprint_test(blueprint, test_id):
+        def run():
+            basic_blueprint_test_dev(
+                blueprint_file_name=blueprint,
+                test_name=test_id,
+                inputs=inputs,
+                timeout=timeout,
+                on_subsequent_invoke=on_subsequent_invoke,
+                on_failure=on_failure,
+                uninstall_on_success=uninstall_on_success,
+                user_defined_check=nested_test_executor
+                if nested_test else None,
+                user_defined_check_params={
+                    'nested_tests': nested_test
+                } if nested_test else None,
+                report_dir=report_dir,
+                deployment_pool=deployment_pool)
+
+        if no_cache:
+            return run()
+        return run_cached_test(
+            test_id,
+            blueprint,
+            inputs,
+            run,
+            files=[nested.split('::')[0] for nested in nested_test])
+
+    with background_cleanup(cleanup_workers):
+        if group_inputs:
+            return run_deployment_group_tests(bp_test_ids,
+                                              group_inputs,
+                                              inputs,
+                                              timeout,
+                                              on_failure,
+                                              uninstall_on_success,
+                                              report_dir)
+
+        if parallel > 1 and len(bp_test_ids) > 1:
+            results = run_tests_in_parallel(
+                bp_test_ids, run_blueprint_test, parallel, logger)
+            log_test_summary(results)
+            failed = [r.test_id for r in results if r.status == FAILED]
+            if failed:
+                raise EcosystemTestCliException(
+                    'Failed tests: {0}'.format(', '.join(failed)))
+            return
+
+        for blueprint, test_id in bp_test_ids:
+            with test_id_context(test_id):
+                run_blueprint_test(blueprint, test_id)
+
+
+@nottest
+def run_deployment_group_tests(bp_test_ids,
+                               group_inputs,
+                               inputs,
+                               timeout,
+                               on_failure,
+                               uninstall_on_success,
+                               report_dir):
+    members_inputs = [(path, inputs_to_dict([path])) for path in group_inputs]
+    results = []
     for blueprint, test_id in bp_test_ids:
-        environ['__ECOSYSTEM_TEST_ID'] = test_id
-        basic_blueprint_test_dev(
-            blueprint_file_name=blueprint,
-            test_name=test_id,
-            inputs=inputs,
-            timeout=timeout,
-            on_subsequent_invoke=on_subsequent_invoke,
-            on_failure=on_failure,
-            uninstall_on_success=uninstall_on_success,
-            user_defined_check=nested_test_executor if nested_test else None,
-            user_defined_check_params={
-                'nested_tests': nested_test
-            } if nested_test else None)
-        del environ['__ECOSYSTEM_TEST_ID']
+        with test_id_context(test_id):
+            results.extend(deployment_group_test(
+                blueprint_file_name=blueprint,
+                test_name=test_id,
+                members_inputs=members_inputs,
+                inputs=inputs,
+                timeout=timeout,
+                on_failure=on_failure,
+                uninstall_on_success=uninstall_on_success,
+                report_dir=report_dir))
+    log_test_summary(results)
+    failed = [r.test_id for r in results if r.status == FAILED]
+    if failed:
+        raise EcosystemTestCliException(
+            'Failed tests: {0}'.format(', '.join(failed)))
 
 
 def handle_dry_run(bp_test_ids,
@@ -128,8 +224,22 @@ def handle_dry_run(bp_test_ids,
     logger.info(dry_run_str)
 
 
+# Nested tests run in this process, and read the test ID from the
+# environment, so only one test at a time runs them.
+nested_test_lock = threading.Lock()
+
+
 def nested_test_executor(nested_tests=None):
     nested_tests = nested_tests or []
+    with nested_test_lock:
+        environ[TEST_ID_ENVAR_NAME] = current_test_id()
+        try:
+            run_nested_tests(nested_tests)
+        finally:
+            del environ[TEST_ID_ENVAR_NAME]
+
+
+def run_nested_tests(nested_tests):
     for nested_test in nested_tests:
         logger.info('Executing nested test: {test_path} '.format(
             test_path=nested_test))
@@ -19,9 +19,14 @@ from boto3 import client
 from cloudify import ctx
 
 from ..utilities import prepare_test_env
-from ...dorkl.runners import prepare_test_dev
+from ...dorkl.cloudify_api import create_test_secrets
+from ...dorkl.runners import prepare_test_dev, prepare_restored_test_dev
 from ...ecosystem_tests_cli import ecosystem_tests
 from ..secrets import prepare_secrets_dict_for_prepare_test
+from .create_manager.snapshot import (base_image_of,
+                                      commit_prepared_manager,
+                                      restore_prepared_manager,
+                                      prepared_manager_fingerprint)
 from ...dorkl.constansts import (
     LICENSE_ENVAR_NAME,
     MANAGER_CONTAINER_ENVAR_NAME
@@ -43,6 +48,7 @@ from ...dorkl.constansts import (
 @ecosystem_tests.options.yum_packages
 @ecosystem_tests.options.generate_new_aws_token
 @ecosystem_tests.options.timeout
+@ecosystem_tests.options.snapshot
 def prepare_test_manager(license,
                          secret,
                          file_secret,
@@ -53,7 +59,8 @@ def prepare_test_manager(license,
                          container_name,
                          yum_package,
                          generate_new_aws_token,
-                         timeout):
+                         timeout,
+                         snapshot):
     """
     This command responsible for prepare test manager.
     """
@@ -78,11 +85,32 @@ def prepare_test_manager(license,
                                                          file_secret,
                                                          encoded_secret)
 
+    if not snapshot:
+        prepare_test_dev(plugins=plugin,
+                         secrets=secrets_dict,
+                         execute_bundle_upload=not skip_bundle_upload,
+                         bundle_path=bundle_path,
+                         yum_packages=yum_package)
+        return
+
+    base_image = base_image_of(container_name)
+    fingerprint = prepared_manager_fingerprint(
+        base_image,
+        yum_packages=yum_package,
+        execute_bundle_upload=not skip_bundle_upload,
+        bundle_path=bundle_path,
+        plugins=plugin)
+    if restore_prepared_manager(container_name, fingerprint):
+        prepare_restored_test_dev(secrets=secrets_dict)
+        return
+    # The secrets are created after the commit, to keep them out of the
+    # image.
     prepare_test_dev(plugins=plugin,
-                     secrets=secrets_dict,
                      execute_bundle_upload=not skip_bundle_upload,
                      bundle_path=bundle_path,
                      yum_packages=yum_package)
+    commit_prepared_manager(container_name, fingerprint, base_image)
+    create_test_secrets(secrets_dict)
 
 
 def generate_new_credentials(timeout):
@@ -22,6 +22,8 @@ from ..dorkl.constansts import (RERUN,
                                 ROLLBACK_FULL,
                                 UNINSTALL_FORCE,
                                 ROLLBACK_PARTIAL,
+                                DEFAULT_POOL_MAX_AGE,
+                                DEFAULT_CLEANUP_WORKERS,
                                 LICENSE_ENVAR_NAME,
                                 MANAGER_CONTAINER_ENVAR_NAME)
 
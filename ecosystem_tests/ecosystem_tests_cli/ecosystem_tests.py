@@ -37,6 +37,8 @@ from .constants import (RERUN,
                         DEFAULT_LICENSE_PATH,
                         DEFAULT_BLUEPRINT_PATH,
                         DEFAULT_CONTAINER_NAME,
+                        DEFAULT_POOL_MAX_AGE,
+                        DEFAULT_CLEANUP_WORKERS,
                         DEFAULT_UNINSTALL_ON_SUCCESS,
                         DEFAULT_DIRECTORY_PATH,
                         DEFAULT_REPO,
@@ -317,6 +319,52 @@ class Options(object):
                                         multiple=True,
                                         help=helptexts.NESTED_TEST)
 
+        self.parallel = click.option('--parallel',
+                                     type=click.IntRange(min=1),
+                                     default=1,
+                                     show_default=1,
+                                     help=helptexts.PARALLEL)
+
+        self.report_dir = click.option('--report-dir',
+                                       type=click.Path(file_okay=False),
+                                       default=None,
+                                       help=helptexts.REPORT_DIR)
+
+        self.pool_size = click.option('--pool-size',
+                                      type=click.IntRange(min=0),
+                                      default=0,
+                                      show_default=0,
+                                      help=helptexts.POOL_SIZE)
+
+        self.pool_max_age = click.option('--pool-max-age',
+                                         type=click.IntRange(min=0),
+                                         default=DEFAULT_POOL_MAX_AGE,
+                                         show_default=DEFAULT_POOL_MAX_AGE,
+                                         help=helptexts.POOL_MAX_AGE)
+
+        self.group_inputs = click.option(
+            '--group-inputs',
+            multiple=True,
+            type=click.Path(exists=True, dir_okay=False),
+            help=helptexts.GROUP_INPUTS)
+
+        self.cleanup_workers = click.option(
+            '--cleanup-workers',
+            type=click.IntRange(min=0),
+            default=DEFAULT_CLEANUP_WORKERS,
+            show_default=DEFAULT_CLEANUP_WORKERS,
+            help=helptexts.CLEANUP_WORKERS)
+
+        self.snapshot = click.option('--snapshot',
+                                     is_flag=True,
+                                     default=False,
+                                     help=helptexts.SNAPSHOT)
+
+        self.no_cache = click.option('--no-cache',
+                                     is_flag=True,
+                                     default=False,
+                                     help=helptexts.NO_CACHE)
+
         self.license = click.option('-l',
                                     '--license',
                                     type=click.STRING,
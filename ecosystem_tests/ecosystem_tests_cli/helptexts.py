@@ -32,6 +32,45 @@ TEST_TIMEOUT = 'Test timeout (seconds).'
 
 TEST_ID = 'Test id, the name of the test deployment.'
 
+PARALLEL = 'How many blueprint tests to run at a time. With more than one, ' \
+           'a failed test doesn\'t stop the others, and a summary of all ' \
+           'tests is printed at the end.'
+
+REPORT_DIR = 'A directory to write a JSON and a JUnit XML report of the ' \
+             'test phase timings to, one per test id.'
+
+POOL_SIZE = 'How many installed deployments to keep warm for each blueprint ' \
+            'and inputs, instead of uninstalling them. A later test of the ' \
+            'same blueprint and inputs only runs its nested tests on a ' \
+            'warm deployment. 0 disables the pool.'
+
+POOL_MAX_AGE = 'How many seconds to keep a deployment in the pool before ' \
+               'uninstalling it.'
+
+GROUP_INPUTS = 'An inputs file for a member of a deployment group. With ' \
+               'this option, every blueprint is uploaded once and ' \
+               'installed on a deployment group with a deployment for ' \
+               'every inputs file, and a pass/fail summary of the members ' \
+               'is printed. --inputs are used by all the members. Nested ' \
+               'tests, --parallel, --pool-size and the result cache are ' \
+               'not used. Needs the manager REST service. (Can be ' \
+               'provided multiple times)'
+
+CLEANUP_WORKERS = 'How many uninstalls and failure handlings to run at a ' \
+                  'time in the background, while the next tests run. The ' \
+                  'command waits for them before it exits. With 0 they run ' \
+                  'in place.'
+
+SNAPSHOT = 'Save the prepared manager container as a local image, tagged by ' \
+           'a fingerprint of its base image, yum packages, plugins bundle ' \
+           'and plugins. When such an image exists, the manager is ' \
+           'restarted from it and only the license and secrets are ' \
+           'applied.'
+
+NO_CACHE = 'Run every test, also tests that passed before with the same ' \
+           'blueprint directory, inputs, nested tests, manager version and ' \
+           'manager plugins.'
+
 NESTED_TEST = 'Nested tests, will run by pytest, should be specified in the ' \
               'pytest notation like: path/to/module.py::TestClass::test_method'
 
@@ -0,0 +1,181 @@
+########
+# Copyright (c) 2014-2022 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import hashlib
+from io import BytesIO
+from tempfile import mkdtemp
+
+from mock import patch, Mock
+from testtools import TestCase
+
+from ....dorkl.readiness import not_ready
+from ....dorkl.exceptions import (EcosystemCommandError,
+                                  EcosystemTestException)
+from ...commands.create_manager import docker
+from ...commands.create_manager.docker import download_and_load_docker_image
+from ...commands.create_manager.image_cache import (ImageDownload,
+                                                    ImageCacheEntry)
+
+ARCHIVE = os.urandom(3 * 1024 * 1024 + 17)
+CHUNK = 1024 * 1024
+URL = 'cloudify/6.4.1/ga-release/cloudify-manager-aio-docker.tar'
+
+
+class FakeImageSource(object):
+
+    errors = (IOError,)
+
+    def __init__(self, data=ARCHIVE, etag='etag1', break_at=None):
+        self.url = URL
+        self.data = data
+        self.etag = etag
+        self.size = len(data)
+        self.md5 = hashlib.md5(data).hexdigest()
+        self.ranges = True
+        self.break_at = break_at
+        self.offsets = []
+
+    def describe(self):
+        pass
+
+    def chunks(self, offset=0):
+        self.offsets.append(offset)
+        for start in range(offset, self.size, CHUNK):
+            if self.break_at is not None and start >= self.break_at:
+                self.break_at = None
+                raise IOError('Connection reset by peer')
+            yield self.data[start:start + CHUNK]
+
+
+class ImageCacheTest(TestCase):
+
+    def setUp(self):
+        super(ImageCacheTest, self).setUp()
+        self.cache_dir = mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir)
+
+    def read_all(self, source):
+        archive = ImageDownload(source, ImageCacheEntry(URL, self.cache_dir))
+        data = archive.read(100) + archive.read()
+        archive.finish()
+        return archive, data
+
+    def test_download_is_cached(self):
+        archive, data = self.read_all(FakeImageSource())
+        self.assertEqual(data, ARCHIVE)
+        self.assertFalse(archive.cached)
+        source = FakeImageSource()
+        archive, data = self.read_all(source)
+        self.assertEqual(data, ARCHIVE)
+        self.assertTrue(archive.cached)
+        self.assertEqual(source.offsets, [])
+
+    def test_changed_object_is_downloaded_again(self):
+        self.read_all(FakeImageSource())
+        source = FakeImageSource(data=ARCHIVE[::-1], etag='etag2')
+        archive, data = self.read_all(source)
+        self.assertEqual(data, ARCHIVE[::-1])
+        self.assertFalse(archive.cached)
+        self.assertEqual(source.offsets, [0])
+
+    def test_partial_download_is_resumed(self):
+        source = FakeImageSource()
+        entry = ImageCacheEntry(URL, self.cache_dir)
+        entry.start(source)
+        with open(entry.part_path, 'wb') as part:
+            part.write(ARCHIVE[:CHUNK])
+        archive, data = self.read_all(source)
+        self.assertEqual(data, ARCHIVE)
+        self.assertEqual(source.offsets, [CHUNK])
+        self.assertTrue(entry.complete(source))
+
+    def test_broken_connection_is_resumed(self):
+        source = FakeImageSource(break_at=2 * CHUNK)
+        archive, data = self.read_all(source)
+        self.assertEqual(data, ARCHIVE)
+        self.assertEqual(source.offsets, [0, 2 * CHUNK])
+
+    def test_checksum_mismatch(self):
+        source = FakeImageSource()
+        source.md5 = hashlib.md5(b'other').hexdigest()
+        entry = ImageCacheEntry(URL, self.cache_dir)
+        archive = ImageDownload(source, entry)
+        archive.read()
+        self.assertRaisesRegex(EcosystemTestException,
+                               'expected checksum',
+                               archive.finish)
+        self.assertFalse(os.path.exists(entry.part_path))
+        self.assertFalse(os.path.exists(entry.metadata_path))
+
+    @patch('ecosystem_tests.ecosystem_tests_cli.commands.create_manager'
+           '.docker.image_cache_enabled', return_value=False)
+    @patch('ecosystem_tests.ecosystem_tests_cli.commands.create_manager'
+           '.docker.image_source')
+    @patch('ecosystem_tests.ecosystem_tests_cli.commands.create_manager'
+           '.docker.handle_process')
+    def test_stream_into_docker_load(self,
+                                     mock_handle_process,
+                                     mock_image_source,
+                                     _):
+        stdin = BytesIO()
+
+        def docker_load(command, timeout, stdin_writer):
+            stdin_writer(stdin)
+            return 'Loaded image: cloudify-manager-aio:latest'
+
+        mock_handle_process.side_effect = docker_load
+        mock_image_source.return_value = FakeImageSource()
+        self.assertEqual(download_and_load_docker_image(URL),
+                         'cloudify-manager-aio:latest')
+        self.assertEqual(stdin.getvalue(), ARCHIVE)
+        mock_image_source.assert_called_once_with(URL)
+
+
+class StartContainerTest(TestCase):
+
+    @patch('ecosystem_tests.ecosystem_tests_cli.commands.create_manager'
+           '.docker.docker_transport', return_value='cli')
+    def test_waits_for_starter_with_the_manager(self, _):
+        steps = Mock()
+        with patch.object(docker, 'docker_run', steps.docker_run), \
+                patch.object(docker, 'docker_exec', steps.docker_exec), \
+                patch.object(docker, 'wait_for_manager',
+                             steps.wait_for_manager), \
+                patch.object(docker, 'starter_status') as starter_status:
+            docker.start_container('manager', 'image:latest')
+            self.assertEqual([c[0] for c in steps.mock_calls],
+                             ['docker_run', 'wait_for_manager'])
+            starter_probe = steps.wait_for_manager.call_args[1]['probes'][0]
+            starter_probe()
+        starter_status.assert_called_once_with('manager')
+
+    @patch('ecosystem_tests.ecosystem_tests_cli.commands.create_manager'
+           '.docker.docker_transport', return_value='cli')
+    @patch('ecosystem_tests.ecosystem_tests_cli.commands.create_manager'
+           '.docker.handle_process')
+    def test_starter_status(self, mock_handle_process, _):
+        mock_handle_process.return_value = \
+            'starter    RUNNING   pid 42, uptime 0:00:10'
+        self.assertEqual(not_ready(docker.starter_status('manager')),
+                         ['starter'])
+        mock_handle_process.assert_called_once_with(
+            'docker exec manager supervisorctl status starter', log=False)
+        mock_handle_process.side_effect = EcosystemCommandError(
+            'Command failed.', 3, 'starter    EXITED    Oct 18 08:00 PM')
+        self.assertRaisesRegex(EcosystemTestException,
+                               'starter is not running',
+                               docker.starter_status, 'manager')
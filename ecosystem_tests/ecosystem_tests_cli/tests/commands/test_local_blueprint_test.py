@@ -39,7 +39,9 @@ class LocalBlueprintTest(BaseCliCommandTest):
             'on_failure': ROLLBACK_PARTIAL,
             'uninstall_on_success': DEFAULT_UNINSTALL_ON_SUCCESS,
             'user_defined_check': None,
-            'user_defined_check_params': None
+            'user_defined_check_params': None,
+            'report_dir': None,
+            'deployment_pool': None
         }
 
     @patch('ecosystem_tests.ecosystem_tests_cli.utilities.id_generator')
@@ -65,7 +67,8 @@ class LocalBlueprintTest(BaseCliCommandTest):
     @patch('ecosystem_tests.dorkl.runners.is_first_invocation',
            return_value=True)
     @patch('ecosystem_tests.dorkl.runners.sleep')
-    @patch('ecosystem_tests.dorkl.runners.cloudify_exec')
+    @patch('ecosystem_tests.dorkl.runners.blueprints_list')
+    @patch('ecosystem_tests.dorkl.runners.deployments_list')
     @patch('ecosystem_tests.dorkl.runners.blueprints_upload')
     @patch('ecosystem_tests.dorkl.runners.deployments_create')
     @patch('ecosystem_tests.dorkl.runners.start_install_workflow')
@@ -142,3 +145,21 @@ def test_fn():
                                 '--blueprint-path', '/path/to/bp2.yaml',
                                 '--test-id', self.test_id],
                                catch_exceptions=False)
+
+    @patch('ecosystem_tests.ecosystem_tests_cli.utilities.id_generator',
+           side_effect=['test1', 'test2'])
+    @patch('ecosystem_tests.ecosystem_tests_cli.commands.local_blueprint_test'
+           '.basic_blueprint_test_dev')
+    def test_parallel_runs_all_tests(self, mock_basic_blueprint_test, _):
+        mock_basic_blueprint_test.side_effect = \
+            lambda **kwargs: kwargs['test_name'] == 'test1' and 1 / 0
+        res = self.runner.invoke(local_blueprint_test,
+                                 ['--blueprint-path', '/path/to/bp1.yaml',
+                                  '--blueprint-path', '/path/to/bp2.yaml',
+                                  '--parallel', '2'])
+        self.assertEqual(
+            sorted(c[1]['test_name']
+                   for c in mock_basic_blueprint_test.call_args_list),
+            ['test1', 'test2'])
+        self.assertIsInstance(res.exception, EcosystemTestCliException)
+        self.assertIn('Failed tests: test1', str(res.exception))
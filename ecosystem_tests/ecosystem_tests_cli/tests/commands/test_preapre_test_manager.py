@@ -15,11 +15,13 @@
 
 import base64
 from mock import patch
+from testtools import TestCase
 
 from . import ERROR_EXIT_CODE
 from ...exceptions import EcosystemTestCliException
 from ..commands import BaseCliCommandTest
 from ...commands.prepare_test_manager import prepare_test_manager
+from ...commands.create_manager.snapshot import prepared_manager_fingerprint
 
 DEMO_LICENCE = 'ZGVtbyBsaWNlbnNlCg=='
 
@@ -87,5 +89,75 @@ class PrepareTestManagerTest(BaseCliCommandTest):
         self.assertEqual(res.exit_code, ERROR_EXIT_CODE)
 
 
+PREPARE_TEST_MANAGER = \
+    'ecosystem_tests.ecosystem_tests_cli.commands.prepare_test_manager.'
+
+
+@patch(PREPARE_TEST_MANAGER + 'base_image_of', return_value='sha256:base')
+@patch(PREPARE_TEST_MANAGER + 'commit_prepared_manager')
+@patch(PREPARE_TEST_MANAGER + 'create_test_secrets')
+@patch(PREPARE_TEST_MANAGER + 'prepare_restored_test_dev')
+@patch(PREPARE_TEST_MANAGER + 'prepare_test_dev')
+class PrepareTestManagerSnapshotTest(BaseCliCommandTest):
+
+    def invoke(self):
+        self.runner.invoke(prepare_test_manager,
+                           ['--license', DEMO_LICENCE, '--snapshot',
+                            '-s', 'key1=value1', '--yum-package', 'git'],
+                           catch_exceptions=False)
+
+    @patch(PREPARE_TEST_MANAGER + 'restore_prepared_manager',
+           return_value=True)
+    def test_snapshot_skips_preparation(self,
+                                        mock_restore,
+                                        mock_prepare,
+                                        mock_prepare_restored,
+                                        _,
+                                        mock_commit,
+                                        *__):
+        self.invoke()
+        mock_prepare.assert_not_called()
+        mock_commit.assert_not_called()
+        mock_prepare_restored.assert_called_once_with(
+            secrets={'key1': False})
+
+    @patch(PREPARE_TEST_MANAGER + 'restore_prepared_manager',
+           return_value=False)
+    def test_prepared_manager_is_committed_without_secrets(
+            self,
+            mock_restore,
+            mock_prepare,
+            mock_prepare_restored,
+            mock_secrets,
+            mock_commit,
+            *_):
+        self.invoke()
+        mock_prepare.assert_called_once_with(plugins=[],
+                                             execute_bundle_upload=False,
+                                             bundle_path=None,
+                                             yum_packages=('git',))
+        fingerprint = mock_restore.call_args[0][1]
+        mock_commit.assert_called_once_with(
+            'cfy_manager', fingerprint, 'sha256:base')
+        mock_secrets.assert_called_once_with({'key1': False})
+        mock_prepare_restored.assert_not_called()
+
+
+class PreparedManagerFingerprintTest(TestCase):
+
+    def test_fingerprint_changes_with_the_preparation(self):
+        fingerprint = prepared_manager_fingerprint('base', ['git', 'vim'])
+        self.assertEqual(fingerprint,
+                         prepared_manager_fingerprint('base', ['vim', 'git']))
+        for other in [prepared_manager_fingerprint('other', ['git', 'vim']),
+                      prepared_manager_fingerprint('base', ['git']),
+                      prepared_manager_fingerprint(
+                          'base', ['git', 'vim'], bundle_path='bundle.tgz'),
+                      prepared_manager_fingerprint(
+                          'base', ['git', 'vim'],
+                          plugins=[('wagon_url', 'yaml_url')])]:
+            self.assertNotEqual(fingerprint, other)
+
+
 def _encode(string_to_encode):
     return base64.b64encode(string_to_encode.encode('utf-8')).decode('ascii')